@@ -42,14 +42,17 @@ setup(
     # Pick your license as you wish (should match "license" above)
     'License :: OSI Approved :: Apache Software License',
 
-    # Specify the Python versions you support here. In particular, ensure
-    # that you indicate whether you support Python 2, Python 3 or both.
-    'Programming Language :: Python :: 2.7',
+    # Specify the Python versions you support here. Templates are read with
+    # importlib.resources.files, new in 3.9.
     'Programming Language :: Python :: 3',
-    'Programming Language :: Python :: 3.2',
-    'Programming Language :: Python :: 3.3',
-    'Programming Language :: Python :: 3.4',
+    'Programming Language :: Python :: 3 :: Only',
+    'Programming Language :: Python :: 3.9',
+    'Programming Language :: Python :: 3.10',
+    'Programming Language :: Python :: 3.11',
+    'Programming Language :: Python :: 3.12',
     ],
+    python_requires='>=3.9',
     keywords='docker,microservices',
-    packages=find_packages(exclude=['tests'])
+    packages=find_packages(exclude=['tests']),
+    package_data={'toadie': ['templates/*']},
 )
@@ -0,0 +1,10 @@
+import pytest
+
+
+@pytest.fixture
+def project(tmpdir):
+    """An empty toadie project: docker-compose.yml, .env and dotenv.example."""
+    tmpdir.join('docker-compose.yml').write("version: '2'\nservices: {}\n")
+    tmpdir.join('.env').write('')
+    tmpdir.join('dotenv.example').write('')
+    return tmpdir
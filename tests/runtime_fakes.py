@@ -0,0 +1,99 @@
+"""Stand-ins for aio-pika deliveries and the runtime's Producer."""
+import asyncio
+
+
+class FakeMessage(object):
+    def __init__(self, tag, body=b'', headers=None, routing_key='c.IN', log=None):
+        self.delivery_tag = tag
+        self.body = body
+        self.headers = headers or dict()
+        self.routing_key = routing_key
+        self.exchange = 'cExchange'
+        self.log = log if log is not None else list()
+
+    async def ack(self, multiple=False):
+        self.log.append(('ack', self.delivery_tag, multiple))
+
+    async def nack(self, requeue=False):
+        self.log.append(('nack', self.delivery_tag, requeue))
+
+
+class FakePublisher(object):
+    def __init__(self, fail=False):
+        self.published = list()
+        self.fail = fail
+        self.flushes = 0
+
+    async def publish(self, exchange, routing_key, body, headers=None):
+        if self.fail:
+            raise ConnectionError("broker gone")
+        self.published.append((exchange, routing_key, bytes(body), dict(headers or {})))
+
+    async def flush(self):
+        self.flushes += 1
+
+
+def drain(consumer, messages, queue='cInQueue0'):
+    """Run one worker of CONSUMER over MESSAGES, then flush acks."""
+    async def main():
+        consumer.inbox = asyncio.Queue()
+        for message in messages:
+            await consumer.on_message(message, queue=queue)
+        worker = asyncio.ensure_future(consumer.worker())
+        while consumer.inbox.qsize():
+            await asyncio.sleep(0)
+        for _ in range(10):
+            await asyncio.sleep(0)
+        await consumer.flush()
+        worker.cancel()
+    asyncio.run(main())
+
+
+class FakeExchange(object):
+    def __init__(self, name, sent, fail=None):
+        self.name = name
+        self.sent = sent
+        self.fail = fail
+
+    async def publish(self, message, routing_key):
+        await asyncio.sleep(0)
+        if self.fail is not None and self.fail(routing_key):
+            raise ConnectionError("nacked")
+        self.sent.append((self.name, routing_key, message.body, dict(message.headers)))
+
+    async def bind(self, *args, **kwargs):
+        pass
+
+
+class FakeChannel(FakeExchange):
+    """A channel whose exchanges record every confirmed publish in SENT."""
+    def __init__(self, sent, fail=None):
+        super(FakeChannel, self).__init__(None, sent, fail)
+        self.declared = list()
+        self.closed = False
+
+    async def declare_exchange(self, name, kind, durable=True):
+        self.declared.append(('exchange', name))
+        return FakeExchange(name, self.sent, self.fail)
+
+    async def declare_queue(self, name, durable=True, arguments=None):
+        self.declared.append(('queue', name))
+        return self
+
+    async def get_exchange(self, name, ensure=False):
+        return FakeExchange(name, self.sent, self.fail)
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeConnection(object):
+    def __init__(self, fail=None):
+        self.sent = list()
+        self.fail = fail
+        self.channels = list()
+
+    async def channel(self, publisher_confirms=True):
+        channel = FakeChannel(self.sent, self.fail)
+        self.channels.append(channel)
+        return channel
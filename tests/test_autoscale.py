@@ -0,0 +1,92 @@
+import json
+
+from click.testing import CliRunner
+
+from toadie.commands.autoscale import autoscale
+from toadie.libs.autoscale import (
+    SOURCES, Autoscaler, BrokerSource, DryRunBackend, QueueStats, target_replicas)
+from toadie.libs.broker import InMemoryBroker
+
+POLICY = {'min': 1, 'max': 10, 'cooldown': 60, 'target_backlog': 100, 'busy': 0.9}
+
+
+def task(project, name, policy=None):
+    lines = ["{}:".format(name),
+             "  inqueues:",
+             "    - name: {}InQueue0".format(name),
+             "      exchange: {name: aExchange, type: topic}",
+             "      routing_key: {}.IN".format(name)]
+    if policy:
+        lines.append("  autoscale: {}".format(json.dumps(policy)))
+    project.join('tasks', name, 'promise.yml').write("\n".join(lines) + "\n", ensure=True)
+
+
+def test_target_replicas():
+    assert target_replicas(POLICY, 1, [QueueStats(250, 0, 1, None)]) == 3
+    assert target_replicas(POLICY, 1, [QueueStats(5000, 0, 1, None)]) == 10
+    assert target_replicas(POLICY, 2, [QueueStats(50, 0, 2, 0.95)]) == 3
+    assert target_replicas(POLICY, 4, [QueueStats(0, 3, 4, None)]) == 4
+    assert target_replicas(POLICY, 4, [QueueStats(0, 0, 4, None)]) == 3
+    assert target_replicas(POLICY, 1, [QueueStats(0, 0, 1, None)]) == 1
+
+
+def test_scales_up_at_once_and_down_after_cooldown(project):
+    task(project, 'crunch', {'cooldown': 30})
+    broker = InMemoryBroker()
+    broker.declare_queue('crunchInQueue0')
+    broker.queues['crunchInQueue0'].extend([None] * 300)
+    backend = DryRunBackend()
+    scaler = Autoscaler(str(project), BrokerSource(broker), backend)
+
+    assert scaler.step(now=100) == [('crunch', 1, 3, True)]
+    broker.queues['crunchInQueue0'].clear()
+    assert scaler.step(now=110) == [('crunch', 3, 2, False)]
+    assert scaler.step(now=131) == [('crunch', 3, 2, True)]
+    assert backend.applied == [('crunch', 3), ('crunch', 2)]
+
+    # The last change survives restarts.
+    again = Autoscaler(str(project), BrokerSource(broker), DryRunBackend(replicas={'crunch': 2}))
+    assert again.step(now=140) == [('crunch', 2, 1, False)]
+
+
+def test_only_tasks_and_autoscaled_components(project):
+    task(project, 'crunch')
+    project.join('services', 'web', 'promise.yml').write(
+        "web:\n  inqueues:\n    - name: webInQueue0\n"
+        "      exchange: {name: aExchange, type: topic}\n", ensure=True)
+    scaler = Autoscaler(str(project), BrokerSource(InMemoryBroker()), DryRunBackend())
+    assert [d[0] for d in scaler.step(now=0)] == ['crunch']
+    scaler = Autoscaler(str(project), BrokerSource(InMemoryBroker()), DryRunBackend(), only='web')
+    assert scaler.step(now=0) == []
+
+
+def test_memory_source_reads_queue_depths(project):
+    task(project, 'crunch')
+    project.join('.toadie', 'queue-depths.json').write(
+        json.dumps({'crunchInQueue0': 250}), ensure=True)
+    source = SOURCES['memory'](str(project))
+    assert source.stats('crunchInQueue0') == QueueStats(250, 0, 0, None)
+    assert source.stats('otherQueue') == QueueStats(0, 0, 0, None)
+
+
+def test_memory_source_from_the_command_line(project):
+    task(project, 'crunch')
+    project.join('.toadie', 'queue-depths.json').write(
+        json.dumps({'crunchInQueue0': 250}), ensure=True)
+    with project.as_cwd():
+        result = CliRunner().invoke(
+            autoscale, ['--once', '--source', 'memory', '--backend', 'dry-run'])
+    assert result.exit_code == 0, result.output
+    assert result.output == "crunch: scaled 1 -> 3\n"
+    assert not project.join('.toadie', 'autoscale.json').check()
+
+
+def test_unrecorded_steps_leave_no_state(project):
+    task(project, 'crunch')
+    broker = InMemoryBroker()
+    broker.declare_queue('crunchInQueue0')
+    broker.queues['crunchInQueue0'].extend([None] * 300)
+    scaler = Autoscaler(str(project), BrokerSource(broker), DryRunBackend(), record=False)
+    assert scaler.step(now=100) == [('crunch', 1, 3, True)]
+    assert scaler.state == {}
+    assert not project.join('.toadie', 'autoscale.json').check()
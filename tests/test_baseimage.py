@@ -0,0 +1,85 @@
+from toadie.libs.baseimage import ProjectBaseImage, project_slug
+from toadie.libs.components import StackComponent
+
+
+def component(project, name, requirements, base='alpine', component_type='service'):
+    component = StackComponent(name, component_type, str(project), 'toadie', base=base)
+    component.define_dockerfile()
+    component.define_requirments(requirements)
+    return project.join(component_type + 's', name)
+
+
+def test_project_slug(tmpdir):
+    path = tmpdir.mkdir('My Stack')
+    assert project_slug(str(path)) == 'my-stack'
+
+
+def test_common_requirements_go_into_the_base(project):
+    a = component(project, 'a', ['requests', 'numpy'])
+    b = component(project, 'b', ['numpy'], component_type='task')
+    base = ProjectBaseImage(str(project))
+    assert base.generate() == {'alpine': ['aio-pika', 'PyYAML', 'numpy']}
+    assert base.exists('alpine')
+    assert project.join('base', 'alpine', 'requirements.txt').read() == \
+        "aio-pika\nPyYAML\nnumpy\n"
+    assert 'FROM python:alpine' in project.join('base', 'alpine', 'Dockerfile').read()
+    for component_dir in [a, b]:
+        assert component_dir.join('Dockerfile').read().startswith(
+            'FROM {}\n'.format(base.image('alpine')))
+    assert a.join('requirements.txt').read() == "requests\n"
+    assert b.join('requirements.txt').read() == ""
+
+
+def test_one_base_per_flavour(project):
+    component(project, 'a', [], base='slim')
+    component(project, 'b', [])
+    base = ProjectBaseImage(str(project))
+    assert sorted(base.generate()) == ['alpine', 'slim']
+    contents = project.join('services', 'a', 'Dockerfile').read()
+    assert 'FROM {} AS wheels'.format(base.image('slim')) in contents
+    assert '\nFROM {}\n'.format(base.image('slim')) in contents
+
+
+def test_new_components_inherit_an_existing_base(project):
+    component(project, 'a', [])
+    base = ProjectBaseImage(str(project))
+    base.generate()
+    b = component(project, 'b', ['numpy'])
+    assert b.join('Dockerfile').read().startswith('FROM {}\n'.format(base.image('alpine')))
+    assert b.join('requirements.txt').read() == "numpy\n"
+
+
+def test_regenerating_is_stable(project):
+    component(project, 'a', ['numpy'])
+    component(project, 'b', ['numpy'])
+    base = ProjectBaseImage(str(project))
+    first = base.generate()
+    assert base.generate() == first
+    assert project.join('services', 'a', 'requirements.txt').read() == ""
+
+
+def test_requirements_leaving_the_base_return_to_components(project):
+    a = component(project, 'a', ['numpy'])
+    component(project, 'b', ['numpy'])
+    base = ProjectBaseImage(str(project))
+    base.generate()
+    # c, built from the stock image, does not need numpy: the base drops it.
+    c = component(project, 'c', [])
+    c.join('Dockerfile').write(c.join('Dockerfile').read().replace(
+        base.image('alpine'), 'python:alpine'))
+    c.join('requirements.txt').write("aio-pika\nPyYAML\n")
+    assert base.generate() == {'alpine': ['aio-pika', 'PyYAML']}
+    assert a.join('requirements.txt').read() == "numpy\n"
+
+
+def test_comments_are_kept(project):
+    a = component(project, 'a', [])
+    a.join('requirements.txt').write("# pinned for py3.5\naio-pika\nPyYAML\nnumpy  # fast\n")
+    component(project, 'b', [])
+    ProjectBaseImage(str(project)).generate()
+    assert a.join('requirements.txt').read() == "# pinned for py3.5\nnumpy  # fast\n"
+
+
+def test_components_install_without_upgrading_the_base():
+    from toadie.libs.templates import read_template
+    assert b'--upgrade' not in read_template('app.py')
@@ -0,0 +1,78 @@
+import asyncio
+import json
+
+import pytest
+
+from toadie.libs.bench import Bench, BenchError, percentile
+from toadie.libs.manifest import ManifestApplier, StackManifest
+
+
+@pytest.fixture
+def ingest(project):
+    project.join('stack.yml').write("components:\n  ingest: {}\n")
+    ManifestApplier(str(project)).apply(StackManifest.load(str(project.join('stack.yml'))))
+    return project
+
+
+def test_percentile():
+    ordered = list(range(1, 101))
+    assert percentile(ordered, 0.5) == 50
+    assert percentile(ordered, 0.99) == 99
+    assert percentile([7], 0.95) == 7
+    assert percentile([], 0.5) is None
+
+
+def test_unknown_component(project):
+    with pytest.raises(BenchError):
+        Bench(str(project), 'nope')
+
+
+def test_memory_bench_at_maximum_rate(ingest):
+    bench = Bench(str(ingest), 'ingest')
+    result = asyncio.run(bench.run(messages=200, timeout=5))
+    step, = result['steps']
+    assert step['completed'] == 200 and step['lost'] == 0
+    assert step['p50_ms'] <= step['p95_ms'] <= step['p99_ms']
+    assert result['saturation'] == step['throughput']
+    assert not ingest.join('logs').check()
+
+
+def test_ramp_doubles_the_rate(ingest):
+    steps = list()
+    result = asyncio.run(Bench(str(ingest), 'ingest').run(
+        rate=500, messages=20, ramp=2, timeout=5, on_step=steps.append))
+    assert [s['rate'] for s in result['steps']] == [500, 1000]
+    assert steps == result['steps']
+
+
+def test_results_are_saved_and_found_again(ingest):
+    bench = Bench(str(ingest), 'ingest')
+    assert bench.previous() is None
+    result = asyncio.run(bench.run(messages=10, timeout=5))
+    path = bench.save(result)
+    assert path.startswith(str(ingest.join('.toadie', 'bench')))
+    assert bench.previous()['saturation'] == result['saturation']
+    assert Bench(str(ingest), 'ingest', backend='amqp').previous() is None
+
+
+def test_results_of_other_components_and_runs_are_kept_apart(ingest):
+    bench = Bench(str(ingest), 'ingest')
+    ingest.join('.toadie', 'bench', 'ingest-bulk-memory-20990101T000000.000000.json').write(
+        json.dumps(dict(component='ingest-bulk', backend='memory', saturation=1.0)), ensure=True)
+    assert bench.previous() is None
+
+    paths = set()
+    for saturation in (10.0, 20.0):
+        paths.add(bench.save(dict(component='ingest', backend='memory',
+                                  saturation=saturation, steps=[])))
+    amqp = Bench(str(ingest), 'ingest', backend='amqp')
+    paths.add(amqp.save(dict(component='ingest', backend='amqp', saturation=5.0, steps=[])))
+    assert len(paths) == 3
+    assert bench.previous()['saturation'] == 20.0
+    assert amqp.previous()['saturation'] == 5.0
+
+
+def test_component_without_handler(ingest):
+    ingest.join('services', 'ingest', 'consume.py').write("x = 1\n")
+    with pytest.raises(BenchError):
+        asyncio.run(Bench(str(ingest), 'ingest').run(messages=1))
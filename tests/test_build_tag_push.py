@@ -0,0 +1,140 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from toadie.libs.compose import load_yaml
+from toadie.libs.templates import read_template
+
+
+FAKE_DOCKER = """#!/bin/sh
+echo "$(basename "$0") $*" >> "$TOADIE_TEST_CALLS"
+case "$1 $2" in
+  "image inspect") echo 1234 ;;
+esac
+if [ -n "$REMOVE_DOCKER_ON" ] && [ "$3 $4" = "build $REMOVE_DOCKER_ON" ]; then
+  rm "$(dirname "$0")/docker"
+fi
+if [ "$1" = push ] && [ -n "$FAIL_PUSH" ] && echo "$2" | grep -q "$FAIL_PUSH"; then
+  exit 1
+fi
+exit 0
+"""
+
+
+@pytest.fixture
+def stack(tmpdir):
+    """A project with two built services and fake docker binaries."""
+    bin_dir = tmpdir.mkdir('fakebin')
+    for name in ['docker', 'docker-compose']:
+        path = bin_dir.join(name)
+        path.write(FAKE_DOCKER)
+        path.chmod(0o755)
+    project = tmpdir.mkdir('demo')
+    project.join('docker-compose.yml').write(
+        "version: '2'\nservices:\n"
+        "  rabbitmq:\n    image: rabbitmq:management\n"
+        "  a:\n    build: ./services/a\n"
+        "  b:\n    build: ./services/b\n")
+    for name in ['a', 'b']:
+        project.join('services', name, 'Dockerfile').write('FROM python:slim\n', ensure=True)
+        project.join('services', name, 'consume.py').write('# {}\n'.format(name))
+    project.join('bin', 'build-tag-push.py').write_binary(
+        read_template('build-tag-push.py'), ensure=True)
+    return project
+
+
+def run(project, output='docker-compose-out.yml', **env):
+    calls = project.join('calls.log')
+    if calls.check():
+        calls.remove()
+    environ = dict(os.environ,
+                   PATH=str(project.dirpath('fakebin')) + os.pathsep + os.environ['PATH'],
+                   TOADIE_TEST_CALLS=str(calls),
+                   DOCKER_USER='u', DOCKER_PASSWORD='p', DOCKER_EMAIL='e',
+                   DOCKER_REGISTRY='registry.example', DOCKER_COMPOSE_YML=output,
+                   DOCKER_COMPOSE_INPUT='docker-compose.yml')
+    environ.update(env)
+    completed = subprocess.run(
+        [sys.executable, os.path.join('bin', 'build-tag-push.py')], cwd=str(project),
+        env=environ, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        universal_newlines=True)
+    lines = calls.read().splitlines() if calls.check() else []
+    return completed, lines
+
+
+def images(project, output='docker-compose-out.yml'):
+    with open(str(project.join(output))) as _:
+        services = load_yaml(_)['services']
+    return dict((name, s.get('image')) for name, s in services.items())
+
+
+def pushed(calls):
+    return sorted(c.split()[2].split('/')[1].split(':')[0]
+                  for c in calls if c.startswith('docker push'))
+
+
+def test_builds_and_pushes_every_service_first(stack):
+    completed, calls = run(stack)
+    assert completed.returncode == 0, completed.stdout
+    assert pushed(calls) == ['a', 'b']
+    assert images(stack)['a'].startswith('registry.example/a:')
+
+
+def test_unchanged_services_reuse_their_image(stack):
+    run(stack)
+    first = images(stack)
+    stack.join('services', 'b', 'consume.py').write('# changed\n')
+    completed, calls = run(stack)
+    assert completed.returncode == 0, completed.stdout
+    assert pushed(calls) == ['b']
+    assert images(stack)['a'] == first['a']
+
+
+def test_force_build_rebuilds_everything(stack):
+    run(stack)
+    completed, calls = run(stack, FORCE_BUILD='1')
+    assert pushed(calls) == ['a', 'b']
+
+
+def test_failed_push_aborts_compose_rewrite(stack):
+    completed, calls = run(stack, FAIL_PUSH='/b:', PUSH_RETRIES='1')
+    assert completed.returncode == 1
+    assert 'failed services: b' in completed.stdout
+    assert not stack.join('docker-compose-out.yml').check()
+    # The service that did push is recorded and not pushed again.
+    completed, calls = run(stack)
+    assert pushed(calls) == ['b']
+
+
+def test_unexpected_errors_keep_the_pushed_services(stack):
+    # docker disappears while b builds; a, built first, already pushed.
+    completed, calls = run(stack, BUILD_WORKERS='1', REMOVE_DOCKER_ON='b')
+    assert completed.returncode == 1
+    assert 'b failed' in completed.stdout
+    assert 'failed services: b' in completed.stdout
+    fake = stack.dirpath('fakebin', 'docker')
+    fake.write(FAKE_DOCKER)
+    fake.chmod(0o755)
+    completed, calls = run(stack)
+    assert pushed(calls) == ['b']
+
+
+def test_reports_timings(stack):
+    completed, calls = run(stack)
+    assert 'Build and push timings' in completed.stdout
+    assert '1234' in completed.stdout
+
+
+def test_blank_settings_use_defaults(stack):
+    completed, calls = run(stack, BUILD_WORKERS='__blank__', PUSH_RETRIES='',
+                           FORCE_BUILD='__blank__')
+    assert completed.returncode == 0, completed.stdout
+    assert pushed(calls) == ['a', 'b']
+
+
+def test_non_numeric_setting_is_an_error(stack):
+    completed, calls = run(stack, BUILD_WORKERS='many')
+    assert completed.returncode == 1
+    assert "BUILD_WORKERS must be a whole number, not 'many'" in completed.stdout
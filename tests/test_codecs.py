@@ -0,0 +1,95 @@
+import pytest
+
+from toadie.runtime.codecs import (
+    CODEC_HEADER, CODECS, COMPRESSION_HEADER, Codec, decode_body, encode_body, get_codec, register_codec)
+from toadie.runtime.promise import prepare_publish
+
+
+@pytest.mark.parametrize('format, obj', [
+    ('json', {'a': [1, 2.5, 'x']}),
+    ('msgpack', {'a': [1, 2.5, 'x'], 'b': b'\x00'}),
+])
+def test_round_trip(format, obj):
+    if format == 'msgpack':
+        pytest.importorskip('msgpack')
+    body, headers = encode_body(obj, format)
+    assert headers == {CODEC_HEADER: format}
+    assert decode_body(body, headers) == obj
+
+
+def test_text_has_no_headers_and_decodes_to_bytes():
+    body, headers = encode_body('héllo')
+    assert headers == {}
+    assert decode_body(body) == 'héllo'.encode('utf-8')
+
+
+def test_raw_buffers_decode_without_copies():
+    body, headers = encode_body([b'ab', bytearray(b'c'), memoryview(b'')], 'raw')
+    buffers = decode_body(body, headers)
+    assert [bytes(b) for b in buffers] == [b'ab', b'c', b'']
+    assert all(isinstance(b, memoryview) for b in buffers)
+    assert buffers[0].obj is body
+
+
+def test_raw_accepts_strings_and_single_buffers():
+    body, headers = encode_body('Hello, from cInQueue0', 'raw')
+    assert [bytes(b) for b in decode_body(body, headers)] == [b'Hello, from cInQueue0']
+    body, headers = encode_body(['a', b'b'], 'raw')
+    assert [bytes(b) for b in decode_body(body, headers)] == [b'a', b'b']
+
+
+def test_raw_rejects_non_buffers():
+    with pytest.raises(TypeError) as err:
+        encode_body([1], 'raw')
+    assert 'int' in str(err.value)
+
+
+def test_ndarray_decodes_zero_copy():
+    numpy = pytest.importorskip('numpy')
+    array = numpy.arange(12, dtype='<f8').reshape(3, 4)
+    body, headers = encode_body(array, 'ndarray')
+    decoded = decode_body(body, headers)
+    assert decoded.dtype == array.dtype and decoded.shape == (3, 4)
+    assert (decoded == array).all()
+    assert not decoded.flags.writeable
+    assert not decoded.flags.owndata
+
+
+def test_compression_is_opt_in():
+    obj = [b'x' * 100000]
+    body, headers = encode_body(obj, 'raw')
+    assert COMPRESSION_HEADER not in headers
+    body, headers = encode_body(obj, 'raw', threshold=1024)
+    assert headers[COMPRESSION_HEADER] == 'zlib'
+    assert len(body) < 1000
+    assert [bytes(b) for b in decode_body(body, headers)] == obj
+
+
+def test_outqueues_declare_compression():
+    promise = {'outqueues': [
+        {'name': 'plain', 'exchange': {'name': 'e'}, 'body': {'format': 'raw'}},
+        {'name': 'small', 'exchange': {'name': 'e'},
+         'body': {'format': 'raw', 'compress_above': 1024}},
+    ]}
+    obj = [b'x' * 100000]
+    assert COMPRESSION_HEADER not in prepare_publish(promise, 'plain', obj)[3]
+    assert prepare_publish(promise, 'small', obj)[3][COMPRESSION_HEADER] == 'zlib'
+
+
+def test_registry():
+    class Upper(Codec):
+        name = 'upper-test'
+
+        def encode(self, obj):
+            return obj.upper().encode('utf-8')
+
+        def decode(self, data):
+            return bytes(data).decode('utf-8')
+    register_codec(Upper())
+    try:
+        body, headers = encode_body('abc', 'upper-test')
+        assert decode_body(body, headers) == 'ABC'
+    finally:
+        del CODECS['upper-test']
+    with pytest.raises(ValueError):
+        get_codec('nope')
@@ -0,0 +1,68 @@
+import os
+
+from toadie.libs import compose
+from toadie.libs.compose import ComposeDocument, load_yaml
+from toadie.libs.components import StackComponent
+from toadie.libs.dotenv import Dotenv
+
+
+BASE = "version: '2'\nservices:\n  rabbitmq:\n    image: rabbitmq:management\n"
+
+
+def test_loads_once_and_flushes_once(tmpdir, monkeypatch):
+    tmpdir.join('docker-compose.yml').write(BASE)
+    loads = list()
+    real_load = compose.load_yaml
+    monkeypatch.setattr(compose, 'load_yaml', lambda s: loads.append(1) or real_load(s))
+
+    document = ComposeDocument(str(tmpdir))
+    for i in range(3):
+        document.set_service('s{}'.format(i), {'build': './services/s{}'.format(i)})
+    assert document.has_service('rabbitmq')
+    assert loads == [1]
+    assert 's0' not in tmpdir.join('docker-compose.yml').read()
+
+    assert document.flush() is True
+    assert document.flush() is False
+    with open(str(tmpdir.join('docker-compose.yml'))) as _:
+        data = load_yaml(_)
+    assert data['version'] == '2'
+    assert sorted(data['services']) == ['rabbitmq', 's0', 's1', 's2']
+
+
+def test_context_manager_skips_flush_on_error(tmpdir):
+    tmpdir.join('docker-compose.yml').write(BASE)
+    try:
+        with ComposeDocument(str(tmpdir)) as document:
+            document.set_service('s', {})
+            raise RuntimeError
+    except RuntimeError:
+        pass
+    assert tmpdir.join('docker-compose.yml').read() == BASE
+
+
+def test_atomic_write_leaves_no_temp_files(tmpdir):
+    tmpdir.join('docker-compose.yml').write(BASE)
+    with ComposeDocument(str(tmpdir)) as document:
+        document.remove_service('rabbitmq')
+    assert os.listdir(str(tmpdir)) == ['docker-compose.yml']
+
+
+def test_components_share_one_document(tmpdir):
+    tmpdir.join('docker-compose.yml').write("version: '2'\nservices: {}\n")
+    tmpdir.join('.env').write('')
+    document = ComposeDocument(str(tmpdir))
+    dotenv = Dotenv(str(tmpdir.join('.env')))
+    for name in ['a', 'b', 'logger']:
+        StackComponent(name, 'service', str(tmpdir), 'toadie',
+                       compose=document, dotenv=dotenv).update_docker_compose()
+    assert tmpdir.join('.env').read() == ''
+    document.flush()
+    dotenv.flush()
+    with open(str(tmpdir.join('docker-compose.yml'))) as _:
+        services = load_yaml(_)['services']
+    assert sorted(services) == ['a', 'b', 'logger', 'rabbitmq']
+    assert services['a']['build'] == './services/a'
+    assert services['logger']['volumes'] == ['./logs:/app/logs']
+    assert tmpdir.join('.env').read() == \
+        "RABBITMQ_DEFAULT_USER=__blank__\nRABBITMQ_DEFAULT_PASS=__blank__\n"
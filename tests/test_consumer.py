@@ -0,0 +1,130 @@
+import asyncio
+
+from toadie.runtime.consumer import AckBatcher, AdaptivePrefetch, Consumer, run
+from toadie.runtime.envelope import ENVELOPE_HEADER, pack
+
+from runtime_fakes import FakeMessage, FakePublisher, drain
+
+
+PROMISE = {
+    'inqueues': [{'name': 'cInQueue0',
+                  'exchange': {'name': 'cExchange', 'type': 'topic'},
+                  'bindings': {'topics': ['c.IN.#']}}],
+}
+
+
+def consumer(handler, promise=PROMISE, **options):
+    consumer = Consumer(handler, 'c', promise, url='amqp://test/', **options)
+    consumer.publisher = FakePublisher()
+    return consumer
+
+
+def test_multi_ack_stops_below_the_oldest_in_flight():
+    async def main():
+        log = list()
+        acks = AckBatcher(10)
+        messages = [FakeMessage(tag, log=log) for tag in (1, 2, 3, 4)]
+        generations = [acks.delivered(m) for m in messages]
+        acks.done(messages[0], generations[0])
+        acks.done(messages[1], generations[1])
+        acks.done(messages[3], generations[3])
+        assert await acks.flush() == 2
+        assert log == [('ack', 2, True)]
+        acks.done(messages[2], generations[2])
+        assert await acks.flush() == 2
+        assert log[-1] == ('ack', 4, True)
+        assert await acks.flush() == 0
+    asyncio.run(main())
+
+
+def test_done_reports_a_full_batch():
+    acks = AckBatcher(2)
+    first, second = FakeMessage(1), FakeMessage(2)
+    generation = acks.delivered(first)
+    acks.delivered(second)
+    assert acks.done(first, generation) is False
+    assert acks.done(second, generation) is True
+
+
+def test_completions_from_a_closed_channel_are_ignored():
+    async def main():
+        log = list()
+        acks = AckBatcher(10)
+        old = FakeMessage(5, log=log)
+        old_generation = acks.delivered(old)
+        acks.reset()
+        new = [FakeMessage(tag, log=log) for tag in (1, 2, 3, 4, 5, 6)]
+        generation = acks.delivered(new[0])
+        for message in new[1:]:
+            acks.delivered(message)
+        acks.done(new[0], generation)
+        # Old tag 5 must not be multi-acked on the new channel, where it
+        # would also ack new deliveries 2 to 4 still in flight.
+        assert acks.done(old, old_generation) is False
+        await acks.nack(old, requeue=True, generation=old_generation)
+        assert await acks.flush() == 1
+        assert log == [('ack', 1, True)]
+    asyncio.run(main())
+
+
+def test_prefetch_follows_handler_latency():
+    prefetch = AdaptivePrefetch(10, minimum=1, maximum=1000, overhead=0.1, alpha=1)
+    assert prefetch.value == 20
+    prefetch.observe(0.01)
+    assert prefetch.target() == 110
+    assert prefetch.update() is True and prefetch.value == 110
+    prefetch.observe(0.0105)
+    assert prefetch.update() is False
+    prefetch.observe(10)
+    assert prefetch.target() == 11
+    prefetch.observe(1e-9)
+    assert prefetch.target() == 1000
+
+
+def test_handles_and_acks_in_one_batch():
+    seen = list()
+    log = list()
+
+    async def handle(body, ctx):
+        seen.append(bytes(body))
+    c = consumer(handle)
+    drain(c, [FakeMessage(tag, b'm%d' % tag, log=log) for tag in (1, 2, 3)])
+    assert seen == [b'm1', b'm2', b'm3']
+    assert log == [('ack', 3, True)]
+
+
+def test_plain_function_handlers_run_in_a_thread():
+    seen = list()
+    c = consumer(lambda body, ctx: seen.append(bytes(body)))
+    drain(c, [FakeMessage(1, b'x')])
+    assert seen == [b'x']
+
+
+def test_envelopes_are_unpacked():
+    seen = list()
+
+    async def handle(body, ctx):
+        seen.append(bytes(body))
+    c = consumer(handle)
+    drain(c, [FakeMessage(1, pack([b'a', b'b']), headers={ENVELOPE_HEADER: 2})])
+    assert seen == [b'a', b'b']
+
+
+def test_failures_without_retry_policy_are_dropped():
+    log = list()
+
+    async def handle(body, ctx):
+        raise RuntimeError("boom")
+    c = consumer(handle)
+    drain(c, [FakeMessage(1, log=log)])
+    assert log == [('nack', 1, False)]
+
+
+def test_blank_log_level_falls_back_to_info(monkeypatch, tmpdir):
+    promise = tmpdir.join('promise.yml')
+    promise.write("c: {}\n")
+    monkeypatch.setenv('LOG_LEVEL', '__blank__')
+    started = list()
+    monkeypatch.setattr(Consumer, 'run', lambda self: started.append(self.component) or asyncio.sleep(0))
+    run(lambda body, ctx: None, promise_path=str(promise), url='amqp://test/')
+    assert started == ['c']
@@ -0,0 +1,91 @@
+import os
+
+import pytest
+
+from toadie.libs import dependencies
+from toadie.libs.dependencies import Tools, PROBE_TIMED_OUT
+
+
+OUTPUTS = {
+    'docker': 'Docker version 1.12.0, build 8eab29e',
+    'docker-compose': 'docker-compose version 1.8.0, build f3628c7',
+    'docker-machine': 'docker-machine version 0.8.0, build b85aac1',
+    'conda': 'conda 4.1.11',
+    'vboxmanage': '5.1.2r108956',
+}
+
+
+@pytest.fixture
+def tools(tmpdir, monkeypatch):
+    """Tools probing fake binaries in TMPDIR, answering from OUTPUTS."""
+    for name in OUTPUTS:
+        tmpdir.join(name).write('')
+    monkeypatch.setattr(dependencies, 'PROBE_CACHE', str(tmpdir.join('probes.json')))
+    monkeypatch.setattr(dependencies.shutil, 'which',
+                        lambda name: str(tmpdir.join(name)) if tmpdir.join(name).exists() else None)
+    tools = Tools()
+    tools.outputs = dict(OUTPUTS)
+    tools.calls = list()
+
+    def probe(path, flag, timeout=None):
+        name = os.path.basename(path)
+        tools.calls.append(name)
+        return tools.outputs[name]
+    monkeypatch.setattr(tools, 'probe', probe)
+    return tools
+
+
+def test_reports_versions(tools):
+    statuses = tools.check_tools()
+    assert statuses['docker']['version'] == '1.12.0'
+    assert statuses['conda']['status'] == 'ok'
+    assert statuses['conda']['cached'] is False
+
+
+def test_second_run_is_served_from_cache(tools):
+    tools.check_tools()
+    del tools.calls[:]
+    statuses = tools.check_tools()
+    assert tools.calls == []
+    assert statuses['docker']['cached'] is True
+    assert statuses['docker']['version'] == '1.12.0'
+
+
+def test_refresh_probes_again(tools):
+    tools.check_tools()
+    del tools.calls[:]
+    tools.check_tools(refresh=True)
+    assert sorted(tools.calls) == sorted(OUTPUTS)
+
+
+def test_missing_tool(tools, tmpdir):
+    tmpdir.join('vboxmanage').remove()
+    statuses = tools.check_tools()
+    assert statuses['vboxmanage']['status'] == 'missing'
+    assert statuses['vboxmanage']['path'] is None
+
+
+def test_outdated_tool(tools):
+    tools.outputs['conda'] = 'conda 3.0.0'
+    assert tools.check_tools()['conda']['status'] == 'outdated'
+
+
+def test_timeout_is_reported_and_not_cached(tools):
+    tools.outputs['conda'] = PROBE_TIMED_OUT
+    statuses = tools.check_tools()
+    assert statuses['conda']['status'] == 'timeout'
+    assert statuses['conda']['path'] is not None
+
+    tools.outputs['conda'] = OUTPUTS['conda']
+    del tools.calls[:]
+    statuses = tools.check_tools()
+    assert tools.calls == ['conda']
+    assert statuses['conda']['status'] == 'ok'
+
+
+def test_probe_times_out():
+    assert Tools().probe('sleep', '5', timeout=0.1) is PROBE_TIMED_OUT
+
+
+def test_probe_missing_binary():
+    assert Tools().probe('/nonexistent/toadie-tool', '-v') is None
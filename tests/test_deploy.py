@@ -0,0 +1,126 @@
+import pytest
+from click.testing import CliRunner
+
+from toadie.commands.deploy import deploy
+from toadie.libs.deploy import (
+    DeployError, Deployer, DryRunBackend, diff, fingerprint, latest_stack_file, rollout_waves)
+
+
+STACK = """version: '2'
+services:
+  rabbitmq:
+    image: rabbitmq:management
+  logger:
+    image: registry.example/logger:1
+    links: [rabbitmq]
+  errlogger:
+    image: registry.example/errlogger:1
+    links: [rabbitmq]
+  a:
+    image: registry.example/a:1
+    env_file: .env
+    links: ['rabbitmq:amqp', b]
+  b:
+    image: registry.example/b:1
+    depends_on: [rabbitmq]
+"""
+
+
+class FailingBackend(DryRunBackend):
+    def __init__(self, fail):
+        super(FailingBackend, self).__init__()
+        self.fail = fail
+
+    def deploy(self, service, stack_file):
+        if service in self.fail:
+            raise DeployError('boom')
+        super(FailingBackend, self).deploy(service, stack_file)
+
+
+def stack(project, contents=STACK, name='docker-compose-1.yml'):
+    project.join(name).write(contents)
+    return str(project.join(name))
+
+
+def test_fingerprint_hides_secrets(project):
+    project.join('.env').write("# a comment\nSECRET=hunter2\n")
+    printed = fingerprint({'image': 'x', 'env_file': '.env', 'links': ['db:alias']}, str(project))
+    assert printed['image'] == 'x' and printed['links'] == ['db']
+    assert 'hunter2' not in str(printed)
+
+    project.join('.env').write("SECRET=hunter2\n# changed comment\n")
+    assert fingerprint({'image': 'x', 'env_file': '.env'}, str(project))['env'] == printed['env']
+    project.join('.env').write("SECRET=other\n")
+    assert fingerprint({'image': 'x', 'env_file': '.env'}, str(project))['env'] != printed['env']
+
+
+def test_diff(project):
+    services = {'a': {'image': 'a:1'}, 'b': {'image': 'b:1', 'ports': ['80']}}
+    changed, removed, deployed = diff({}, services, str(project))
+    assert changed == {'a': ['new'], 'b': ['new']} and removed == []
+
+    deployed['gone'] = deployed['a']
+    services = {'a': {'image': 'a:2'}, 'b': {'image': 'b:1', 'ports': ['81']}}
+    changed, removed, _ = diff(deployed, services, str(project))
+    assert changed == {'a': ['image'], 'b': ['config']}
+    assert removed == ['gone']
+
+
+def test_rollout_waves():
+    services = {'rabbitmq': {}, 'logger': {}, 'errlogger': {},
+                'a': {'links': ['b']}, 'b': {}, 'c': {'depends_on': {'a': {}}}}
+    assert rollout_waves(services, list(services)) == [
+        ['rabbitmq'], ['errlogger', 'logger'], ['b'], ['a'], ['c']]
+    # Services not rolled out are not waited for.
+    assert rollout_waves(services, ['a', 'c']) == [['a'], ['c']]
+    with pytest.raises(DeployError, match='cycle: a, b'):
+        rollout_waves({'a': {'links': ['b']}, 'b': {'links': ['a']}}, ['a', 'b'])
+
+
+def test_latest_stack_file(project):
+    assert latest_stack_file(str(project)) == str(project.join('docker-compose.yml'))
+    stack(project, name='docker-compose-9.yml')
+    stack(project, name='docker-compose-10.yml')
+    assert latest_stack_file(str(project)) == str(project.join('docker-compose-10.yml'))
+
+
+def test_only_changes_are_rolled_out(project):
+    stack(project)
+    backend = DryRunBackend()
+    deployer = Deployer(str(project), backend)
+    assert deployer.plan()['waves'] == [['rabbitmq'], ['errlogger', 'logger'], ['b'], ['a']]
+    assert len(deployer.apply()) == 5
+    assert [step for step in backend.applied if step[1] == 'rabbitmq'] == [('deploy', 'rabbitmq')]
+
+    assert Deployer(str(project), DryRunBackend()).plan() == dict(waves=[], changes={}, removed=[])
+
+    stack(project, STACK.replace('b:1', 'b:2').replace(
+        "  logger:\n    image: registry.example/logger:1\n    links: [rabbitmq]\n", ""),
+        name='docker-compose-2.yml')
+    backend = DryRunBackend()
+    deployer = Deployer(str(project), backend)
+    assert deployer.plan() == dict(waves=[['b']], changes={'b': ['image']}, removed=['logger'])
+    deployer.apply()
+    assert backend.applied == [('deploy', 'b'), ('remove', 'logger')]
+    assert 'logger' not in Deployer(str(project), DryRunBackend()).deployed
+
+
+def test_a_failed_deploy_resumes(project):
+    stack(project)
+    with pytest.raises(DeployError, match=r'Failed: b \(boom\)'):
+        Deployer(str(project), FailingBackend(['b'])).apply()
+    deployer = Deployer(str(project), DryRunBackend())
+    assert deployer.plan()['waves'] == [['b'], ['a']]
+
+
+def test_dry_run_command_records_nothing(project):
+    stack(project)
+    with project.as_cwd():
+        result = CliRunner().invoke(deploy, ['--backend', 'dry-run', '--plan'])
+        assert result.exit_code == 0, result.output
+        assert result.output.splitlines()[:3] == [
+            'Deploying docker-compose-1.yml', 'Wave 1:', '    rabbitmq: new']
+        result = CliRunner().invoke(deploy, ['--backend', 'dry-run'])
+        assert result.exit_code == 0, result.output
+        assert result.output.endswith("Rolled out 5 services.\n")
+    assert not project.join('.toadie', 'deployed.json').check()
@@ -0,0 +1,23 @@
+from toadie.libs.components import StackComponent
+
+
+def dockerfile(project, name, **kwargs):
+    component = StackComponent(name, 'service', str(project), 'toadie', **kwargs)
+    component.define_dockerfile()
+    return project.join('services', name, 'Dockerfile').read()
+
+
+def test_alpine_is_the_default(project):
+    contents = dockerfile(project, 'ingest')
+    assert contents.startswith('FROM python:alpine\n')
+    assert '{{' not in contents
+
+
+def test_slim_is_multi_stage_with_a_project_wheelhouse(project):
+    contents = dockerfile(project, 'ingest', base='slim')
+    slug = project.basename.lower()
+    assert 'FROM python:slim AS wheels' in contents
+    assert '\nFROM python:slim\n' in contents
+    assert 'id={}-wheelhouse,'.format(slug) in contents
+    assert '--no-index --find-links /wheels' in contents
+    assert '{{' not in contents
@@ -0,0 +1,90 @@
+import os
+
+from toadie.libs import envindex
+from toadie.libs.envindex import EnvVarIndex, scan_file
+from toadie.libs.dotenv import Dotenv
+from toadie.libs.templates import read_template
+
+
+def write(tmpdir, rel_path, contents):
+    path = tmpdir.join(rel_path)
+    path.dirpath().ensure(dir=True)
+    path.write(contents)
+    return path
+
+
+def test_scan_file_finds_variables(tmpdir):
+    path = write(tmpdir, 'a.py', "os.environ.get('B')\nos.environ.get(\"A\", 'x')\n")
+    assert scan_file(str(path)) == ['A', 'B']
+
+
+def test_union_of_every_file(tmpdir):
+    write(tmpdir, 'one/consume.py', "os.environ.get('ONE')")
+    write(tmpdir, 'two/consume.py', "os.environ.get('TWO')")
+    assert EnvVarIndex(str(tmpdir)).update() == {'ONE', 'TWO'}
+
+
+def test_ignores_non_python_and_ignored_paths(tmpdir):
+    write(tmpdir, 'notes.txt', "os.environ.get('TXT')")
+    write(tmpdir, '.git/hooks/x.py', "os.environ.get('GIT')")
+    write(tmpdir, 'build/x.py', "os.environ.get('BUILD')")
+    write(tmpdir, 'secret.py', "os.environ.get('SECRET')")
+    write(tmpdir, 'app.py', "os.environ.get('APP')")
+    write(tmpdir, '.gitignore', "build/\n# comment\nsecret.py\n")
+    assert EnvVarIndex(str(tmpdir)).update() == {'APP'}
+
+
+def test_rescans_only_changed_files(tmpdir, monkeypatch):
+    write(tmpdir, 'a.py', "os.environ.get('A')")
+    b = write(tmpdir, 'b.py', "os.environ.get('B')")
+    EnvVarIndex(str(tmpdir)).update()
+
+    scanned = list()
+    real_scan = EnvVarIndex.scan
+    monkeypatch.setattr(EnvVarIndex, 'scan',
+                        lambda self, paths: scanned.extend(paths) or real_scan(self, paths))
+    b.write("os.environ.get('B2')")
+    os.utime(str(b), ns=(1, 1))
+    assert EnvVarIndex(str(tmpdir)).update() == {'A', 'B2'}
+    assert scanned == ['b.py']
+
+
+def test_deleted_file_drops_its_variables(tmpdir):
+    write(tmpdir, 'a.py', "os.environ.get('A')")
+    b = write(tmpdir, 'b.py', "os.environ.get('B')")
+    EnvVarIndex(str(tmpdir)).update()
+    b.remove()
+    assert EnvVarIndex(str(tmpdir)).update() == {'A'}
+
+
+def test_process_pool_scan(tmpdir, monkeypatch):
+    monkeypatch.setattr(envindex, 'PARALLEL_THRESHOLD', 2)
+    for i in range(4):
+        write(tmpdir, 'm{}.py'.format(i), "os.environ.get('V{}')".format(i))
+    assert EnvVarIndex(str(tmpdir), workers=2).update() == {'V0', 'V1', 'V2', 'V3'}
+
+
+def test_dotenv_batches_additions(tmpdir):
+    path = tmpdir.join('.env')
+    path.write("A=1\n# B=2\nC=3")
+    dotenv = Dotenv(str(path))
+    assert dotenv.keys == {'A', 'C'}
+    assert dotenv.add('A') is False
+    assert dotenv.add('B', '__blank__') is True
+    assert dotenv.add('D') is True
+    assert dotenv.flush() == ['B', 'D']
+    assert path.read() == "A=1\n# B=2\nC=3\nB=__blank__\nD=\n"
+    assert dotenv.flush() == []
+
+
+def test_skips_the_vendored_runtime_and_toadie_settings(tmpdir):
+    write(tmpdir, 'services/c/toadie_runtime/promise.py', "os.environ.get('AMQP_URL')")
+    for name in ['consume-logger.py', 'consume-errlogger.py']:
+        write(tmpdir, 'services/{}/consume.py'.format(name[8:-3]),
+              read_template(name).decode('utf-8'))
+    write(tmpdir, 'bin/build-tag-push.py', read_template('build-tag-push.py').decode('utf-8'))
+    # As copied by toadie 0.1.
+    write(tmpdir, 'bin/old-build-tag-push.py',
+          "os.environ.get('DOCKER_USER')\nos.environ.get(\"DOCKER_COMPOSE_YML\", \"x.yml\")")
+    assert EnvVarIndex(str(tmpdir)).update() == {
+        'DOCKER_USER', 'DOCKER_PASSWORD', 'DOCKER_EMAIL', 'DOCKER_REGISTRY'}
@@ -0,0 +1,137 @@
+import os
+
+import pytest
+
+from toadie.libs import environments
+from toadie.libs.environments import (
+    conda_envs, conda_template, create_conda, create_environments, create_machine, env_name)
+
+
+FAKE_CONDA = """#!/bin/sh
+echo "conda $*" >> "$TOADIE_TEST_CALLS"
+case "$1 $2" in
+  "env list")
+    printf '{"envs": ['
+    sep=''
+    for name in $(cat "$TOADIE_TEST_ENVS"); do printf '%s"/opt/conda/envs/%s"' "$sep" "$name"; sep=', '; done
+    printf ']}\\n' ;;
+  "list --explicit") printf '@EXPLICIT\\nhttps://repo.example/python-3.5.tar.bz2\\n' ;;
+  "create -y")
+    [ -n "$FAIL_CREATE" ] && { echo "solving failed"; exit 1; }
+    echo "created $4"
+    echo "$4" >> "$TOADIE_TEST_ENVS" ;;
+esac
+"""
+
+FAKE_MACHINE = """#!/bin/sh
+echo "docker-machine $*" >> "$TOADIE_TEST_CALLS"
+case "$1" in
+  ls) cat "$TOADIE_TEST_MACHINES" ;;
+  create) echo "$4" >> "$TOADIE_TEST_MACHINES" ;;
+esac
+"""
+
+
+@pytest.fixture
+def tools(tmpdir, monkeypatch):
+    """Fake conda and docker-machine on PATH, and a scratch home directory."""
+    bin_dir = tmpdir.mkdir('fakebin')
+    for name, script in (('conda', FAKE_CONDA), ('docker-machine', FAKE_MACHINE)):
+        path = bin_dir.join(name)
+        path.write(script)
+        path.chmod(0o755)
+    tmpdir.join('envs').write('')
+    tmpdir.join('machines').write('')
+    monkeypatch.setenv('PATH', str(bin_dir) + os.pathsep + os.environ['PATH'])
+    monkeypatch.setenv('HOME', str(tmpdir.mkdir('home')))
+    monkeypatch.setenv('TOADIE_TEST_CALLS', str(tmpdir.join('calls.log')))
+    monkeypatch.setenv('TOADIE_TEST_ENVS', str(tmpdir.join('envs')))
+    monkeypatch.setenv('TOADIE_TEST_MACHINES', str(tmpdir.join('machines')))
+    monkeypatch.delenv('FAIL_CREATE', raising=False)
+    conda_envs.cache_clear()
+    environments.machines.cache_clear()
+    yield tmpdir
+    conda_envs.cache_clear()
+    environments.machines.cache_clear()
+
+
+def calls(tools):
+    log = tools.join('calls.log')
+    lines = log.read().splitlines() if log.check() else []
+    if log.check():
+        log.remove()
+    return lines
+
+
+def test_env_name():
+    assert env_name('my project_name') == 'my-project-name'
+
+
+def test_listings_are_looked_up_once(tools):
+    tools.join('envs').write('base\nfoobar\n')
+    assert conda_envs() == {'base', 'foobar'}
+    assert conda_envs() == {'base', 'foobar'}
+    assert calls(tools) == ['conda env list --json']
+
+
+def test_template_is_pinned_by_a_lockfile(tools):
+    name = conda_template()
+    assert name.startswith('toadie-template-')
+    lockfile = tools.join('home', '.toadie', 'conda', name + '.lock')
+    assert lockfile.read().startswith('@EXPLICIT')
+    assert 'conda create -y -n {} python=3.5'.format(name) in calls(tools)
+
+    assert conda_template() == name
+    assert calls(tools) == ['conda env list --json']
+
+    # Once the template env is gone, it is created again without solving.
+    tools.join('envs').write('')
+    conda_envs.cache_clear()
+    conda_template()
+    assert 'conda create -y -n {} --file {}'.format(name, lockfile) in calls(tools)
+
+
+def test_create_conda_clones_the_template(tools, capsys):
+    assert create_conda('my project')
+    template = conda_template()
+    assert 'conda create -y -n my-project --clone {} --offline'.format(template) in calls(tools)
+    out = capsys.readouterr().out
+    assert '[conda] created my-project' in out
+    assert '[conda] Conda env `my-project` created.' in out
+
+    # foobar is not foo.
+    tools.join('envs').write('foobar\n')
+    conda_envs.cache_clear()
+    assert create_conda('foo')
+    assert 'conda create -y -n foo --clone {} --offline'.format(template) in calls(tools)
+
+    assert create_conda('foo')
+    assert [c for c in calls(tools) if 'create' in c] == []
+    assert '[conda] Conda environment ready.' in capsys.readouterr().out
+
+
+def test_failures_are_reported(tools, monkeypatch, capsys):
+    monkeypatch.setenv('FAIL_CREATE', '1')
+    assert not create_conda('p')
+    assert '[conda] solving failed' in capsys.readouterr().out
+
+    monkeypatch.setenv('PATH', str(tools.join('home')))
+    conda_envs.cache_clear()
+    environments.machines.cache_clear()
+    assert not create_conda('p')
+    assert not create_machine('p')
+    out = capsys.readouterr().out
+    assert 'conda not found' in out and 'docker-machine not found' in out
+
+
+def test_create_environments_concurrently(tools, capsys):
+    tools.join('machines').write('other\n')
+    assert create_environments('demo') == (True, True)
+    lines = calls(tools)
+    assert 'docker-machine create --driver virtualbox demo' in lines
+    assert any(line.startswith('conda create -y -n demo --clone') for line in lines)
+    out = capsys.readouterr().out.splitlines()
+    assert all(line.startswith(('[conda] ', '[machine] ')) for line in out)
+
+    assert create_environments('demo') == (True, True)
+    assert [c for c in calls(tools) if 'create' in c] == []
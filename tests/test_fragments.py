@@ -0,0 +1,112 @@
+import os
+
+from click.testing import CliRunner
+
+from toadie.commands.split_compose import splitCompose
+from toadie.libs import compose
+from toadie.libs.compose import (
+    COMPOSE_INDEX, MERGED_FILE, ComposeFragments, compose_command, compose_files,
+    load_yaml, merged_compose, open_compose)
+
+
+BASE = ("version: '2'\nservices:\n"
+        "  rabbitmq:\n    image: rabbitmq:management\n"
+        "  a:\n    build: ./services/a\n"
+        "  b:\n    build:\n      context: ./tasks/b\n")
+
+
+def split(project):
+    project.join('docker-compose.yml').write(BASE)
+    project.join('Procfile').write("up: docker-compose up\nlogs: docker-compose logs -f\n")
+    project.join('.gitignore').write(".env\n")
+    with project.as_cwd():
+        result = CliRunner().invoke(splitCompose, [])
+    assert result.exit_code == 0, result.output
+    return result
+
+
+def services(path):
+    with open(str(path)) as _:
+        return load_yaml(_)['services']
+
+
+def test_split_compose(project):
+    assert split(project).output == "Moved 2 services into fragments.\n"
+    assert list(services(project.join('docker-compose.yml'))) == ['rabbitmq']
+    assert list(services(project.join('services', 'a', 'docker-compose.fragment.yml'))) == ['a']
+    assert list(services(project.join('tasks', 'b', 'docker-compose.fragment.yml'))) == ['b']
+    assert compose_files(str(project)) == [
+        'docker-compose.yml', 'services/a/docker-compose.fragment.yml',
+        'tasks/b/docker-compose.fragment.yml']
+    assert project.join('Procfile').read() == "up: toadie compose up\nlogs: toadie compose logs -f\n"
+    assert project.join('.gitignore').read() == ".env\n{}\n".format(MERGED_FILE)
+
+    with project.as_cwd():
+        result = CliRunner().invoke(splitCompose, [])
+    assert result.output == "Compose services are already split into fragments.\n"
+
+
+def test_compose_command(project):
+    assert compose_command(str(project)) == ['docker-compose']
+    split(project)
+    assert compose_command(str(project)) == [
+        'docker-compose', '-f', 'docker-compose.yml',
+        '-f', 'services/a/docker-compose.fragment.yml',
+        '-f', 'tasks/b/docker-compose.fragment.yml']
+
+
+def test_edits_touch_only_their_fragment(project, monkeypatch):
+    split(project)
+    loads = list()
+    real_load = compose.load_yaml
+    monkeypatch.setattr(compose, 'load_yaml', lambda s: loads.append(s.name) or real_load(s))
+    index = project.join(COMPOSE_INDEX).read()
+
+    fragments = open_compose(str(project))
+    assert isinstance(fragments, ComposeFragments)
+    assert fragments.has_service('b')
+    fragments.set_service('a', {'build': './services/a', 'environment': ['X=1']})
+    assert fragments.flush()
+    assert [os.path.basename(os.path.dirname(path)) for path in loads] == ['a']
+    assert services(project.join('services', 'a', 'docker-compose.fragment.yml'))['a']['environment'] == ['X=1']
+    assert project.join(COMPOSE_INDEX).read() == index
+
+
+def test_adding_and_removing_services(project):
+    split(project)
+    fragments = open_compose(str(project))
+    fragments.set_service('c', {'build': './services/c'})
+    fragments.set_service('redis', {'image': 'redis'})
+    fragments.remove_service('b')
+    fragments.flush()
+
+    assert not project.join('tasks', 'b', 'docker-compose.fragment.yml').check()
+    assert list(services(project.join('services', 'c', 'docker-compose.fragment.yml'))) == ['c']
+    assert sorted(services(project.join('docker-compose.yml'))) == ['rabbitmq', 'redis']
+    assert compose_files(str(project))[1:] == [
+        'services/a/docker-compose.fragment.yml', 'services/c/docker-compose.fragment.yml']
+    assert sorted(ComposeFragments(str(project)).services) == ['a', 'c', 'rabbitmq', 'redis']
+
+
+def test_merged_compose_is_rendered_when_stale(project):
+    project.join('docker-compose.yml').write(BASE)
+    assert merged_compose(str(project)) == str(project.join('docker-compose.yml'))
+
+    split(project)
+    path = merged_compose(str(project))
+    assert path == str(project.join(MERGED_FILE))
+    with open(path) as _:
+        merged = load_yaml(_)
+    assert merged['version'] == '2.0'
+    assert sorted(merged['services']) == ['a', 'b', 'rabbitmq']
+
+    project.join(MERGED_FILE).write('stale but current\n')
+    merged_compose(str(project))
+    assert project.join(MERGED_FILE).read() == 'stale but current\n'
+
+    fragment = project.join('services', 'a', 'docker-compose.fragment.yml')
+    stat = os.stat(str(fragment))
+    fragment.write(fragment.read().replace('./services/a', './services/a2'))
+    os.utime(str(fragment), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    with open(merged_compose(str(project))) as _:
+        assert load_yaml(_)['services']['a']['build'] == './services/a2'
@@ -0,0 +1,65 @@
+import logging
+
+from toadie.libs.components import StackComponent
+from toadie.runtime import logpolicy
+from toadie.runtime.logpolicy import DEFAULT_POLICY, BrokerLogHandler, LogPolicy, TokenBucket
+from toadie.runtime.promise import load_promise, queue_bindings
+
+
+def test_token_bucket_allows_bursts_then_the_rate(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(logpolicy.time, 'monotonic', lambda: now[0])
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket.take() for _ in range(4)] == [True, True, True, False]
+    now[0] = 0.5
+    assert [bucket.take() for _ in range(2)] == [True, False]
+
+
+def test_duplicates_are_counted_over_the_window(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(logpolicy.time, 'monotonic', lambda: now[0])
+    policy = LogPolicy({'dedupe_window': 10})
+    assert policy.admit('INFO', 'same') is True
+    assert policy.admit('INFO', 'same') is False
+    assert policy.admit('INFO', 'same') is False
+    assert policy.admit('INFO', 'other') is True
+    assert list(policy.expired()) == []
+    now[0] = 10
+    assert list(policy.expired()) == [('INFO', 'same', 2)]
+    assert policy.admit('INFO', 'same') is True
+
+
+def test_sampling_and_rate_limits_per_level():
+    policy = LogPolicy({'dedupe_window': 0, 'levels': {
+        'debug': {'sample': 0.0}, 'INFO': {'rate': 1, 'burst': 2}}})
+    assert not any(policy.admit('DEBUG', str(i)) for i in range(10))
+    assert [policy.admit('INFO', str(i)) for i in range(4)] == [True, True, False, False]
+    assert policy.admit('CRITICAL', 'x') is True
+    assert policy.drain_suppressed() == {'DEBUG': 10, 'INFO': 2}
+    assert policy.drain_suppressed() == {}
+
+
+def test_handler_routes_records_by_level():
+    handler = BrokerLogHandler('c', LogPolicy({'dedupe_window': 0}))
+    logger = logging.getLogger('toadie-test-logpolicy')
+    logger.propagate = False
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    try:
+        logger.info('hello')
+        logger.error('broken')
+        logging.getLogger('aio_pika.test').addHandler(handler)
+        logging.getLogger('aio_pika.test').error('quiet')
+    finally:
+        logger.removeHandler(handler)
+        logging.getLogger('aio_pika.test').removeHandler(handler)
+    keys = [key for key, line in handler.drain()]
+    assert keys == ['c.log.INFO', 'c.log.ERROR', 'c.ERROR']
+    assert handler.drain() == []
+
+
+def test_logqueues_bind_every_published_level(project):
+    StackComponent('a', 'service', str(project), 'toadie').define_promise_yml()
+    name, promise = load_promise(str(project.join('services', 'a', 'promise.yml')))
+    assert set(queue_bindings(promise['logqueue'])) == {
+        'a.log.{}'.format(level) for level in DEFAULT_POLICY['levels']}
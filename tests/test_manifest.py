@@ -0,0 +1,61 @@
+import pytest
+
+from toadie.libs.compose import load_yaml
+from toadie.libs.manifest import ManifestApplier, ManifestError, StackManifest
+
+
+def load_manifest(tmpdir, contents):
+    path = tmpdir.join('stack.yml')
+    path.write(contents)
+    return StackManifest.load(str(path))
+
+
+def services(project):
+    with open(str(project.join('docker-compose.yml'))) as _:
+        return load_yaml(_)['services']
+
+
+def test_defaults(tmpdir):
+    manifest = load_manifest(tmpdir, "components:\n  ingest:\n    requirements: [b, a]\n")
+    assert manifest.components == {
+        'ingest': {'type': 'service', 'interface': 'queue', 'requirements': ['a', 'b']}}
+
+
+@pytest.mark.parametrize('spec', [
+    "type: daemon", "interface: soap", "base: scratch", "format: xml", "interface: rest"])
+def test_rejects_invalid_specs(tmpdir, spec):
+    with pytest.raises(ManifestError):
+        load_manifest(tmpdir, "components:\n  ingest:\n    {}\n".format(spec))
+
+
+def test_apply_scaffolds_components_and_stack_services(project):
+    manifest = load_manifest(project, (
+        "components:\n"
+        "  ingest:\n    requirements: [requests]\n"
+        "  crunch:\n    type: task\n    format: json\n"))
+    applied = ManifestApplier(str(project), workers=2).apply(manifest)
+    assert applied == ['crunch', 'errlogger', 'ingest', 'logger']
+    assert sorted(services(project)) == ['crunch', 'errlogger', 'ingest', 'logger', 'rabbitmq']
+    assert services(project)['crunch']['build'] == './tasks/crunch'
+    for name in ['Dockerfile', 'promise.yml', 'consume.py', 'run.sh']:
+        assert project.join('services', 'ingest', name).check()
+    assert 'requests' in project.join('services', 'ingest', 'requirements.txt').read()
+    assert 'RABBITMQ_DEFAULT_USER=__blank__' in project.join('.env').read()
+
+
+def test_reapply_unchanged_manifest_is_a_noop(project):
+    manifest = load_manifest(project, "components:\n  ingest: {}\n")
+    ManifestApplier(str(project)).apply(manifest)
+    compose = project.join('docker-compose.yml').read()
+    assert ManifestApplier(str(project)).apply(manifest) == []
+    assert project.join('docker-compose.yml').read() == compose
+
+
+def test_changed_spec_keeps_hand_edited_files(project):
+    ManifestApplier(str(project)).apply(load_manifest(project, "components:\n  ingest: {}\n"))
+    consume = project.join('services', 'ingest', 'consume.py')
+    consume.write('# edited\n')
+    manifest = load_manifest(project, "components:\n  ingest:\n    requirements: [numpy]\n")
+    assert ManifestApplier(str(project)).apply(manifest) == ['ingest']
+    assert consume.read() == '# edited\n'
+    assert 'numpy' in project.join('services', 'ingest', 'requirements.txt').read()
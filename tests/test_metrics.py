@@ -0,0 +1,60 @@
+import time
+
+from toadie.runtime.metrics import (
+    PUBLISHED_HEADER, SECONDS_BUCKETS, Histogram, Metrics, MetricsSeries)
+
+
+def test_histogram_buckets_and_quantiles():
+    histogram = Histogram((1.0, 2.0, 4.0))
+    for value in (0.5, 1.5, 1.5, 3.0, 10.0):
+        histogram.observe(value)
+    assert histogram.counts == [1, 2, 1, 1]
+    assert histogram.total == 16.5
+    assert histogram.quantile(0.5) == 1.0 + (2.5 - 1) / 2
+    assert histogram.quantile(1.0) == 4.0
+    assert Histogram((1.0,)).quantile(0.5) is None
+
+
+def test_snapshot_resets_and_is_none_when_idle():
+    metrics = Metrics('c')
+    assert metrics.snapshot() is None
+    metrics.received(b'x' * 100, {PUBLISHED_HEADER: time.time() - 0.2})
+    metrics.handled(0.003)
+    metrics.handled(0.003, ok=False)
+    metrics.count('acked', 5)
+    snapshot = metrics.snapshot()
+    assert snapshot['component'] == 'c'
+    assert snapshot['counters'] == {'handled': 1, 'failed': 1, 'acked': 5}
+    counts, total = snapshot['histograms']['handler_seconds']
+    assert sum(counts) == 2 and len(counts) == len(SECONDS_BUCKETS) + 1
+    assert 0.2 <= snapshot['histograms']['wait_seconds'][1] < 1
+    assert snapshot['histograms']['size_bytes'][1] == 100
+    assert metrics.snapshot() is None
+
+
+def snapshot(component, at, handled, seconds=0.01):
+    metrics = Metrics(component)
+    for _ in range(handled):
+        metrics.handled(seconds)
+    result = metrics.snapshot()
+    result['time'] = at
+    return result
+
+
+def test_series_merges_snapshots_per_window():
+    series = MetricsSeries(window=10)
+    assert series.add(snapshot('a', 100, 10)) == []
+    assert series.add(snapshot('a', 105, 30)) == []
+    assert series.add(snapshot('b', 106, 5)) == []
+    points = series.add(snapshot('a', 111, 1))
+    assert [(p['component'], p['start']) for p in points] == [('a', 100), ('b', 100)]
+    a = points[0]
+    assert a['handled'] == 40
+    assert a['rate'] == 4.0
+    assert 0.005 < a['handler_p50'] <= 0.01
+    assert a['wait_p50'] is None
+    assert [p['start'] for p in series.close()] == [110]
+
+
+def test_series_ignores_snapshots_without_component():
+    assert MetricsSeries().add({'time': 1}) == []
@@ -0,0 +1,50 @@
+import yaml
+
+from toadie.libs.components import StackComponent
+from toadie.libs.migrations import (
+    migrate_log_exchange, outdated_log_exchanges, upgrade_log_exchange)
+from toadie.runtime.promise import load_promise
+
+
+def old_component(project, name):
+    """A component as toadie 0.1 generated it, with a direct logExchange."""
+    StackComponent(name, 'service', str(project), 'toadie').define_promise_yml()
+    path = project.join('services', name, 'promise.yml')
+    path.write("# kept\n" + path.read().replace(
+        'name: logExchange\n      type: topic', 'name: logExchange\n      type: direct'))
+    return path
+
+
+def test_new_components_declare_a_topic_log_exchange(project):
+    StackComponent('a', 'service', str(project), 'toadie').define_promise_yml()
+    assert outdated_log_exchanges(str(project)) == []
+
+
+def test_migrates_direct_log_exchanges(project):
+    path = old_component(project, 'a')
+    StackComponent('b', 'service', str(project), 'toadie').define_promise_yml()
+    assert 'type: direct' in path.read()
+    assert outdated_log_exchanges(str(project)) == ['a']
+
+    assert migrate_log_exchange(str(project)) == ['services/a/promise.yml']
+    assert path.read().startswith('# kept\n')
+    name, promise = load_promise(str(path))
+    assert promise['logqueue']['exchange'] == {'name': 'logExchange', 'type': 'topic'}
+    assert promise['errqueue']['exchange'] == {'name': 'logExchange', 'type': 'topic'}
+    assert outdated_log_exchanges(str(project)) == []
+    assert migrate_log_exchange(str(project)) == []
+
+
+def test_type_before_name_and_other_exchanges():
+    contents = ("    exchange:\n      type: direct\n      name: logExchange\n"
+                "    other:\n      name: aExchange\n      type: direct\n")
+    assert upgrade_log_exchange(contents) == (
+        "    exchange:\n      type: topic\n      name: logExchange\n"
+        "    other:\n      name: aExchange\n      type: direct\n")
+
+
+def test_flow_style_promises_are_rewritten(project):
+    path = project.join('services', 'a', 'promise.yml')
+    path.write("a:\n  logqueue: {exchange: {name: logExchange, type: direct}}\n", ensure=True)
+    assert migrate_log_exchange(str(project)) == ['services/a/promise.yml']
+    assert yaml.safe_load(path.read())['a']['logqueue']['exchange']['type'] == 'topic'
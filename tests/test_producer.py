@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+from toadie.runtime.envelope import ENVELOPE_HEADER, unpack
+from toadie.runtime.producer import Producer, PublishError
+
+from runtime_fakes import FakeConnection
+
+pytest.importorskip('aio_pika')
+
+
+PROMISE = {
+    'outqueues': [{'name': 'cOutQueue0',
+                   'exchange': {'name': 'cExchange', 'type': 'topic'},
+                   'bindings': {'topics': ['c.OUT']},
+                   'body': {'format': 'json'}}],
+}
+
+
+def produce(work, connection=None, **options):
+    connection = connection or FakeConnection()
+
+    async def main():
+        producer = await Producer('c', PROMISE, connection=connection, **options).start()
+        await work(producer)
+        await producer.close()
+    asyncio.run(main())
+    return connection
+
+
+def test_declares_once_and_spreads_over_channels():
+    async def work(producer):
+        for i in range(4):
+            await producer.publish('cExchange', 'c.OUT', b'%d' % i)
+    connection = produce(work, channels=2)
+    assert len(connection.channels) == 2
+    assert connection.channels[0].declared == [('exchange', 'cExchange'), ('queue', 'cOutQueue0')]
+    assert connection.channels[1].declared == []
+    assert sorted(body for _, _, body, _ in connection.sent) == [b'0', b'1', b'2', b'3']
+    assert all(channel.closed for channel in connection.channels)
+
+
+def test_send_encodes_with_the_outqueue_format():
+    async def work(producer):
+        await producer.send('cOutQueue0', {'a': 1})
+    connection = produce(work)
+    exchange, key, body, headers = connection.sent[0]
+    assert (exchange, key, body) == ('cExchange', 'c.OUT', b'{"a":1}')
+    assert headers['x-toadie-codec'] == 'json'
+
+
+def test_window_bounds_unconfirmed_publishes():
+    peaks = list()
+
+    async def work(producer):
+        for i in range(20):
+            await producer.publish('cExchange', 'c.OUT', b'x')
+            peaks.append(len(producer.in_flight))
+    produce(work, window=3)
+    assert max(peaks) <= 3
+
+
+def test_flush_raises_on_rejected_publishes():
+    connection = FakeConnection(fail=lambda key: key == 'bad')
+
+    async def main():
+        producer = await Producer('c', PROMISE, connection=connection).start()
+        await producer.publish('cExchange', 'good', b'1')
+        await producer.publish('cExchange', 'bad', b'2')
+        with pytest.raises(PublishError):
+            await producer.flush()
+        await producer.flush()
+    asyncio.run(main())
+    assert [key for _, key, _, _ in connection.sent] == ['good']
+
+
+def test_envelopes_pack_small_messages():
+    async def work(producer):
+        for i in range(5):
+            await producer.publish('cExchange', 'c.OUT', b'%d' % i)
+    connection = produce(work, envelope=True, envelope_count=3, linger=10)
+    assert len(connection.sent) == 2
+    first, second = connection.sent
+    assert first[3][ENVELOPE_HEADER] == 3
+    assert [bytes(b) for b in unpack(first[2])] == [b'0', b'1', b'2']
+    assert second[3][ENVELOPE_HEADER] == 2
+
+
+def test_envelope_is_sent_after_linger():
+    async def work(producer):
+        await producer.publish('cExchange', 'c.OUT', b'a')
+        await producer.publish('cExchange', 'c.OUT', b'b')
+        await asyncio.sleep(0.05)
+        assert len(producer.batches) == 0
+    connection = produce(work, envelope=True, linger=0.001)
+    assert [bytes(b) for b in unpack(connection.sent[0][2])] == [b'a', b'b']
+
+
+def test_failed_transmits_free_their_window_slot():
+    async def main():
+        producer = await Producer('c', PROMISE, connection=FakeConnection(), window=2).start()
+
+        async def missing(index, name):
+            raise ConnectionError("channel closed")
+        exchange, producer.exchange = producer.exchange, missing
+        for _ in range(3):
+            with pytest.raises(ConnectionError):
+                await asyncio.wait_for(producer.publish('cExchange', 'c.OUT', b'x'), 1)
+        producer.exchange = exchange
+        await asyncio.wait_for(producer.publish('cExchange', 'c.OUT', b'y'), 1)
+        await producer.close()
+    asyncio.run(main())
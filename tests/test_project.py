@@ -0,0 +1,80 @@
+import os
+
+from click.testing import CliRunner
+
+from toadie.commands.update_dotenv import updateDotenv
+from toadie.libs.project import Project, find_components
+
+
+def promise(project, kind, name, inqueue):
+    path = project.join(kind, name, 'promise.yml')
+    path.write("{}:\n  inqueues:\n    - name: {}\n".format(name, inqueue), ensure=True)
+    return path
+
+
+def touch(path, contents):
+    """Rewrite PATH with a newer mtime, even on coarse clocks."""
+    stat = os.stat(str(path))
+    path.write(contents)
+    os.utime(str(path), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def test_components(project):
+    promise(project, 'services', 'a', 'aIn')
+    promise(project, 'tasks', 'b', 'bIn')
+    components = Project(str(project)).components
+    assert components['a'] == {'dir': os.path.join('services', 'a'), 'kind': 'services',
+                               'promise': {'inqueues': [{'name': 'aIn'}]}}
+    assert components['b']['kind'] == 'tasks'
+    assert [c[0] for c in find_components(str(project))] == ['a', 'b']
+
+
+def test_only_changed_files_are_parsed_again(project):
+    path = promise(project, 'services', 'a', 'aIn')
+    promise(project, 'services', 'b', 'bIn')
+    first = Project(str(project))
+    first.components
+    assert project.join('.toadie', 'project.json').check()
+
+    again = Project(str(project))
+    again.components
+    assert not again.dirty and again.save() is False
+
+    touch(path, "a:\n  inqueues:\n    - name: aIn2\n")
+    project.join('services', 'b', 'promise.yml').remove()
+    changed = Project(str(project))
+    parsed = list()
+    original = changed.parsed
+    changed.parsed = lambda rel_path, *args: parsed.append(rel_path) or original(rel_path, *args)
+    assert changed.components['a']['promise']['inqueues'] == [{'name': 'aIn2'}]
+    assert 'b' not in changed.components
+    assert parsed == [os.path.join('services', 'a', 'promise.yml')]
+    assert os.path.join('services', 'b', 'promise.yml') not in Project(str(project)).files
+
+
+def test_services_and_env_keys(project):
+    project.join('docker-compose.yml').write("version: '2'\nservices:\n  rabbitmq: {image: rabbitmq}\n")
+    project.join('.env').write("A=1\n# comment\nB=\n")
+    p = Project(str(project))
+    assert list(p.services) == ['rabbitmq']
+    assert p.env_keys == {'A', 'B'}
+    assert p.dotenv_keys('dotenv.example') == set()
+    assert p.dotenv_keys('missing.env') == set()
+
+    touch(project.join('.env'), "A=1\nB=\nC=3\n")
+    assert Project(str(project)).env_keys == {'A', 'B', 'C'}
+
+
+def test_update_dotenv(project):
+    project.join('.env').write("KEPT=1\n")
+    project.join('services', 'a', 'a.py').write(
+        "import os\nos.environ.get('API_KEY')\nos.environ['KEPT']\n", ensure=True)
+    with project.as_cwd():
+        result = CliRunner().invoke(updateDotenv, [])
+        assert result.exit_code == 0, result.output
+        assert project.join('.env').read() == "KEPT=1\nAPI_KEY=__blank__\n"
+        assert sorted(project.join('dotenv.example').read().split()) == ['API_KEY=', 'KEPT=']
+
+        result = CliRunner().invoke(updateDotenv, [])
+        assert result.output == "Environment files updated.\n"
+        assert project.join('.env').read() == "KEPT=1\nAPI_KEY=__blank__\n"
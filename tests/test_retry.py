@@ -0,0 +1,179 @@
+import asyncio
+
+import pytest
+
+from toadie.libs.deadletters import DeadLetterError, DeadLetters, dead_letter, summarize
+from toadie.runtime import producer
+from toadie.runtime.consumer import Consumer
+from toadie.runtime.envelope import ENVELOPE_HEADER, pack, unpack
+from toadie.runtime.retry import (
+    ATTEMPTS_HEADER, ERROR_HEADER, QUEUE_HEADER, failure_route, replay_route, retry_policy,
+    retry_queues, tier_name)
+
+from runtime_fakes import FakeMessage, FakePublisher, drain
+
+
+PROMISE = {
+    'inqueues': [{'name': 'cInQueue0',
+                  'exchange': {'name': 'cExchange', 'type': 'topic'},
+                  'bindings': {'topics': ['c.IN.#']}}],
+    'retry': {'max_attempts': 3, 'delays': [0.5, 10]},
+}
+
+
+def consumer(handler, publisher=None):
+    consumer = Consumer(handler, 'c', PROMISE, url='amqp://test/')
+    consumer.publisher = publisher or FakePublisher()
+    return consumer
+
+
+def test_policy_and_tiers():
+    assert retry_policy({}) is None
+    assert retry_policy(PROMISE) == {'max_attempts': 3, 'delays': [0.5, 10]}
+    assert retry_policy({'retry': {'max_attempts': 2}})['delays'] == [1, 10, 60, 300]
+    assert tier_name(0.5) == '0_5s' and tier_name(10) == '10s'
+
+    policy = retry_policy(PROMISE)
+    assert failure_route('c', policy, 'cInQueue0', 1) == ('cFailed', 'cInQueue0.0_5s')
+    assert failure_route('c', policy, 'cInQueue0', 2) == ('cFailed', 'cInQueue0.10s')
+    assert failure_route('c', policy, 'cInQueue0', 3) == ('cFailed', 'cInQueue0.dead')
+    assert failure_route('c', dict(policy, delays=[]), 'cInQueue0', 1)[1] == 'cInQueue0.dead'
+    # The last delay repeats.
+    assert failure_route('c', dict(policy, max_attempts=9), 'cInQueue0', 5)[1] == 'cInQueue0.10s'
+
+
+def test_retry_queues():
+    queues = dict((q['name'], q) for q in retry_queues('c', PROMISE))
+    assert sorted(queues) == ['cDeadLetters', 'cDelay0_5s', 'cDelay10s', 'cInQueue0']
+    assert queues['cDelay0_5s']['arguments'] == {
+        'x-message-ttl': 500, 'x-dead-letter-exchange': 'cRetry'}
+    assert queues['cDelay0_5s']['bindings'] == {'topics': ['*.0_5s']}
+    assert queues['cDeadLetters']['role'] == 'dead-letter'
+    assert queues['cInQueue0']['exchange']['name'] == 'cRetry'
+    assert retry_queues('c', {'inqueues': PROMISE['inqueues']}) == []
+
+
+def test_replay_route():
+    headers = {QUEUE_HEADER: 'cInQueue0', ATTEMPTS_HEADER: 3, ERROR_HEADER: 'boom', 'x': 1}
+    assert replay_route('c', headers) == ('cRetry', 'cInQueue0.replay', {'x': 1})
+    assert QUEUE_HEADER in headers
+
+
+def test_failures_go_to_their_next_tier():
+    async def handle(body, ctx):
+        raise RuntimeError("boom")
+    log = list()
+    c = consumer(handle)
+    drain(c, [FakeMessage(1, b'x', log=log),
+              FakeMessage(2, b'y', headers={ATTEMPTS_HEADER: 2}, log=log)])
+    assert [(p[1], p[2], p[3][ATTEMPTS_HEADER]) for p in c.publisher.published] == [
+        ('cInQueue0.0_5s', b'x', 1), ('cInQueue0.dead', b'y', 3)]
+    assert c.publisher.published[0][3][ERROR_HEADER] == "RuntimeError('boom')"
+    assert log == [('ack', 2, True)]
+    assert c.metrics.counters['retried'] == 1 and c.metrics.counters['dead_lettered'] == 1
+
+
+def test_failed_retry_publishes_are_requeued():
+    async def handle(body, ctx):
+        raise RuntimeError("boom")
+    log = list()
+    c = consumer(handle, FakePublisher(fail=True))
+    drain(c, [FakeMessage(1, b'x', log=log)])
+    assert log == [('nack', 1, True)]
+    assert c.metrics.counters['requeued'] == 1 and c.metrics.counters['nacked'] == 0
+
+
+def test_only_failed_messages_of_an_envelope_are_retried():
+    seen = list()
+
+    async def handle(body, ctx):
+        seen.append(bytes(body))
+        if bytes(body).startswith(b'bad'):
+            raise ValueError(bytes(body))
+    log = list()
+    c = consumer(handle)
+    envelope = pack([b'a', b'bad1', b'b', b'bad2'])
+    drain(c, [FakeMessage(1, envelope, headers={ENVELOPE_HEADER: 4}, log=log)])
+    assert seen == [b'a', b'bad1', b'b', b'bad2']
+    (exchange, key, body, headers), = c.publisher.published
+    assert key == 'cInQueue0.0_5s'
+    assert [bytes(part) for part in unpack(body)] == [b'bad1', b'bad2']
+    assert headers[ENVELOPE_HEADER] == 2
+    assert headers[ERROR_HEADER] == "ValueError(b'bad1')"
+    assert log == [('ack', 1, True)]
+
+
+class FakeQueue(object):
+    def __init__(self, messages):
+        self.messages = list(messages)
+        self.declaration_result = type('Declared', (), {'message_count': len(self.messages)})
+
+    async def get(self, no_ack=False, fail=True):
+        return self.messages.pop(0) if self.messages else None
+
+
+class FakeProducer(object):
+    published = list()
+
+    def __init__(self, component, promise, connection=None):
+        pass
+
+    async def start(self):
+        return self
+
+    async def publish(self, exchange, routing_key, body, headers=None):
+        self.published.append((exchange, routing_key, bytes(body), headers))
+
+    async def flush(self):
+        pass
+
+
+@pytest.fixture
+def letters(project, monkeypatch):
+    """DeadLetters of component c, whose queue holds two dead letters and
+    a message the runtime did not dead-letter."""
+    project.join('services', 'c', 'promise.yml').write(
+        "c:\n  inqueues:\n    - name: cInQueue0\n      exchange: {name: cExchange}\n"
+        "  retry: {max_attempts: 3}\n", ensure=True)
+    log = list()
+    queue = FakeQueue([
+        FakeMessage(1, b'x', {QUEUE_HEADER: 'cInQueue0', ATTEMPTS_HEADER: 3, ERROR_HEADER: 'boom'}, log=log),
+        FakeMessage(2, b'foreign', log=log),
+        FakeMessage(3, b'yy', {QUEUE_HEADER: 'cInQueue0', ATTEMPTS_HEADER: 3, ERROR_HEADER: 'boom'}, log=log),
+    ])
+
+    async def connect(self):
+        return None, queue
+    monkeypatch.setattr(DeadLetters, 'connect', connect)
+    monkeypatch.setattr(producer, 'Producer', FakeProducer)
+    monkeypatch.setattr(FakeProducer, 'published', list())
+    return DeadLetters(str(project), 'c', url='amqp://test/'), log
+
+
+def test_inspect_leaves_dead_letters_queued(letters):
+    dead, log = letters
+    total, fetched = asyncio.run(dead.inspect(limit=2))
+    assert total == 3
+    assert fetched[0] == dead_letter(FakeMessage(1, b'x', {
+        QUEUE_HEADER: 'cInQueue0', ATTEMPTS_HEADER: 3, ERROR_HEADER: 'boom'}))
+    assert log == [('nack', 1, True), ('nack', 2, True)]
+    assert summarize(fetched) == [(1, None, None), (1, 'cInQueue0', 'boom')]
+
+
+def test_replay(letters):
+    dead, log = letters
+    batches = list()
+    assert asyncio.run(dead.replay(on_batch=batches.append)) == (2, 1)
+    assert [(p[1], p[2]) for p in FakeProducer.published] == [
+        ('cInQueue0.replay', b'x'), ('cInQueue0.replay', b'yy')]
+    assert all(p[0] == 'cRetry' and p[3] == {} for p in FakeProducer.published)
+    assert log == [('ack', 1, False), ('ack', 3, False), ('nack', 2, True)]
+    assert batches == [2]
+
+
+def test_components_without_a_retry_policy(project):
+    project.join('services', 'd', 'promise.yml').write("d:\n  inqueues: []\n", ensure=True)
+    with pytest.raises(DeadLetterError, match='no retry policy'):
+        DeadLetters(str(project), 'd', url='amqp://test/')
+    with pytest.raises(DeadLetterError, match='No promise.yml'):
+        DeadLetters(str(project), 'missing', url='amqp://test/')
@@ -0,0 +1,67 @@
+import asyncio
+import gzip
+import os
+
+from toadie.runtime.sink import FileSink, compress_file, log_line
+
+
+def test_log_line():
+    assert log_line('a.log.INFO', b'hi').endswith(b' a.log.INFO hi')
+    assert log_line('k', 'é').endswith(' k é'.encode('utf-8'))
+    assert log_line(None, {'a': 1}).endswith(b'  {"a":1}')
+
+
+def test_writes_return_once_flushed(tmpdir):
+    async def main():
+        sink = FileSink(str(tmpdir), 'logger', flush_interval=0.01)
+        await asyncio.gather(*[sink.write('line {}'.format(i)) for i in range(50)])
+        assert tmpdir.join('logger.log').read().splitlines() == \
+            ['line {}'.format(i) for i in range(50)]
+        await sink.close()
+    asyncio.run(main())
+
+
+def test_concurrent_writes_share_a_flush(tmpdir, monkeypatch):
+    flushes = list()
+    real_write_file = FileSink.write_file
+    monkeypatch.setattr(FileSink, 'write_file',
+                        lambda self, data: flushes.append(data) or real_write_file(self, data))
+
+    async def main():
+        sink = FileSink(str(tmpdir), 'logger', flush_interval=0.05)
+        await asyncio.gather(*[sink.write(b'x') for i in range(100)])
+        await sink.close()
+    asyncio.run(main())
+    assert len(flushes) == 1
+
+
+def test_flushes_once_enough_bytes_are_pending(tmpdir):
+    async def main():
+        sink = FileSink(str(tmpdir), 'logger', flush_bytes=10, flush_interval=60)
+        await asyncio.wait_for(sink.write(b'0123456789'), 1)
+        await sink.close()
+    asyncio.run(main())
+    assert tmpdir.join('logger.log').read() == '0123456789\n'
+
+
+def test_rotates_and_compresses(tmpdir):
+    async def main():
+        sink = FileSink(str(tmpdir), 'logger', max_bytes=20, flush_interval=0.001)
+        for i in range(3):
+            await sink.write(b'x' * 15)
+        await sink.close()
+    asyncio.run(main())
+    rotated = sorted(name for name in os.listdir(str(tmpdir)) if name.endswith('.gz'))
+    assert len(rotated) == 1
+    with gzip.open(str(tmpdir.join(rotated[0]))) as _:
+        assert _.read() == (b'x' * 15 + b'\n') * 2
+    assert tmpdir.join('logger.log').read() == 'x' * 15 + '\n'
+
+
+def test_compress_file(tmpdir):
+    path = tmpdir.join('a.log')
+    path.write('data')
+    compress_file(str(path))
+    assert not path.check()
+    with gzip.open(str(path) + '.gz') as _:
+        assert _.read() == b'data'
@@ -0,0 +1,110 @@
+import asyncio
+import os
+
+import pytest
+import yaml
+
+from toadie.libs.broker import InMemoryBroker, topic_matches
+from toadie.libs.manifest import ManifestApplier, StackManifest
+from toadie.libs.stacktest import StackTest
+
+
+@pytest.mark.parametrize('pattern, key, matches', [
+    ('a.b', 'a.b', True),
+    ('a.*', 'a.b', True),
+    ('a.*', 'a.b.c', False),
+    ('a.#', 'a', True),
+    ('a.#', 'a.b.c', True),
+    ('#.c', 'a.b.c', True),
+    ('*.log.*', 'x.log.INFO', True),
+    ('*', '', False),
+])
+def test_topic_matches(pattern, key, matches):
+    assert topic_matches(pattern, key) is matches
+
+
+def test_broker_routes_by_exchange_type():
+    async def main():
+        broker = InMemoryBroker()
+        broker.declare_exchange('t', 'topic')
+        broker.declare_exchange('d', 'direct')
+        for queue in ['q1', 'q2']:
+            broker.declare_queue(queue)
+        broker.bind('q1', 't', 'a.#')
+        broker.bind('q2', 'd', 'a')
+        assert await broker.publish('t', 'a.b', b'x') == 1
+        assert await broker.publish('d', 'a.b', b'x') == 0
+        assert await broker.publish('d', 'a', b'y') == 1
+        assert broker.get('q1').body == b'x'
+        assert broker.get('q2').body == b'y'
+        assert len(broker.unroutable) == 1
+    asyncio.run(main())
+
+
+def scaffold(project, manifest):
+    project.join('stack.yml').write(manifest)
+    ManifestApplier(str(project)).apply(StackManifest.load(str(project.join('stack.yml'))))
+
+
+def run(project, only=None):
+    cwd = os.getcwd()
+    os.chdir(str(project))
+    try:
+        return asyncio.run(StackTest(str(project), only=only).run())
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.mark.parametrize('format', ['text', 'json', 'raw'])
+def test_scaffolded_stack_passes(project, format):
+    scaffold(project, "components:\n  ingest:\n    format: {}\n".format(format))
+    results = run(project)
+    assert [r for r in results if not r[2]] == []
+    assert ('ingest', 'publishes to ingestOutQueue0', True, '1 messages') in results
+
+
+def test_log_sinks_do_not_write_into_the_project(project, monkeypatch):
+    monkeypatch.delenv('LOG_DIR', raising=False)
+    scaffold(project, "components:\n  ingest: {}\n")
+    run(project)
+    assert not project.join('logs').check()
+    assert 'LOG_DIR' not in os.environ
+
+
+def test_bad_sample_fails_its_component_only(project):
+    scaffold(project, "components:\n  ingest: {}\n  other: {}\n")
+    promise = project.join('services', 'ingest', 'promise.yml')
+    promise.write(promise.read().replace('format: text', 'format: nope'))
+    results = run(project)
+    failures = [r for r in results if not r[2]]
+    assert [(r[0], r[1]) for r in failures] == [
+        ('ingest', 'encode sample of ingestInQueue0'),
+        ('ingest', 'publishes to ingestOutQueue0')]
+    assert 'Unknown body format' in failures[0][3]
+    assert ('other', 'publishes to otherOutQueue0', True, '1 messages') in results
+
+
+def test_handler_errors_are_reported(project):
+    scaffold(project, "components:\n  ingest: {}\n")
+    project.join('services', 'ingest', 'consume.py').write(
+        "async def handle(body, ctx):\n    raise KeyError('x')\n")
+    failures = [r for r in run(project, only='ingest') if not r[2]]
+    assert ('ingest', 'handle ingestInQueue0', False, "KeyError: 'x'") in failures
+
+
+def test_shared_outqueues_count_per_publisher(project):
+    scaffold(project, "components:\n  ingest: {}\n  other: {}\n")
+    ingest = yaml.safe_load(project.join('services', 'ingest', 'promise.yml').read())['ingest']
+    path = project.join('services', 'other', 'promise.yml')
+    other = yaml.safe_load(path.read())
+    other['other']['outqueues'] = ingest['outqueues']
+    path.write(yaml.safe_dump(other))
+    project.join('services', 'ingest', 'consume.py').write(
+        "async def handle(body, ctx):\n    pass\n")
+    results = run(project)
+    assert ('ingest', 'publishes to ingestOutQueue0', False, '0 messages') in results
+    assert ('other', 'publishes to ingestOutQueue0', True, '1 messages') in results
+
+
+def test_unknown_component(project):
+    assert run(project, only='nope') == [('nope', 'exists', False, 'no promise.yml found')]
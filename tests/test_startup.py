@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Microseconds `toadie --help` may spend importing toadie itself, on top of
+# click. Lazy subcommands keep this to a few milliseconds.
+IMPORT_BUDGET_US = 50000
+# Modules `toadie --help` must not import.
+HEAVY_MODULES = {'yaml', 'pkg_resources',
+                 'toadie.libs.components', 'toadie.libs.dependencies'}
+
+
+def import_times(*argv):
+    """Return {module: cumulative microseconds} for `toadie ARGV`."""
+    code = ("import sys\nfrom toadie.toadie import main\n"
+            "try:\n    main({!r})\nexcept SystemExit:\n    pass\n".format(list(argv)))
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True, check=True)
+    times = dict()
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        try:
+            times[module.strip()] = int(cumulative)
+        except ValueError:
+            continue
+    return times
+
+
+def test_help_skips_heavy_imports():
+    times = import_times('--help')
+    assert 'toadie.toadie' in times
+    assert not HEAVY_MODULES & set(times)
+
+
+def test_help_import_time_budget():
+    # Best of three, so a busy machine does not fail the budget.
+    overheads = list()
+    for _ in range(3):
+        times = import_times('--help')
+        overheads.append(times['toadie.toadie'] - times.get('click', 0))
+    assert min(overheads) < IMPORT_BUDGET_US, \
+        "toadie import took {}us over click, budget {}us".format(min(overheads), IMPORT_BUDGET_US)
+
+
+def test_lazy_help_matches_the_command_docstrings():
+    from toadie.toadie import LAZY_COMMANDS, main
+    ctx = main.make_context('toadie', ['--help'], resilient_parsing=True)
+    for name, (import_path, short_help) in sorted(LAZY_COMMANDS.items()):
+        command = main.get_command(ctx, name)
+        assert command is not None, import_path
+        assert command.get_short_help_str(limit=1000) == short_help, name
@@ -0,0 +1,11 @@
+from toadie.libs.templates import read_template, runtime_sources
+
+
+def test_read_template_returns_bytes():
+    assert b'FROM' in read_template('app.py')
+
+
+def test_runtime_sources_lists_runtime_modules():
+    sources = runtime_sources()
+    assert 'consumer.py' in sources
+    assert all(name.endswith('.py') for name in sources)
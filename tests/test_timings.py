@@ -0,0 +1,87 @@
+import json
+import subprocess
+import sys
+
+import pytest
+from click.testing import CliRunner
+
+from toadie.libs import timings as timings_module
+from toadie.libs.timings import Timings, phase
+from toadie.toadie import main
+
+
+@pytest.fixture
+def recorder(monkeypatch):
+    """A fresh Timings in place of the one shared by the invocation."""
+    recorder = Timings()
+    monkeypatch.setattr(timings_module, 'timings', recorder)
+    yield recorder
+    recorder.disable()
+
+
+def test_disabled_phases_record_nothing(recorder):
+    with phase('load'):
+        pass
+    assert recorder.phases == [] and recorder.total() == 0.0
+    assert subprocess.Popen is not timings_module.TimedPopen
+
+
+def test_phases_and_subprocesses(recorder):
+    recorder.enable()
+    with phase('load'):
+        subprocess.check_call([sys.executable, '-c', 'pass'])
+    with pytest.raises(subprocess.CalledProcessError):
+        subprocess.check_call([sys.executable, '-c', 'raise SystemExit(3)'])
+    with pytest.raises(OSError):
+        subprocess.call(['toadie-no-such-binary'])
+    recorder.disable()
+    assert subprocess.Popen is not timings_module.TimedPopen
+
+    assert [p['name'] for p in recorder.phases] == ['load']
+    assert [s['returncode'] for s in recorder.subprocesses] == [0, 3, None]
+    assert recorder.subprocesses[2]['command'] == 'toadie-no-such-binary'
+    rows = recorder.rows()
+    assert [r[2] for r in rows] == sorted((r[2] for r in rows), reverse=True)
+    report = recorder.report(width=20).splitlines()
+    assert report[0].split() == ['kind', 'name', 'seconds', 'exit']
+    assert report[-1].startswith('total')
+    assert any(line.startswith('exec') and '...' in line for line in report)
+    assert any(line.rstrip().endswith('not found') for line in report)
+
+
+def test_json_line(recorder):
+    recorder.enable()
+    recorder.add_phase('load', 0.1234567)
+    recorder.add_subprocess(['docker', 'ps'], 0.5, 0)
+    recorder.disable()
+    line = json.loads(recorder.to_json('compose', ['--timings', 'compose']))
+    assert line['command'] == 'compose' and line['argv'] == ['--timings', 'compose']
+    assert line['phases'][0]['seconds'] == 0.123457
+    assert line['subprocesses'] == [{'command': 'docker ps', 'seconds': 0.5, 'returncode': 0}]
+
+
+def test_timings_option(recorder, project):
+    log = project.join('timings.jsonl')
+    with project.as_cwd():
+        result = CliRunner().invoke(main, ['--timings-log', str(log), 'topology'])
+    assert result.exit_code == 0, result.output
+    assert result.stderr.splitlines()[0].split() == ['kind', 'name', 'seconds', 'exit']
+    assert 'compile topology' in result.stderr
+    line = json.loads(log.read())
+    assert line['command'] == 'topology'
+    assert 'compile topology' in [p['name'] for p in line['phases']]
+    assert not recorder.enabled
+
+
+@pytest.mark.parametrize('filename', ['profile.txt', 'profile.pstats'])
+def test_profile_option(project, filename):
+    path = project.join(filename)
+    with project.as_cwd():
+        result = CliRunner().invoke(main, ['--profile', str(path), 'topology'])
+    assert result.exit_code == 0, result.output
+    assert "Profile written to {}".format(path) in result.stderr
+    if filename.endswith('.pstats'):
+        import pstats
+        assert pstats.Stats(str(path)).total_calls
+    else:
+        assert 'cumulative' in path.read()
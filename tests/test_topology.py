@@ -0,0 +1,135 @@
+import json
+
+import yaml
+from click.testing import CliRunner
+
+from toadie.commands.topology import topology
+from toadie.libs.topology import StackTopology, compile_topology, publish_paths
+
+EXCHANGE = {'name': 'jobsExchange', 'type': 'topic'}
+
+
+def inqueue(name, *topics, exchange=EXCHANGE):
+    return {'name': name, 'exchange': exchange, 'bindings': {'topics': list(topics)}}
+
+
+def component(project, name, inqueues=(), outqueues=(), **extra):
+    promise = dict(inqueues=list(inqueues), outqueues=list(outqueues), **extra)
+    project.join('services', name, 'promise.yml').write(
+        yaml.safe_dump({name: promise}), ensure=True)
+
+
+def pipeline(project):
+    """a publishes to b, which publishes to c."""
+    component(project, 'a', outqueues=[inqueue('bInQueue0', 'b.*')])
+    component(project, 'b', inqueues=[inqueue('bInQueue0', 'b.*')],
+              outqueues=[inqueue('cInQueue0', 'c.#')])
+    component(project, 'c', inqueues=[inqueue('cInQueue0', 'c.#')])
+
+
+def test_components_publish_every_log_level():
+    log_exchange = {'name': 'logExchange', 'type': 'topic'}
+    promise = {'logqueue': {'exchange': log_exchange, 'bindings': {'topic': ['a.log.INFO']}},
+               'errqueue': {'exchange': log_exchange, 'bindings': {'topics': ['a.ERROR']}}}
+    assert [key for exchange, key in publish_paths('a', promise)] == [
+        'a.ERROR', 'a.log.DEBUG', 'a.log.ERROR', 'a.log.INFO', 'a.log.WARNING', 'a.metrics']
+
+
+def test_compile_routes_publishes_to_queues():
+    graph = compile_topology([
+        ('a', 'services/a', {'outqueues': [inqueue('bInQueue0', 'b.*')]}),
+        ('b', 'services/b', {'inqueues': [inqueue('bInQueue0', 'b.*')]}),
+    ])
+    assert graph['components']['a'] == {'publishes': [['jobsExchange', 'b.default']], 'consumes': []}
+    assert graph['components']['b']['consumes'] == ['bInQueue0']
+    assert graph['exchanges']['jobsExchange'] == {
+        'type': 'topic', 'declared_by': {'a': 'topic', 'b': 'topic'}}
+    assert graph['queues']['bInQueue0']['consumers'] == ['b']
+    assert graph['routes'] == {'jobsExchange': {'b.default': ['bInQueue0']}}
+
+
+def test_a_healthy_pipeline_has_no_problems(project):
+    pipeline(project)
+    stack = StackTopology(str(project))
+    assert stack.check() == []
+    assert stack.route('jobsExchange', 'c') == ['cInQueue0']
+    assert stack.route('jobsExchange', 'x') is None
+
+
+def test_problems(project):
+    direct = {'name': 'jobsExchange', 'type': 'direct'}
+    component(project, 'a', outqueues=[inqueue('nowhere', 'z.*'), inqueue('bInQueue0', 'b.*')])
+    component(project, 'b', inqueues=[inqueue('bInQueue0', 'b.*', exchange=direct)])
+    component(project, 'c', inqueues=[inqueue('bInQueue0', 'b.x'), inqueue('cInQueue0', 'c.*')])
+    problems = StackTopology(str(project)).check()
+    assert ('error', "exchange jobsExchange is declared with conflicting types: "
+                     "topic by a, direct by b, topic by c") in problems
+    assert ('warning', "queue bInQueue0 is declared with different bindings by a, b, c") in problems
+    assert ('warning', "queue bInQueue0 is consumed by b, c, which compete for its messages") in problems
+    assert ('warning', "inqueue cInQueue0 is not reached by any component") in problems
+    assert any(m.startswith("a publishes z.default to jobsExchange") for _, m in problems)
+
+
+def test_cycles_are_reported_once(project):
+    component(project, 'a', inqueues=[inqueue('aInQueue0', 'a.*')],
+              outqueues=[inqueue('bInQueue0', 'b.*')])
+    component(project, 'b', inqueues=[inqueue('bInQueue0', 'b.*')],
+              outqueues=[inqueue('aInQueue0', 'a.*')])
+    stack = StackTopology(str(project))
+    assert list(stack.cycles()) == [['a', 'b', 'a']]
+    assert stack.check() == [('warning', "messages can loop through a -> b -> a")]
+
+
+def test_fanout_limit(project):
+    queues = [inqueue('q{}'.format(i), 'fan.*') for i in range(3)]
+    component(project, 'a', outqueues=[queues[0]])
+    for i, queue in enumerate(queues):
+        component(project, 'c{}'.format(i), inqueues=[queue])
+    stack = StackTopology(str(project))
+    assert stack.check() == []
+    assert stack.check(fanout_limit=2) == [
+        ('warning', "a publishes fan.default to jobsExchange, fanning out to 3 queues")]
+
+
+def test_graph_is_cached_until_a_promise_changes(project):
+    pipeline(project)
+    first = StackTopology(str(project))
+    assert first.graph and not first.cached
+    second = StackTopology(str(project))
+    assert second.graph == first.graph and second.cached
+
+    component(project, 'd', inqueues=[inqueue('dInQueue0', 'd.*')])
+    third = StackTopology(str(project))
+    assert 'd' in third.graph['components'] and not third.cached
+
+
+def test_dot_and_definitions(project):
+    pipeline(project)
+    stack = StackTopology(str(project))
+    dot = stack.to_dot()
+    assert dot.startswith('digraph stack {\n')
+    assert '  "c:a" -> "x:jobsExchange" [label="b.default"];' in dot
+    assert '  "x:jobsExchange" -> "q:bInQueue0" [label="b.*", style=dashed];' in dot
+    assert '  "q:bInQueue0" -> "c:b";' in dot
+
+    definitions = stack.definitions()
+    assert [e['name'] for e in definitions['exchanges']] == ['jobsExchange']
+    assert [q['name'] for q in definitions['queues']] == ['bInQueue0', 'cInQueue0']
+    assert {(b['destination'], b['routing_key']) for b in definitions['bindings']} == {
+        ('bInQueue0', 'b.*'), ('cInQueue0', 'c.#')}
+
+
+def test_command(project):
+    pipeline(project)
+    with project.as_cwd():
+        result = CliRunner().invoke(topology, ['--definitions', 'defs.json'])
+        assert result.exit_code == 0, result.output
+        assert result.output == "3 components, 1 exchanges, 2 queues\n"
+        assert json.loads(project.join('defs.json').read())['queues']
+
+        component(project, 'd', outqueues=[inqueue('nowhere', 'z.*')])
+        result = CliRunner().invoke(topology, [])
+        assert result.exit_code == 0
+        result = CliRunner().invoke(topology, ['--strict'])
+        assert result.exit_code == 1
+        assert "warning: d publishes z.default to jobsExchange" in result.output
@@ -0,0 +1,50 @@
+import click
+import os
+from ..libs.manifest import ManifestApplier, ManifestError, StackManifest
+from ..libs.migrations import LOG_EXCHANGE, outdated_log_exchanges
+
+
+@click.command()
+@click.argument('manifest', type=click.Path(exists=True, dir_okay=False))
+@click.option('--workers', type=int, default=None,
+              help='Threads used to generate component files.')
+@click.option('--force', is_flag=True,
+              help='Regenerate every component, overwriting its files.')
+def applyManifest(manifest, workers, force):
+    """Scaffold every component declared in MANIFEST.
+
+    \b
+    MANIFEST declares components by name:
+        components:
+          ingest:
+            type: service       # service or task
+            interface: queue
+            base: slim          # optional, alpine or slim
+            format: json        # optional queue body codec, text by default
+            requirements:
+              - requests
+
+    Components are generated in parallel and docker-compose.yml and `.env`
+    are written once. Components whose spec did not change since the last
+    apply are skipped; existing components only get their requirements
+    updated unless `--force` is given.
+    """
+    if not os.path.isfile('docker-compose.yml'):
+        click.secho("No `docker-compose.yml` found. Make sure you are in your project directory.", fg='red')
+        raise SystemExit(1)
+    try:
+        stack = StackManifest.load(manifest)
+    except ManifestError as err:
+        raise click.ClickException(str(err))
+
+    project_path = os.getcwd()
+    applied = ManifestApplier(project_path, workers=workers, force=force).apply(stack)
+    if not applied:
+        click.secho("Stack is up to date.", fg='green')
+    for name in applied:
+        click.secho("Component applied: {}".format(name), fg='green')
+
+    outdated = outdated_log_exchanges(project_path)
+    if outdated:
+        click.secho("{} declare {} as a direct exchange; run `toadie migrate`.".format(
+            ", ".join(outdated), LOG_EXCHANGE), fg='yellow')
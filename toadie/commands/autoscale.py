@@ -0,0 +1,57 @@
+import click
+import os
+from ..libs.autoscale import BACKENDS, SOURCES, Autoscaler, AutoscaleError
+
+
+def report(decisions):
+    for name, current, desired, applied in decisions:
+        if applied:
+            click.secho("{}: scaled {} -> {}".format(name, current, desired), fg='green')
+        elif desired != current:
+            click.secho("{}: {} -> {} after cooldown".format(name, current, desired), fg='yellow')
+        else:
+            click.echo("{}: {} replicas".format(name, current))
+
+
+@click.command()
+@click.option('--component', help='Only scale this component.')
+@click.option('--interval', type=float, default=15.0, help='Seconds between polls.')
+@click.option('--once', is_flag=True, help='Poll and scale once, then exit.')
+@click.option('--source', type=click.Choice(sorted(SOURCES)), default='management',
+              help='Where queue depths come from; memory reads them from '
+                   '.toadie/queue-depths.json.')
+@click.option('--backend', type=click.Choice(sorted(BACKENDS)), default='compose',
+              help='How replicas are changed; dry-run only reports.')
+def autoscale(component, interval, once, source, backend):
+    """Scale task components to the depth of their inqueues.
+
+    \b
+    Limits come from the `autoscale` section of each promise.yml:
+        autoscale:
+          min: 1
+          max: 10
+          cooldown: 60          # seconds before scaling down again
+          target_backlog: 100   # ready messages per replica
+
+    Queue depths and consumer utilisation are read from the rabbitmq
+    management API at RABBITMQ_MANAGEMENT_URL (http://localhost:15672 by
+    default) with the RABBITMQ_DEFAULT_USER credentials; run it with
+    `honcho run toadie autoscale` to use those of `.env`.
+
+    With `--source memory` depths come from `.toadie/queue-depths.json`,
+    e.g. {"crunchInQueue0": 500}, so policies can be tried out without
+    rabbitmq, together with `--backend dry-run`, which records nothing
+    in `.toadie/autoscale.json`.
+    """
+    project_path = os.getcwd()
+    scaler = Autoscaler(project_path, SOURCES[source](project_path), BACKENDS[backend](project_path),
+                        only=component, record=backend != 'dry-run')
+    try:
+        if once:
+            report(scaler.step())
+        else:
+            scaler.run(interval, on_step=report)
+    except AutoscaleError as err:
+        raise click.ClickException(str(err))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,61 @@
+import asyncio
+import click
+import os
+from ..libs.bench import BACKENDS, Bench, BenchError
+
+
+def format_step(step):
+    return "{:>10} {:>10} {:>10} {:>6} {:>10} {:>10} {:>10}{}".format(
+        step['rate'] or 'max', step['offered'], step['throughput'], step['lost'],
+        *['-' if step[key] is None else step[key] for key in ('p50_ms', 'p95_ms', 'p99_ms')],
+        '  saturated' if step['saturated'] else '')
+
+
+@click.command()
+@click.argument('component')
+@click.option('--rate', type=float, default=0,
+              help='Messages per second to offer; 0 floods at maximum rate.')
+@click.option('--messages', type=int, default=1000, help='Messages sent per step.')
+@click.option('--ramp', type=int, default=1,
+              help='Steps doubling --rate, stopping once the component saturates.')
+@click.option('--backend', type=click.Choice(BACKENDS), default='memory',
+              help='memory runs the handler in-process; amqp benches the running '
+                   'component through rabbitmq (AMQP_URL).')
+@click.option('--timeout', type=float, default=10.0,
+              help='Seconds to wait for outputs after the last message of a step.')
+def bench(component, rate, messages, ramp, backend, timeout):
+    """Measure throughput and latency of COMPONENT.
+
+    The inqueues of COMPONENT's promise.yml are flooded with their sample
+    bodies and its outqueues are watched. Throughput, p50/p95/p99 end to
+    end latency and the saturation point, the throughput at which the
+    component stops keeping up, are reported and saved as json in
+    `.toadie/bench/` for comparison across commits.
+    """
+    try:
+        runner = Bench(os.getcwd(), component, backend=backend)
+    except BenchError as err:
+        raise click.ClickException(str(err))
+    previous = runner.previous()
+
+    click.echo("{:>10} {:>10} {:>10} {:>6} {:>10} {:>10} {:>10}".format(
+        'rate', 'offered/s', 'msgs/s', 'lost', 'p50 ms', 'p95 ms', 'p99 ms'))
+    try:
+        result = asyncio.run(runner.run(rate=rate, messages=messages, ramp=ramp,
+                                        timeout=timeout,
+                                        on_step=lambda step: click.echo(format_step(step))))
+    except BenchError as err:
+        raise click.ClickException(str(err))
+
+    if not result['steps'][-1]['completed']:
+        click.secho("No outputs received. Is {} running?".format(component), fg='red')
+    elif result['saturation'] is None:
+        click.secho("Not saturated up to {} msgs/s.".format(result['steps'][-1]['offered']),
+                    fg='green')
+    else:
+        click.secho("Saturation point: {} msgs/s.".format(result['saturation']), fg='yellow')
+    if previous and previous.get('saturation') and result['saturation']:
+        click.echo("Previously {} msgs/s at {} ({}).".format(
+            previous['saturation'], previous.get('commit') or 'unknown commit',
+            previous['created']))
+    click.echo("Saved {}".format(os.path.relpath(runner.save(result))))
@@ -0,0 +1,14 @@
+import click
+import os
+import subprocess
+from ..libs.compose import merged_compose, uses_fragments
+
+
+@click.command()
+def build_tag_push():
+    """Build, Tag, & Push all services to your docker registry."""
+    project_path = os.getcwd()
+    if uses_fragments(project_path):
+        os.environ['DOCKER_COMPOSE_INPUT'] = os.path.relpath(
+            merged_compose(project_path), project_path)
+    click.echo(subprocess.getoutput('honcho run python bin/build-tag-push.py'))
@@ -0,0 +1,52 @@
+import click
+import json
+from ..libs.dependencies import Tools
+
+
+@click.command()
+@click.option('--cloud', default='aws',
+              help='Check to see if `aws` or `openstack` credentials are properly configured.')
+@click.option('--refresh', is_flag=True,
+              help='Ignore cached tool versions and probe every tool again.')
+@click.option('--json', 'as_json', is_flag=True,
+              help='Print tool statuses as json instead of colored text.')
+def checkSystem(cloud, refresh, as_json):
+    """Check availability of required tools for developing and deploying on CLOUD.
+
+    \b
+    Required:
+        - docker
+        - docker-machine
+        - docker-compose
+        - conda
+
+    Tool versions are cached per binary path and mtime; use `--refresh` to
+    probe again regardless.
+    """
+    tool_statuses = Tools().check_tools(refresh=refresh)
+
+    if as_json:
+        click.echo(json.dumps(tool_statuses, indent=2, sort_keys=True))
+        return
+
+    for tool, info in tool_statuses.items():
+        if info['status'] == 'missing':
+            click.secho(
+                '{} is not installed. Install instructions: {}'.format(
+                    tool, info['install_url']), fg='red')
+        elif info['status'] == 'timeout':
+            click.secho(
+                '{} did not report its version in time. Rerun check-system.'.format(
+                    tool), fg='yellow')
+        elif info['status'] == 'unknown':
+            click.secho(
+                '{} version could not be determined. Install instructions: {}'.format(
+                    tool, info['install_url']), fg='red')
+        elif info['status'] == 'outdated':
+            click.secho(
+                '{} version [{}] is outdated. Install update: {}'.format(
+                    tool, info['version'], info['install_url']), fg='red')
+        else:
+            click.secho(
+                '{} version [{}]: {}'.format(
+                    tool, info['version'], 'OK'), fg='green')
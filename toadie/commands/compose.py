@@ -0,0 +1,24 @@
+import click
+import os
+import subprocess
+import sys
+from ..libs.compose import compose_command
+
+
+@click.command(context_settings=dict(ignore_unknown_options=True,
+                                     allow_interspersed_args=False))
+@click.argument('args', nargs=-1, type=click.UNPROCESSED)
+def compose(args):
+    """Run docker-compose with every compose file of the project.
+
+        Projects with compose fragments pass docker-compose.yml and each
+        fragment listed in `docker-compose.files` with `-f`, e.g.
+
+            $ toadie compose up -d
+    """
+    project_path = os.getcwd()
+    try:
+        sys.exit(subprocess.call(compose_command(project_path) + list(args), cwd=project_path))
+    except OSError as err:
+        click.secho("Could not run docker-compose: {}".format(err), fg='red')
+        sys.exit(1)
@@ -0,0 +1,109 @@
+import click
+import errno
+import os
+import re
+import sys
+from ..libs.compose import COMPOSE_INDEX, INDEX_HEADER, MERGED_FILE
+from ..libs.environments import create_environments
+from ..libs.templates import RESOURCE_PACKAGE, read_template
+
+
+@click.command()
+@click.argument('project_name')
+@click.option('--compose-layout', type=click.Choice(['single', 'fragments']), default='single',
+              help='Keep every service in docker-compose.yml, or each component '
+                   'in a compose fragment in its own directory.')
+def createProject(project_name, compose_layout):
+    """Create a new PROJECT_NAME directory.
+
+        Create a new project directory and dev environment called PROJECT_NAME.
+        Large stacks may use `--compose-layout fragments`; see `toadie split-compose`.
+    """
+
+    # Create PROJECT_NAME dir.
+    if project_name == ".":
+        project_dir = os.path.split(os.getcwd())[-1]
+    else:
+        project_dir = project_name
+    try:
+        os.mkdir(project_dir)
+    except OSError as err:
+        if err.errno == errno.EEXIST:
+            msg = """
+            ERROR: {}!
+            Cannot create PROJECT_NAME: `{project_dir}`.
+            Try a different name or move/delete `{project_dir}`.
+            """.format(err.strerror, project_dir=project_dir)
+            click.secho(msg, fg='red')
+            sys.exit()
+        else:
+            raise
+
+    # Check system for project tools.
+    create_environments(project_name)
+
+   # Create project README.md
+    with open(os.path.join(project_dir, 'README.md'), 'w') as _:
+        _.write("# {}\n\n".format(project_name.upper().replace('_', ' ')))
+    # Check system for project tools.
+
+    # Create docker-compose file
+    with open(os.path.join(project_dir, 'docker-compose.yml'), 'w') as _:
+        _.write("version: '2.0'\n")
+    if compose_layout == 'fragments':
+        with open(os.path.join(project_dir, COMPOSE_INDEX), 'w') as _:
+            _.write(INDEX_HEADER)
+
+    # Copy scripts
+    pkg_scripts = [
+        'build-tag-push.py'
+    ]
+    project_scripts = os.path.join(project_dir, 'bin')
+    os.mkdir(project_scripts)
+    for script in pkg_scripts:
+        template = read_template(script, RESOURCE_PACKAGE)
+        with open(os.path.join(project_scripts, script), 'wb') as _:
+            _.write(template)
+
+    # Create Procfile
+    click.secho("The following commands have been added to `Procfile`:")
+    compose = 'toadie compose' if compose_layout == 'fragments' else 'docker-compose'
+    commands = [
+        'up: {} up -d'.format(compose),
+        'down: {} stop'.format(compose),
+        'clean: {} rm'.format(compose),
+        'build: {} build'.format(compose),
+    ]
+    readme = open(os.path.join(project_dir,'README.md'), 'a')
+    readme.write("# Available honcho commands:\n\n")
+    cmd_instructions = "\nYou can also load environmental variables found in `.env` before arbitrary commands using: honcho run `cmd`"
+    with open(os.path.join(project_dir,'Procfile'), 'w') as _:
+        for cmd in commands:
+            _.write(cmd+"\n")
+            cmds = re.match(r'^(.*): (.*)', cmd)
+            click.secho(
+                """\nshell: {}\nexecute with: honcho start {}""".format(
+                    cmds.group(2),
+                    cmds.group(1)
+                ), fg='blue')
+            readme.write("    # {} execute with:\n    $ honcho start {}\n".format(
+                cmds.group(2),
+                cmds.group(1)
+            ))
+            readme.write(cmd_instructions)
+    readme.close()
+    click.echo(cmd_instructions)
+
+    # Create config files .env, dotenv.example, and .gitignore files.
+    first_line = "COMMENT=This file was generated by {}\n".format('toadie')
+
+    with open(os.path.join(project_dir, '.env'), 'w') as _:
+        _.write(first_line)
+
+    with open(os.path.join(project_dir, 'dotenv.example'), 'w') as _:
+        _.write(first_line)
+
+    with open(os.path.join(project_dir, '.gitignore'), 'w') as _:
+        _.write("# added by toadie\n.env\n.toadie/\nlogs/\n")
+        if compose_layout == 'fragments':
+            _.write(MERGED_FILE + "\n")
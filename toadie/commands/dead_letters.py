@@ -0,0 +1,51 @@
+import asyncio
+import click
+import os
+from ..libs.deadletters import DeadLetterError, DeadLetters, summarize
+
+
+@click.command()
+@click.argument('component')
+@click.option('--replay', is_flag=True,
+              help='Send the dead letters back to the inqueues they failed in.')
+@click.option('--limit', type=click.IntRange(1),
+              help='Dead letters shown, 20 by default, or replayed, all by default.')
+@click.option('--bodies', is_flag=True, help='Show the body of each dead letter.')
+def deadLetters(component, replay, limit, bodies):
+    """Inspect or replay the dead letters of COMPONENT.
+
+    \b
+    Components with a `retry` section in promise.yml retry failed
+    deliveries after each delay, then dead-letter them:
+        retry:
+          max_attempts: 5
+          delays: [1, 10, 60, 300]   # seconds; the last one repeats
+
+    Dead letters are read from `<component>DeadLetters` at AMQP_URL and
+    grouped by inqueue and error. Replayed ones get every attempt again;
+    run it with `honcho run toadie dead-letters` to use the credentials
+    of `.env`.
+    """
+    try:
+        letters = DeadLetters(os.getcwd(), component)
+        if replay:
+            replayed, left = asyncio.run(letters.replay(
+                limit, on_batch=lambda count: click.echo("Replayed {}".format(count))))
+            click.secho("Replayed {} dead letters of {}.".format(replayed, component), fg='green')
+            if left:
+                click.secho("Left {} messages without an inqueue header.".format(left), fg='yellow')
+            return
+        total, shown = asyncio.run(letters.inspect(limit or 20))
+    except DeadLetterError as err:
+        raise click.ClickException(str(err))
+    except (ImportError, OSError) as err:
+        raise click.ClickException("Cannot reach the broker: {}".format(err))
+
+    click.echo("{} dead letters in {}, showing {}".format(total, letters.queue_name, len(shown)))
+    for count, queue, error in summarize(shown):
+        click.secho("{:>6}  {}  {}".format(count, queue, error), fg='red')
+    if bodies:
+        for number, letter in enumerate(shown, 1):
+            click.echo("#{} {} after {} attempts, {} bytes:".format(
+                number, letter.queue, letter.attempts, letter.size))
+            click.echo("    {!r}".format(letter.body[:200]))
@@ -0,0 +1,54 @@
+import click
+import os
+from ..libs.deploy import BACKENDS, Deployer, DeployError
+
+
+DONE = {'deploy': 'Deployed', 'remove': 'Removed'}
+
+
+def show_plan(plan):
+    if not plan['waves'] and not plan['removed']:
+        click.echo("Nothing changed since the last deploy.")
+        return
+    for number, wave in enumerate(plan['waves'], 1):
+        click.secho("Wave {}:".format(number), bold=True)
+        for service in wave:
+            click.echo("    {}: {}".format(service, ", ".join(plan['changes'][service])))
+    if plan['removed']:
+        click.secho("Remove:", bold=True)
+        for service in plan['removed']:
+            click.echo("    {}".format(service))
+
+
+@click.command()
+@click.option('--file', 'stack_file', type=click.Path(exists=True, dir_okay=False),
+              help='Compose file to deploy; defaults to the newest one of build-tag-push.')
+@click.option('--backend', type=click.Choice(sorted(BACKENDS)), default='compose',
+              help='How services are rolled out; dry-run only reports.')
+@click.option('--parallel', type=click.IntRange(1), default=4,
+              help='Services rolled out at once.')
+@click.option('--plan', 'plan_only', is_flag=True, help='Show the rollout plan and exit.')
+def deploy(stack_file, backend, parallel, plan_only):
+    """Roll out the services that changed since the last deploy.
+
+    Each service of the stack is compared with what was last deployed on
+    its image, its environment, its links and the rest of its definition.
+    Changed services are rolled out in dependency order, rabbitmq and the
+    loggers first, and services gone from the stack are removed. What was
+    deployed is recorded in `.toadie/deployed.json`, except by dry-run.
+    """
+    project_path = os.getcwd()
+    try:
+        deployer = Deployer(project_path, BACKENDS[backend](project_path), stack_file,
+                            parallel=parallel, record=backend != 'dry-run')
+        click.echo("Deploying {}".format(deployer.stack_file))
+        plan = deployer.plan()
+        show_plan(plan)
+        if plan_only:
+            return
+        done = deployer.apply(on_done=lambda action, service: click.secho(
+            "{} {}".format(DONE[action], service), fg='green'))
+    except DeployError as err:
+        raise click.ClickException(str(err))
+    if done:
+        click.secho("Rolled out {} services.".format(len(done)), fg='green')
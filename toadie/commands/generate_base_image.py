@@ -0,0 +1,26 @@
+import click
+import os
+from ..libs.baseimage import ProjectBaseImage
+
+
+@click.command()
+def generateBaseImage():
+    """Generate a project base image of dependencies common to all components.
+
+    Requirements listed by every component are installed once into
+    `base/<flavour>/`, one per python flavour (alpine, slim) in use, and
+    component Dockerfiles are rewritten to inherit FROM it, with those
+    requirements taken out of their requirements.txt. `build-tag-push`
+    builds the base images first. Rerun after changing requirements.
+    """
+    base = ProjectBaseImage(os.getcwd())
+    generated = base.generate()
+    if not generated:
+        click.secho("No components built from a python image were found.", fg='red')
+        return
+    for flavour, requirements in sorted(generated.items()):
+        click.secho("Base image `{}`: {}".format(
+            base.image(flavour), ", ".join(requirements) or "no common requirements"),
+            fg='green')
+        click.secho("Build locally with: docker build -t {} {}".format(
+            base.image(flavour), os.path.relpath(base.context(flavour))), fg='yellow')
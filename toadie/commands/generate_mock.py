@@ -0,0 +1,32 @@
+import click
+import os
+from ..libs.components import StackComponent
+from ..libs.templates import RESOURCE_PACKAGE
+
+
+@click.command()
+@click.argument('component_rel_path')
+def generateMock(component_rel_path):
+    """Generates a mock for component found in COMPONENT_REL_PATH."""
+    if os.path.split(component_rel_path)[1]:
+        fullpath = os.path.join(os.getcwd(), component_rel_path)
+    else:
+        fullpath = os.path.join(os.getcwd(), os.path.split(component_rel_path)[0])
+
+    try:
+        component_name = os.path.split(fullpath)[1]
+        component_name = 'mock_for_'+component_name
+    except:
+        raise
+
+    mock_component = StackComponent(
+        component_name,
+        component_type='mock',
+        project_path=os.getcwd(),
+        resource_package=RESOURCE_PACKAGE,
+    )
+
+    mock_component.create_mock_component()
+
+    click.secho("Stack component `{}` created".format(component_name), fg='green')
+    click.secho("To enable/disable mock use `toggle-mock`", fg='yellow')
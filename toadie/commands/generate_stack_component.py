@@ -0,0 +1,120 @@
+import click
+import os
+import sys
+from ..libs.components import BASE_IMAGES, BODY_FORMATS, StackComponent
+from ..libs.compose import open_compose
+from ..libs.dotenv import Dotenv
+from ..libs.migrations import LOG_EXCHANGE, outdated_log_exchanges
+from ..libs.templates import RESOURCE_PACKAGE
+
+
+@click.command()
+@click.argument("component-name")
+@click.option("--force", is_flag=True)
+@click.option("--interface",
+              default='queue',
+              type=click.Choice(['queue','reset','hybrid']))
+@click.option("--component-type",
+              default='service',
+              type=click.Choice(['service','task']))
+@click.option("--base",
+              default='alpine',
+              type=click.Choice(sorted(BASE_IMAGES)),
+              help="`slim` builds a multi-stage glibc image from a shared wheelhouse.")
+@click.option("--body-format",
+              default='text',
+              type=click.Choice(BODY_FORMATS),
+              help="Codec of the promise.yml queue bodies.")
+def generateStackComponent(component_name, force, interface, component_type, base, body_format):
+
+    """Generate stack component scaffold in directory named COMPONENT_NAME.
+
+    \b
+    Stack components are of one of three types:
+        - services: long-running applications
+        - tasks: short-running batch applications
+
+    \b
+    Stack components have interfaces:
+        - queue: a component that only consumes (dequeues & enqueues) tasks
+        - rest: a component that only responds to RESTful http requests
+        - hybrid: a component that consumes tasks and responds to http requests
+
+    Queue based components are like distributed daemons. They consume (dequeue) tasks from the task queue and may also produce (enqueue) tasks for additional processing in the stack. Queue based components cannot be reached by http request and as such should be monitored and redeployed when not healthy. Queue inputs and outputs can be declared in:
+
+        \b
+        - ./<component_type>/<component-name>/promise.yml
+
+    REST based components can be called ad hoc via http requests. They should be designed to provide ad hoc functionality in the stack that can be accessed via their api by processes external to the stack. REST inputs and outputs can be declared in:
+
+        \b
+        - ./<component_type>/<component-name>/raml.yml
+
+    Hybrid components can be called from ad hoc http requests and consume or produce tasks from the task queue. An example use case for a hybrid task would be to provide a RESTful api to post jobs from an external system into the stack i.e. posting a job to a hybrid service via http would result in a new task enqueued to a queue for additional processing by queue based components. Hybrid components' inputs and outputs can be declared in:
+
+        \b
+        - REST inputs and outputs: ./<component_type>/<component-name>/raml.yml
+        - Queue inputs and outputs: ./<component_type>/<component-name>/promise.yml
+
+    Components not authored in python need only conform to inputs and outputs laid out above and be deployable via a Dockerfile based app.
+    """
+    project_path = os.getcwd()
+    component_dir = os.path.join(project_path, component_type+"s", component_name)
+
+    # Verify component directory doesn't exist.
+    if not force:
+        if os.path.exists(component_dir):
+            click.secho(
+                """
+                {} named {} already exists. To overwrite rerun with `--force`
+                """.format(component_type.capitalize(), component_name), fg='red')
+            sys.exit()
+
+    # Every component below edits one in-memory compose document and .env,
+    # written once at the end.
+    docker_compose = open_compose(project_path)
+    dotenv = Dotenv(os.path.join(project_path, '.env'))
+
+    component = StackComponent(
+        component_name,
+        component_type,
+        project_path,
+        resource_package=RESOURCE_PACKAGE,
+        compose=docker_compose,
+        dotenv=dotenv,
+        base=base,
+        body_format=body_format,
+    )
+
+    if interface == 'queue':
+        component.create_queue_component()
+    elif interface == 'rest':
+        component.create_rest_component()
+    elif interface == 'hybrid':
+        component.create_hybrid_component()
+
+    if not docker_compose.has_service('errlogger'):
+        errlogger = StackComponent('errlogger', 'service', project_path,
+                                   resource_package=RESOURCE_PACKAGE,
+                                   compose=docker_compose, dotenv=dotenv)
+        errlogger.create_queue_component()
+        click.echo('Created errlogger service.')
+
+    if not docker_compose.has_service('logger'):
+        logger = StackComponent('logger', 'service', project_path,
+                                resource_package=RESOURCE_PACKAGE,
+                                compose=docker_compose, dotenv=dotenv)
+        logger.create_queue_component()
+        click.echo('Created logger service.')
+
+    docker_compose.flush()
+    dotenv.flush()
+
+    click.secho("[{}] {} component created: {}".format(interface.upper(),
+                                                       component_type.capitalize(),
+                                                       component_name), fg='green')
+
+    outdated = outdated_log_exchanges(project_path)
+    if outdated:
+        click.secho("{} declare {} as a direct exchange; run `toadie migrate`.".format(
+            ", ".join(outdated), LOG_EXCHANGE), fg='yellow')
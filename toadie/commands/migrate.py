@@ -0,0 +1,26 @@
+import click
+import os
+from ..libs.migrations import LOG_EXCHANGE, migrate_log_exchange
+
+
+@click.command()
+def migrate():
+    """Upgrade promise.yml files written by an older toadie.
+
+    \b
+    Declares `logExchange` as a topic exchange in every promise.yml; toadie
+    0.1 generated it as a direct exchange. The exchange is durable, so
+    delete it once on every broker that has it, for components to declare
+    it again as a topic exchange, e.g.:
+        docker-compose exec rabbitmq rabbitmqadmin delete exchange name=logExchange
+    """
+    migrated = migrate_log_exchange(os.getcwd())
+    if not migrated:
+        click.secho("Nothing to migrate.", fg='green')
+        return
+    for path in migrated:
+        click.secho("{}: {} is now a topic exchange".format(path, LOG_EXCHANGE), fg='green')
+    click.secho(
+        "Delete {0} on every broker before restarting components, e.g.:\n"
+        "  docker-compose exec rabbitmq rabbitmqadmin delete exchange name={0}".format(
+            LOG_EXCHANGE), fg='yellow')
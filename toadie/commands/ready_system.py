@@ -0,0 +1,40 @@
+import click
+import os
+from ..libs.environments import create_environments
+
+
+@click.command()
+@click.argument('project_path')
+@click.option('--cloud', default='aws',
+              help='Cloud can be either `aws` or `openstack`.')
+def readySystem(project_path, cloud):
+    """Installs required development tools."""
+    if project_path == ".":
+        project_dir = os.getcwd()
+        project_name = os.path.split(os.getcwd())[-1]
+    else:
+        project_dir = os.path.join(os.getcwd(), project_path)
+        project_name = project_path
+
+    create_environments(project_name)
+
+    if cloud == 'openstack':
+        cloud_configs = [
+            'OS_VERSION=__blank__',
+            'OS_USERNAME=__blank__',
+            'OS_PASSWORD=__blank__',
+            'OS_PROJECT_ID=__blank__',
+            'OS_REGION=__blank__',
+            'OS_AUTH_URL=__blank__',
+        ]
+        with open(os.path.join(project_dir, '.env'), 'a') as _:
+            for line in cloud_configs:
+                _.write(line+"\n")
+    else:
+        cloud_configs = [
+            'AWS_ACCESS_KEY_ID=__blank__',
+            'AWS_SECRET_ACCESS_KEY=__blank__'
+        ]
+        with open(os.path.join(project_dir, '.env'), 'a') as _:
+            for line in cloud_configs:
+                _.write(line+"\n")
@@ -0,0 +1,60 @@
+import click
+import os
+import re
+import sys
+from ..libs.compose import COMPOSE_FILE, MERGED_FILE, ComposeFragments, uses_fragments
+
+
+def rewrite_procfile(path):
+    """Run the Procfile's docker-compose commands through `toadie compose`."""
+    if not os.path.isfile(path):
+        return
+    with open(path, 'r') as _:
+        contents = _.read()
+    with open(path, 'w') as _:
+        _.write(re.sub(r'^(\w+): docker-compose ', r'\1: toadie compose ', contents, flags=re.M))
+
+
+def ignore(path, entry):
+    """Add ENTRY to the .gitignore in PATH unless it is listed."""
+    if not os.path.isfile(path):
+        return
+    with open(path, 'r') as _:
+        if entry in _.read().splitlines():
+            return
+    with open(path, 'a') as _:
+        _.write(entry + "\n")
+
+
+@click.command()
+def splitCompose():
+    """Split docker-compose.yml into one fragment per component.
+
+        Each component's service moves to `docker-compose.fragment.yml` in
+        its directory and `docker-compose.files` lists the fragments.
+        docker-compose.yml keeps services not built from a component, such
+        as rabbitmq. Later edits touch only the component's fragment.
+        Run docker-compose through `toadie compose`; tools needing a single
+        file get `docker-compose.merged.yml`, rendered when needed.
+    """
+    project_path = os.getcwd()
+    if not os.path.isfile(os.path.join(project_path, COMPOSE_FILE)):
+        click.secho("No `{}` found. Make sure you are in your project directory.".format(
+            COMPOSE_FILE), fg='red')
+        sys.exit(1)
+    if uses_fragments(project_path):
+        click.echo("Compose services are already split into fragments.")
+        return
+
+    fragments = ComposeFragments(project_path)
+    for name, definition in sorted(fragments.base.services.items()):
+        fragments.set_service(name, definition)
+        if fragments.index.get(name):
+            fragments.base.remove_service(name)
+    # Writes the index even without any component, switching the layout.
+    fragments.index_dirty = True
+    fragments.flush()
+
+    rewrite_procfile(os.path.join(project_path, 'Procfile'))
+    ignore(os.path.join(project_path, '.gitignore'), MERGED_FILE)
+    click.secho("Moved {} services into fragments.".format(len(fragments.index)), fg='green')
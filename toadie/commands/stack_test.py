@@ -0,0 +1,31 @@
+import asyncio
+import click
+import os
+import time
+from ..libs.stacktest import StackTest
+
+
+@click.command()
+@click.option("--component", help="Optionally limit test to single component.")
+def stackTest(component):
+    """Test inputs and outputs of stack or stack components.
+
+    Stack test will mock inputs; queue, rest, or both depending on the nature
+    of each stack component.
+
+    Components run in-process against an in-memory broker honoring the
+    exchanges and bindings of every promise.yml, so no docker or network is
+    needed. Each component's inqueues are fed their declared sample bodies,
+    and every outqueue it declares must receive a message.
+    """
+    started = time.time()
+    results = asyncio.run(StackTest(os.getcwd(), only=component).run())
+    failures = [r for r in results if not r[2]]
+    for name, check, ok, detail in results:
+        click.secho("[{}] {}: {} {}".format(
+            'PASS' if ok else 'FAIL', name, check, '({})'.format(detail) if detail else ''),
+            fg='green' if ok else 'red')
+    click.echo("{} checks, {} failed in {:.2f}s".format(
+        len(results), len(failures), time.time() - started))
+    if failures:
+        raise SystemExit(1)
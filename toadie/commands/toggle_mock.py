@@ -0,0 +1,28 @@
+import click
+import os
+import sys
+from ..libs.components import StackComponent
+from ..libs.project import Project
+from ..libs.templates import RESOURCE_PACKAGE
+
+
+@click.command()
+@click.argument('mock_rel_path')
+def toggleMock(mock_rel_path):
+    """Enables/disables mock stack component found in MOCK_REL_PATH."""
+    component_name = os.path.basename(os.path.normpath(mock_rel_path))
+    component = Project(os.getcwd()).components.get(component_name)
+    if component is None or component['kind'] != 'mocks':
+        click.secho("This does not appear to be a `mock` component.", fg='red')
+        sys.exit()
+
+    mock_component = StackComponent(
+        component_name,
+        component_type='mock',
+        project_path=os.getcwd(),
+        resource_package=RESOURCE_PACKAGE,
+    )
+
+    status = mock_component.toggle_component()
+
+    click.secho("Stack component `{}` has been {}.".format(component_name, status), fg='yellow')
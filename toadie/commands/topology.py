@@ -0,0 +1,45 @@
+import asyncio
+import click
+import json
+import os
+from ..libs.topology import StackTopology
+from ..runtime.promise import amqp_url
+
+
+@click.command()
+@click.option('--dot', type=click.File('w'), help='Write the graph in DOT format, - for stdout.')
+@click.option('--definitions', type=click.File('w'),
+              help='Write rabbitmq definitions of the whole topology, for load_definitions.')
+@click.option('--declare', is_flag=True,
+              help='Declare the whole topology on the broker at AMQP_URL.')
+@click.option('--strict', is_flag=True, help='Fail on warnings too.')
+def topology(dot, definitions, declare, strict):
+    """Compile every promise.yml into one graph and check its routing.
+
+    Flags exchanges declared with conflicting types, queues declared
+    differently by several components, publishes that route nowhere or
+    to queues nothing consumes, large fan-outs, inqueues nothing reaches
+    and components whose messages can loop. The graph and its routing
+    table are cached in `.toadie/topology.json` until a promise.yml
+    changes.
+    """
+    stack = StackTopology(os.getcwd())
+    graph = stack.graph
+    click.echo("{} components, {} exchanges, {} queues{}".format(
+        len(graph['components']), len(graph['exchanges']), len(graph['queues']),
+        ' (cached)' if stack.cached else ''))
+
+    problems = stack.check()
+    for severity, message in problems:
+        click.secho("{}: {}".format(severity, message), fg='red' if severity == 'error' else 'yellow')
+
+    if dot is not None:
+        dot.write(stack.to_dot())
+    if definitions is not None:
+        json.dump(stack.definitions(), definitions, indent=2, sort_keys=True)
+    if declare:
+        exchanges, queues = asyncio.run(stack.declare(amqp_url()))
+        click.secho("Declared {} exchanges and {} queues.".format(exchanges, queues), fg='green')
+
+    if any(s == 'error' or strict for s, _ in problems):
+        raise SystemExit(1)
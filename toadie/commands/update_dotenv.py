@@ -0,0 +1,55 @@
+import click
+import os
+import sys
+from ..libs.dotenv import Dotenv
+from ..libs.envindex import EnvVarIndex
+from ..libs.project import DOTENV_FILE, EXAMPLE_FILE, Project
+
+
+@click.command()
+@click.option('--workers', type=int, default=None,
+              help='Processes used to scan changed files (default: cpu count).')
+def updateDotenv(workers):
+    """Parse environment variables out of project files.
+
+        Parses environment variables out of project (py) files and update
+        `.env` and `dotenv.example` files. Returns missing values in each file.
+
+        Results are indexed in `.toadie/envindex.json`, and the keys of
+        the env files in `.toadie/project.json`, so only files changed
+        since the last run are read. Paths in `.gitignore` and `.dockerignore`
+        are skipped.
+    """
+
+    # Parse environment variables out of project files.
+    if not os.path.isfile('.env'):
+        click.secho("No `.env` file found. Make sure you are in your project directory.", fg='red')
+        sys.exit()
+    project = Project(os.getcwd())
+    project_env_vars = EnvVarIndex(project.path, workers=workers).update()
+
+    # Get set of variables in .env, cached like the rest of the project.
+    dot_env_vars = project.env_keys
+    missing_dotenv_vars = project_env_vars - dot_env_vars
+
+   # Add missing to .env
+    if len(missing_dotenv_vars) > 0:
+        click.echo("The following variables were missing in `.env` and set to '__blank__'.")
+        dotenv = Dotenv(DOTENV_FILE)
+        for var in sorted(missing_dotenv_vars):
+            dotenv.add(var, '__blank__')
+            click.secho("{} set to __blank__. Update before running.".format(var), fg='yellow')
+        dotenv.flush()
+
+    # Get set of missing varialbes in dotenv.example
+    missing_example_vars = (project_env_vars | dot_env_vars) - project.dotenv_keys(EXAMPLE_FILE)
+
+    # Add missing to dotenv.example
+    if len(missing_example_vars) > 0:
+        click.echo("The following variables were missing in `dotenv.example` and added.")
+        example = Dotenv(EXAMPLE_FILE)
+        for var in sorted(missing_example_vars):
+            example.add(var)
+            click.secho("{}".format(var), fg='blue')
+        example.flush()
+    click.secho("Environment files updated.", fg='green')
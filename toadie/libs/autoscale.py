@@ -0,0 +1,217 @@
+import base64
+import json
+import math
+import os
+import subprocess
+import time
+from collections import namedtuple
+from urllib.parse import quote
+from urllib.request import Request, urlopen
+from .broker import InMemoryBroker
+from .cache import project_cache_dir, dump_json, load_json
+from .compose import compose_command
+from .project import find_components
+
+
+AUTOSCALE_STATE = 'autoscale.json'
+# Queue depths the `memory` source starts from.
+QUEUE_DEPTHS = 'queue-depths.json'
+# Defaults, overridable in the `autoscale` section of promise.yml.
+AUTOSCALE_DEFAULTS = {
+    'min': 1,
+    'max': 10,
+    'cooldown': 60,         # seconds after a change before scaling down
+    'target_backlog': 100,  # ready messages per replica
+    'busy': 0.9,            # consumer utilisation adding a replica while backlogged
+}
+
+QueueStats = namedtuple('QueueStats', ['ready', 'unacked', 'consumers', 'utilisation'])
+
+
+class AutoscaleError(Exception):
+    pass
+
+
+class ManagementSource(object):
+    """Queue statistics from the rabbitmq management API."""
+    def __init__(self, url=None, user=None, password=None, vhost='/', timeout=5):
+        self.url = (url or os.environ.get('RABBITMQ_MANAGEMENT_URL', 'http://localhost:15672')).rstrip('/')
+        credentials = '{}:{}'.format(
+            user or os.environ.get('RABBITMQ_DEFAULT_USER', 'guest'),
+            password or os.environ.get('RABBITMQ_DEFAULT_PASS', 'guest'))
+        self.authorization = 'Basic {}'.format(base64.b64encode(credentials.encode('utf-8')).decode('ascii'))
+        self.vhost = vhost
+        self.timeout = timeout
+
+    def get(self, path):
+        request = Request(self.url + path, headers={'Authorization': self.authorization})
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read().decode('utf-8'))
+        except (OSError, ValueError) as err:
+            raise AutoscaleError("Management API {}: {}".format(self.url + path, err))
+
+    def stats(self, queue):
+        info = self.get('/api/queues/{}/{}'.format(quote(self.vhost, safe=''), quote(queue, safe='')))
+        return QueueStats(info.get('messages_ready', 0), info.get('messages_unacknowledged', 0),
+                          info.get('consumers', 0), info.get('consumer_utilisation'))
+
+
+class BrokerSource(object):
+    """Queue statistics of an InMemoryBroker, a local stand-in for rabbitmq."""
+    def __init__(self, broker):
+        self.broker = broker
+
+    @classmethod
+    def from_project(cls, project_path):
+        """A broker with the project's promises declared and its queues
+        filled to the depths in `.toadie/queue-depths.json`, {queue: ready},
+        to rehearse scaling policies without rabbitmq."""
+        broker = InMemoryBroker()
+        for name, component_dir, promise in find_components(project_path):
+            broker.declare_promise(promise)
+        depths = load_json(os.path.join(project_cache_dir(project_path), QUEUE_DEPTHS), dict())
+        for queue, ready in depths.items():
+            broker.declare_queue(queue)
+            broker.queues[queue].extend([None] * int(ready))
+        return cls(broker)
+
+    def stats(self, queue):
+        return QueueStats(len(self.broker.queues.get(queue) or ()), 0,
+                          int(queue in self.broker.consumers), None)
+
+
+class ComposeBackend(object):
+    """Replicas of docker-compose services, scaled with `docker-compose up --scale`."""
+    def __init__(self, project_path):
+        self.project_path = project_path
+
+    def compose(self, *args):
+        try:
+            return subprocess.check_output(compose_command(self.project_path) + list(args),
+                                           cwd=self.project_path)
+        except (OSError, subprocess.CalledProcessError) as err:
+            raise AutoscaleError("docker-compose {}: {}".format(' '.join(args), err))
+
+    def replicas(self, service):
+        return len(self.compose('ps', '-q', service).split())
+
+    def scale(self, service, replicas):
+        self.compose('up', '-d', '--no-deps', '--no-recreate',
+                     '--scale', '{}={}'.format(service, replicas), service)
+
+
+class DryRunBackend(object):
+    """Record scaling decisions without applying them."""
+    def __init__(self, project_path=None, replicas=None):
+        self.current = dict(replicas or {})
+        self.applied = list()
+
+    def replicas(self, service):
+        return self.current.get(service, 1)
+
+    def scale(self, service, replicas):
+        self.current[service] = replicas
+        self.applied.append((service, replicas))
+
+
+SOURCES = dict()
+BACKENDS = dict()
+
+
+def register_source(name, source):
+    """Make SOURCE, a factory taking the project path of objects with
+    `stats(queue)`, selectable by NAME."""
+    SOURCES[name] = source
+
+
+def register_backend(name, backend):
+    """Make BACKEND, a factory taking the project path of objects with
+    `replicas(service)` and `scale(service, replicas)`, selectable by NAME."""
+    BACKENDS[name] = backend
+
+
+register_source('management', lambda project_path: ManagementSource())
+register_source('memory', BrokerSource.from_project)
+register_backend('compose', ComposeBackend)
+register_backend('dry-run', DryRunBackend)
+
+
+def autoscale_policy(promise):
+    policy = dict(AUTOSCALE_DEFAULTS)
+    policy.update(promise.get('autoscale') or {})
+    return policy
+
+
+def target_replicas(policy, current, stats):
+    """Replicas needed to drain the backlog of STATS, a list of QueueStats.
+
+    One replica per `target_backlog` ready messages, one more than now
+    while backlogged consumers are busier than `busy`, and one less than
+    now once the queues are empty; within `min` and `max`.
+    """
+    backlog = sum(s.ready for s in stats)
+    known = [s.utilisation for s in stats if s.utilisation is not None]
+    utilisation = sum(known) / len(known) if known else None
+    if backlog:
+        desired = int(math.ceil(backlog / float(policy['target_backlog'])))
+        if utilisation is not None and utilisation >= policy['busy']:
+            desired = max(desired, current + 1)
+    elif any(s.unacked for s in stats):
+        desired = current
+    else:
+        desired = current - 1
+    return max(policy['min'], min(policy['max'], desired))
+
+
+class Autoscaler(object):
+    """Scale task components to the depth of their inqueues.
+
+    Tasks, and any component whose promise.yml has an `autoscale` section,
+    are scaled between `min` and `max` replicas. Scaling up happens at
+    once; scaling down only `cooldown` seconds after the last change, which
+    is remembered in `.toadie/autoscale.json` unless RECORD is false.
+    """
+    def __init__(self, project_path, source, backend, only=None, record=True):
+        self.project_path = project_path
+        self.source = source
+        self.backend = backend
+        self.only = only
+        self.record = record
+        self.state_path = os.path.join(project_cache_dir(project_path), AUTOSCALE_STATE)
+        self.state = load_json(self.state_path, dict())
+
+    def components(self):
+        for name, component_dir, promise in find_components(self.project_path):
+            if self.only not in (None, name) or not promise.get('inqueues'):
+                continue
+            parent = os.path.basename(os.path.dirname(component_dir))
+            if parent == 'tasks' or 'autoscale' in promise:
+                yield name, promise
+
+    def step(self, now=None):
+        """Scale every component once. Returns [(name, current, desired, applied)]."""
+        now = time.time() if now is None else now
+        decisions = list()
+        for name, promise in self.components():
+            policy = autoscale_policy(promise)
+            stats = [self.source.stats(q['name']) for q in promise['inqueues']]
+            current = self.backend.replicas(name)
+            desired = target_replicas(policy, current, stats)
+            cooling = now - self.state.get(name, 0) < policy['cooldown']
+            applied = desired > current or (desired < current and not cooling)
+            if applied:
+                self.backend.scale(name, desired)
+                if self.record:
+                    self.state[name] = now
+            decisions.append((name, current, desired, applied))
+        if self.record:
+            dump_json(self.state_path, self.state)
+        return decisions
+
+    def run(self, interval, on_step=None):
+        while True:
+            decisions = self.step()
+            if on_step is not None:
+                on_step(decisions)
+            time.sleep(interval)
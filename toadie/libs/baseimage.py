@@ -0,0 +1,146 @@
+import os
+import re
+from .templates import RESOURCE_PACKAGE, read_template
+
+
+BASE_DIR = 'base'
+COMPONENT_DIRS = ['services', 'tasks', 'mocks']
+PYTHON_IMAGES = {'alpine': 'python:alpine', 'slim': 'python:slim'}
+
+
+def project_slug(project_path):
+    """Name docker derives from the project directory, used for images and caches."""
+    name = os.path.basename(os.path.realpath(project_path)).lower()
+    return re.sub(r'[^a-z0-9_.-]', '-', name)
+
+
+def write_requirements(path, requirements):
+    with open(path, 'w') as _:
+        _.write("".join(req+"\n" for req in requirements))
+
+
+def read_requirements(path):
+    if not os.path.isfile(path):
+        return list()
+    with open(path, 'r') as _:
+        lines = [line.split('#', 1)[0].strip() for line in _.read().splitlines()]
+    return [line for line in lines if line]
+
+
+class ProjectBaseImage(object):
+    """Base images holding the requirements common to a project's components.
+
+    One base is generated per python flavour in use (`alpine` or `slim`) in
+    `base/<flavour>/`, tagged `<project>-base-<flavour>`. Component
+    Dockerfiles inherit FROM it instead of the stock python image, and
+    the requirements it holds are left out of their requirements.txt.
+    """
+    def __init__(self, project_path, resource_package=RESOURCE_PACKAGE):
+        self.project_path = project_path
+        self.resource_package = resource_package
+        self.slug = project_slug(project_path)
+
+    def image(self, flavour):
+        return '{}-base-{}'.format(self.slug, flavour)
+
+    def context(self, flavour):
+        return os.path.join(self.project_path, BASE_DIR, flavour)
+
+    def exists(self, flavour):
+        return os.path.isfile(os.path.join(self.context(flavour), 'Dockerfile'))
+
+    def requirements(self, flavour):
+        """Requirements installed in the base image of FLAVOUR, if any."""
+        return read_requirements(os.path.join(self.context(flavour), 'requirements.txt'))
+
+    def from_pattern(self):
+        images = list(PYTHON_IMAGES.values()) + [self.image(f) for f in PYTHON_IMAGES]
+        return re.compile(r'^FROM\s+({})(\s+AS\s+\S+)?\s*$'.format(
+            '|'.join(re.escape(i) for i in images)), re.M | re.I)
+
+    def flavour_of(self, image):
+        for flavour, python_image in PYTHON_IMAGES.items():
+            if image in (python_image, self.image(flavour)):
+                return flavour
+
+    def components(self):
+        """Yield (component_dir, flavour, inherits) of components built from
+        python images, INHERITS being true for those FROM the base already."""
+        pattern = self.from_pattern()
+        for parent in COMPONENT_DIRS:
+            parent_dir = os.path.join(self.project_path, parent)
+            if not os.path.isdir(parent_dir):
+                continue
+            for name in sorted(os.listdir(parent_dir)):
+                dockerfile = os.path.join(parent_dir, name, 'Dockerfile')
+                if not os.path.isfile(dockerfile):
+                    continue
+                with open(dockerfile, 'r') as _:
+                    match = pattern.search(_.read())
+                if match:
+                    flavour = self.flavour_of(match.group(1))
+                    yield (os.path.join(parent_dir, name), flavour,
+                           match.group(1) == self.image(flavour))
+
+    def common_requirements(self, components, inherited=()):
+        """Requirements of every one of COMPONENTS, (component_dir, inherits)
+        pairs, in first seen order; those inheriting also need INHERITED."""
+        common = None
+        for component_dir, inherits in components:
+            requirements = read_requirements(os.path.join(component_dir, 'requirements.txt'))
+            if inherits:
+                requirements = list(inherited) + [r for r in requirements if r not in inherited]
+            if common is None:
+                common = requirements
+            else:
+                common = [req for req in common if req in requirements]
+        return common or list()
+
+    def generate(self):
+        """Write base images and point component Dockerfiles at them.
+
+        Returns {flavour: common requirements}.
+        """
+        by_flavour = dict()
+        for component_dir, flavour, inherits in self.components():
+            by_flavour.setdefault(flavour, list()).append((component_dir, inherits))
+
+        generated = dict()
+        template = read_template('base.py', self.resource_package).decode('utf-8')
+        for flavour, components in by_flavour.items():
+            inherited = self.requirements(flavour)
+            requirements = self.common_requirements(components, inherited)
+            context = self.context(flavour)
+            os.makedirs(context, exist_ok=True)
+            with open(os.path.join(context, 'Dockerfile'), 'w') as _:
+                _.write(template.replace('{{python}}', PYTHON_IMAGES[flavour])
+                                .replace('{{wheelhouse}}', '{}-wheelhouse'.format(self.slug)))
+            write_requirements(os.path.join(context, 'requirements.txt'), requirements)
+            for component_dir, inherits in components:
+                self.inherit(component_dir, flavour, requirements,
+                             inherited if inherits else ())
+            generated[flavour] = requirements
+        return generated
+
+    def inherit(self, component_dir, flavour, requirements, inherited=()):
+        """Rewrite the python FROM lines of a component's Dockerfile to the
+        base, and drop the REQUIREMENTS of the base from its requirements.txt.
+        INHERITED, those of the base it was built from, come back unless
+        the new base still has them."""
+        path = os.path.join(component_dir, 'requirements.txt')
+        lines = list()
+        if os.path.isfile(path):
+            with open(path, 'r') as _:
+                lines = _.read().splitlines()
+        own = [line.split('#', 1)[0].strip() for line in lines]
+        lines = [r for r in inherited if r not in requirements and r not in own] + \
+            [line for line, req in zip(lines, own) if req not in requirements]
+        with open(path, 'w') as _:
+            _.write("".join(line+"\n" for line in lines))
+        dockerfile = os.path.join(component_dir, 'Dockerfile')
+        with open(dockerfile, 'r') as _:
+            contents = _.read()
+        contents = self.from_pattern().sub(
+            lambda m: 'FROM {}{}'.format(self.image(flavour), m.group(2) or ''), contents)
+        with open(dockerfile, 'w') as _:
+            _.write(contents)
@@ -0,0 +1,286 @@
+import asyncio
+import contextlib
+import itertools
+import os
+import subprocess
+import time
+from .broker import InMemoryBroker
+from .cache import project_cache_dir, dump_json, load_json
+from .project import find_components
+from .stacktest import load_handler, scratch_log_dir
+from ..runtime.codecs import encode_body
+from ..runtime.consumer import RUNTIME_DEFAULTS, call_handler, message_bodies
+from ..runtime.context import TRACE_HEADER, Context
+from ..runtime.promise import amqp_url, queue_bindings, routing_key
+
+
+BENCH_DIR = 'bench'
+BACKENDS = ['memory', 'amqp']
+# A step is saturated once the component completes less than this share of
+# the offered rate, or loses messages.
+SATURATION = 0.9
+
+
+class BenchError(Exception):
+    pass
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an ascending list."""
+    if not ordered:
+        return None
+    index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+def current_commit(project_path):
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=project_path,
+            stderr=subprocess.DEVNULL).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class MemoryTarget(object):
+    """The component's handler run in-process on an InMemoryBroker."""
+    def __init__(self, name, component_dir, promise, on_output):
+        self.name = name
+        self.component_dir = component_dir
+        self.promise = promise
+        self.on_output = on_output
+        self.broker = InMemoryBroker()
+        self.inbox = None
+        self.workers = list()
+        self.scratch = contextlib.ExitStack()
+
+    async def start(self):
+        # Sinks of the logger services write to a scratch LOG_DIR, not the project.
+        self.scratch.enter_context(scratch_log_dir())
+        try:
+            handler = load_handler(self.name, self.component_dir)
+        except BaseException:
+            self.scratch.close()
+            raise
+        if handler is None:
+            self.scratch.close()
+            raise BenchError("{} has no `handle` in consume.py.".format(self.name))
+        options = dict(RUNTIME_DEFAULTS)
+        options.update(self.promise.get('runtime') or {})
+        self.inbox = asyncio.Queue()
+        self.broker.declare_promise(self.promise)
+        for inqueue in self.promise.get('inqueues') or []:
+            self.broker.consume(inqueue['name'], self.inbox.put_nowait)
+        for outqueue in self.promise.get('outqueues') or []:
+            self.broker.consume(outqueue['name'], lambda message: self.on_output(message.headers))
+        self.workers = [asyncio.ensure_future(self.worker(handler))
+                        for _ in range(options['concurrency'])]
+
+    async def worker(self, handler):
+        while True:
+            message = await self.inbox.get()
+            ctx = Context(self.name, self.promise, self.broker, headers=message.headers,
+                          routing_key=message.routing_key, exchange=message.exchange)
+            try:
+                for body in message_bodies(message.body, message.headers):
+                    await call_handler(handler, body, ctx)
+            except Exception:
+                # Counted as lost: it never reaches an outqueue.
+                pass
+
+    async def publish(self, exchange, key, body, headers):
+        await self.broker.publish(exchange, key, body, headers)
+
+    async def close(self):
+        for worker in self.workers:
+            worker.cancel()
+        self.scratch.close()
+
+
+class AmqpTarget(object):
+    """The running component, e.g. from docker-compose, through rabbitmq.
+
+    Outputs are captured on exclusive queues bound like the outqueues, so
+    the component's real consumers still get their messages.
+    """
+    def __init__(self, name, component_dir, promise, on_output, url=None):
+        self.name = name
+        self.promise = promise
+        self.on_output = on_output
+        self.url = url or amqp_url()
+        self.connection = None
+        self.producer = None
+
+    async def start(self):
+        import aio_pika
+        from ..runtime.producer import Producer
+
+        self.connection = await aio_pika.connect_robust(self.url)
+        self.producer = await Producer(self.name, self.promise, connection=self.connection).start()
+        channel = await self.connection.channel()
+        for outqueue in self.promise.get('outqueues') or []:
+            exchange = await channel.get_exchange(outqueue['exchange']['name'], ensure=False)
+            capture = await channel.declare_queue(exclusive=True, auto_delete=True)
+            for key in queue_bindings(outqueue):
+                await capture.bind(exchange, routing_key=key)
+            await capture.consume(self.captured, no_ack=True)
+
+    async def captured(self, message):
+        self.on_output(message.headers or {})
+
+    async def publish(self, exchange, key, body, headers):
+        await self.producer.publish(exchange, key, body, headers)
+
+    async def close(self):
+        await self.producer.close()
+        await self.connection.close()
+
+
+class Bench(object):
+    """Flood a component's inqueues and time what reaches its outqueues.
+
+    Every input carries a trace header the runtime copies onto whatever
+    the handler publishes, so latency is measured end to end from the
+    publish of an input to the first output it caused. Rates ramp up by
+    doubling until the component saturates.
+    """
+    def __init__(self, project_path, component, backend='memory', url=None):
+        found = [c for c in find_components(project_path) if c[0] == component]
+        if not found:
+            raise BenchError("No promise.yml found for `{}`.".format(component))
+        self.project_path = project_path
+        self.name, self.component_dir, self.promise = found[0]
+        if not self.promise.get('inqueues') or not self.promise.get('outqueues'):
+            raise BenchError("{} needs both inqueues and outqueues to bench.".format(self.name))
+        self.backend = backend
+        self.url = url
+        self.sent = dict()
+        self.received = dict()
+        self.expected = 0
+        self.done = None
+
+    def target(self):
+        if self.backend == 'amqp':
+            return AmqpTarget(self.name, self.component_dir, self.promise, self.on_output, self.url)
+        return MemoryTarget(self.name, self.component_dir, self.promise, self.on_output)
+
+    def inputs(self):
+        """Cycle (exchange, routing key, body, headers) over every inqueue."""
+        prepared = list()
+        for inqueue in self.promise['inqueues']:
+            declared = inqueue.get('body') or dict()
+            body, headers = encode_body(declared.get('message', ''), declared.get('format', 'text'))
+            prepared.append((inqueue['exchange']['name'], routing_key(inqueue), body, headers))
+        return itertools.cycle(prepared)
+
+    def on_output(self, headers):
+        trace = headers.get(TRACE_HEADER)
+        if isinstance(trace, bytes):
+            trace = trace.decode('utf-8')
+        if trace in self.sent and trace not in self.received:
+            self.received[trace] = time.perf_counter()
+            if len(self.received) >= self.expected:
+                self.done.set()
+
+    async def step(self, target, index, rate, messages, timeout):
+        """Send MESSAGES at RATE per second, 0 for as fast as possible."""
+        self.sent, self.received = dict(), dict()
+        self.expected = messages
+        self.done = asyncio.Event()
+        inputs = self.inputs()
+        started = time.perf_counter()
+        for seq in range(messages):
+            if rate:
+                delay = started + seq / float(rate) - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            elif seq % 100 == 0:
+                await asyncio.sleep(0)
+            exchange, key, body, headers = next(inputs)
+            trace = '{}-{}'.format(index, seq)
+            headers = dict(headers)
+            headers[TRACE_HEADER] = trace
+            self.sent[trace] = time.perf_counter()
+            await target.publish(exchange, key, body, headers)
+        sent = time.perf_counter()
+        try:
+            await asyncio.wait_for(self.done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+        latencies = sorted(self.received[t] - self.sent[t] for t in self.received)
+        finished = max(self.received.values()) if self.received else sent
+        throughput = len(self.received) / max(finished - started, 1e-9)
+        offered = rate or messages / max(sent - started, 1e-9)
+        return {
+            'rate': rate,
+            'offered': round(offered, 1),
+            'messages': messages,
+            'completed': len(self.received),
+            'lost': messages - len(self.received),
+            'throughput': round(throughput, 1),
+            'p50_ms': self.ms(percentile(latencies, 0.50)),
+            'p95_ms': self.ms(percentile(latencies, 0.95)),
+            'p99_ms': self.ms(percentile(latencies, 0.99)),
+            'saturated': len(self.received) < messages or throughput < SATURATION * offered,
+        }
+
+    @staticmethod
+    def ms(seconds):
+        return None if seconds is None else round(seconds * 1000, 3)
+
+    async def run(self, rate=0, messages=1000, ramp=1, timeout=10.0, on_step=None):
+        """Bench at RATE, doubling it for RAMP steps or until saturated."""
+        target = self.target()
+        await target.start()
+        steps = list()
+        try:
+            for index in range(ramp if rate else 1):
+                result = await self.step(target, index, rate * 2 ** index, messages, timeout)
+                steps.append(result)
+                if on_step is not None:
+                    on_step(result)
+                if result['saturated']:
+                    break
+        finally:
+            await target.close()
+
+        if not rate:
+            saturation = steps[-1]['throughput']
+        else:
+            saturated = [s for s in steps if s['saturated']]
+            saturation = saturated[0]['throughput'] if saturated else None
+        return {
+            'component': self.name,
+            'backend': self.backend,
+            'commit': current_commit(self.project_path),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'saturation': saturation,
+            'steps': steps,
+        }
+
+    def results_dir(self):
+        return os.path.join(project_cache_dir(self.project_path), BENCH_DIR)
+
+    def previous(self):
+        """The last result saved for this component and backend, or None."""
+        directory = self.results_dir()
+        if not os.path.isdir(directory):
+            return None
+        for filename in sorted(os.listdir(directory), reverse=True):
+            # `foo-bar-...` files match `foo-` too; the result names its component.
+            if filename.startswith(self.name + '-') and filename.endswith('.json'):
+                result = load_json(os.path.join(directory, filename))
+                if result and result.get('component') == self.name \
+                        and result.get('backend') == self.backend:
+                    return result
+        return None
+
+    def save(self, result):
+        """Save RESULT as <component>-<backend>-<time to the microsecond>.json."""
+        now = time.time()
+        path = os.path.join(self.results_dir(), '{}-{}-{}.{:06d}.json'.format(
+            self.name, self.backend, time.strftime('%Y%m%dT%H%M%S', time.localtime(now)),
+            int(now % 1 * 1000000)))
+        dump_json(path, result)
+        return path
@@ -0,0 +1,94 @@
+import time
+from collections import deque, namedtuple, defaultdict
+from ..runtime.declare import promise_exchanges, promise_queues
+from ..runtime.promise import queue_bindings
+
+
+Message = namedtuple('Message', ['exchange', 'routing_key', 'body', 'headers', 'timestamp'])
+
+
+def topic_matches(pattern, routing_key):
+    """AMQP topic matching: `*` is exactly one word, `#` zero or more."""
+    pattern = pattern.split('.') if pattern else []
+    words = routing_key.split('.') if routing_key else []
+    # matched[j]: pattern so far matches the first j words.
+    matched = [True] + [False] * len(words)
+    for token in pattern:
+        if token == '#':
+            for j in range(1, len(words) + 1):
+                matched[j] = matched[j] or matched[j - 1]
+        else:
+            matched = [False] + [matched[j - 1] and (token == '*' or token == words[j - 1])
+                                 for j in range(1, len(words) + 1)]
+    return matched[-1]
+
+
+class InMemoryBroker(object):
+    """An in-process stand-in for rabbitmq's direct, topic and fanout exchanges.
+
+    Quacks like the runtime's publishers, so component handlers can publish
+    to it through a runtime Context.
+    """
+    def __init__(self):
+        self.exchanges = dict()
+        self.bindings = defaultdict(list)
+        self.queues = dict()
+        self.consumers = dict()
+        self.delivered = defaultdict(int)
+        self.unroutable = list()
+
+    def declare_exchange(self, name, kind='topic'):
+        self.exchanges.setdefault(name, kind)
+
+    def declare_queue(self, name):
+        self.queues.setdefault(name, deque())
+
+    def bind(self, queue, exchange, routing_key):
+        if (routing_key, queue) not in self.bindings[exchange]:
+            self.bindings[exchange].append((routing_key, queue))
+
+    def declare_promise(self, promise):
+        for name, kind in promise_exchanges(promise).items():
+            self.declare_exchange(name, kind)
+        for queue in promise_queues(promise):
+            self.declare_queue(queue['name'])
+            for key in queue_bindings(queue):
+                self.bind(queue['name'], queue['exchange']['name'], key)
+
+    def route(self, exchange, routing_key):
+        """Names of the queues a message to EXCHANGE with ROUTING_KEY reaches."""
+        kind = self.exchanges.get(exchange)
+        queues = list()
+        for key, queue in self.bindings.get(exchange, []):
+            if kind == 'fanout' or (kind == 'topic' and topic_matches(key, routing_key)) \
+                    or (kind == 'direct' and key == routing_key):
+                if queue not in queues:
+                    queues.append(queue)
+        return queues
+
+    async def publish(self, exchange, routing_key, body, headers=None):
+        message = Message(exchange, routing_key, bytes(body), dict(headers or {}), time.time())
+        queues = self.route(exchange, routing_key)
+        if not queues:
+            self.unroutable.append(message)
+        for queue in queues:
+            self.delivered[queue] += 1
+            if queue in self.consumers:
+                self.consumers[queue](message)
+            else:
+                self.queues[queue].append(message)
+        return len(queues)
+
+    async def flush(self):
+        pass
+
+    def consume(self, queue, callback):
+        """Hand messages routed to QUEUE, queued ones first, to CALLBACK(message)."""
+        while self.queues.get(queue):
+            callback(self.queues[queue].popleft())
+        self.consumers[queue] = callback
+
+    def get(self, queue):
+        """Pop the next message from QUEUE, or None."""
+        messages = self.queues.get(queue)
+        return messages.popleft() if messages else None
@@ -0,0 +1,59 @@
+import json
+import os
+import tempfile
+
+
+CACHE_DIRNAME = '.toadie'
+
+
+def user_cache_dir():
+    """Return the per-user toadie cache directory."""
+    return os.path.join(os.path.expanduser('~'), CACHE_DIRNAME)
+
+
+def project_cache_dir(project_path):
+    """Return the toadie cache directory of the project in PROJECT_PATH."""
+    return os.path.join(project_path, CACHE_DIRNAME)
+
+
+def load_json(path, default=None):
+    """Load json from PATH, returning DEFAULT if missing or unreadable."""
+    try:
+        with open(path, 'r') as _:
+            return json.load(_)
+    except (IOError, OSError, ValueError):
+        return default
+
+
+def dump_json(path, data):
+    """Atomically write DATA as json to PATH."""
+    atomic_write(path, json.dumps(data, indent=2, sort_keys=True))
+
+
+def atomic_write(path, contents, mode='w'):
+    """Write CONTENTS to PATH through a temp file and rename.
+
+    Readers either see the previous file or the new one, never a partial
+    write. Permissions of an existing PATH are preserved.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    try:
+        file_mode = os.stat(path).st_mode & 0o777
+    except OSError:
+        umask = os.umask(0)
+        os.umask(umask)
+        file_mode = 0o666 & ~umask
+
+    fd, tmp_path = tempfile.mkstemp(
+        dir=directory, prefix='.{}.'.format(os.path.basename(path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as _:
+            _.write(contents)
+        os.chmod(tmp_path, file_mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
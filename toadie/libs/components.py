@@ -3,6 +3,7 @@ __copyright__="Copyright (C) 2016 David Gonzalez"
 __author__="David 'Gonzo' Gonzalez"
 __license__="Apache License 2.0"
 
+import copy
 import os
 import sys
 import logging
@@ -10,8 +11,15 @@ import yaml
 from collections import defaultdict
 from yaml.representer import Representer
 import re
-import pkg_resources
 import click
+from .autoscale import AUTOSCALE_DEFAULTS
+from .baseimage import ProjectBaseImage, project_slug
+from .compose import open_compose
+from .dotenv import Dotenv
+from .templates import read_template, runtime_sources
+from ..runtime.logpolicy import DEFAULT_POLICY
+from ..runtime.metrics import METRICS_KEY
+from ..runtime.retry import RETRY_DEFAULTS
 
 
 logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
@@ -19,6 +27,30 @@ log = logging.getLogger(__name__)
 
 yaml.add_representer(defaultdict, Representer.represent_dict)
 
+# Body formats of the runtime codec registry and what they need installed.
+BODY_FORMATS = ['json', 'msgpack', 'ndarray', 'raw', 'text']
+CODEC_REQUIREMENTS = {'msgpack': ['msgpack'], 'ndarray': ['numpy']}
+
+# consume.py templates of the stack's own services.
+CONSUMER_TEMPLATES = {'logger': 'consume-logger.py', 'errlogger': 'consume-errlogger.py'}
+
+# Services collecting every component's logs, written to `./logs`.
+LOG_SINKS = ['logger', 'errlogger']
+# Their consumers hold many deliveries at once, acknowledged per fsync.
+SINK_RUNTIME = {
+    'concurrency': 2000,
+    'min_prefetch': 500,
+    'max_prefetch': 10000,
+    'ack_batch': 1000,
+    'ack_interval': 0.1,
+}
+
+# Dockerfile template and default image for each `--base`.
+BASE_IMAGES = {
+    'alpine': ('app.py', '{{python:alpine}}', 'python:alpine'),
+    'slim': ('app-slim.py', '{{python:slim}}', 'python:slim'),
+}
+
 
 class StackComponent(object):
     """This class generates stack components of type:
@@ -35,81 +67,108 @@ class StackComponent(object):
                  component_type,
                  project_path,
                  resource_package,
-                 verbose=False):
+                 verbose=False,
+                 compose=None,
+                 dotenv=None,
+                 base='alpine',
+                 body_format='text'):
+        """Pass a shared COMPOSE document and DOTENV to batch edits of
+        several components; the caller then flushes them once. Otherwise
+        each edit is written immediately."""
         self.component_name = component_name
         self.component_type = component_type
         self.project_dir = project_path
         self.resource_package = resource_package
         self.verbose = verbose
+        self.base = base
+        self.body_format = body_format
         self.parent_dir = os.path.join(project_path, component_type+"s")
         self.dotenv = os.path.join(self.project_dir, '.env')
-        if not os.path.exists(self.parent_dir):
-            os.mkdir(self.parent_dir)
-
+        self.owns_compose = compose is None
+        self.compose = open_compose(project_path) if compose is None else compose
+        self.owns_env = dotenv is None
+        self.env = Dotenv(self.dotenv) if dotenv is None else dotenv
+        # Components may be scaffolded concurrently; tolerate races on mkdir.
         self.component_dir = os.path.join(self.parent_dir, component_name)
-        if not os.path.exists(self.component_dir):
-            os.mkdir(self.component_dir)
+        os.makedirs(self.component_dir, exist_ok=True)
 
     def define_run(self):
         """Generate run script to be sourced in Dockerfile."""
-        contents = "#!/bin/sh\n"
-        with open(os.path.join(self.component_dir, 'run.sh'), 'w') as _:
+        contents = "#!/bin/sh\nexec python consume.py\n"
+        target_path = os.path.join(self.component_dir, 'run.sh')
+        with open(target_path, 'w') as _:
             _.write(contents)
+        os.chmod(target_path, 0o755)
+
+
+    def define_consumer(self):
+        """Generate consume.py and produce.py unless they exist, and vendor
+        the runtime they use."""
+        templates = {'consume.py': CONSUMER_TEMPLATES.get(self.component_name, 'consume.py'),
+                     'produce.py': 'produce.py'}
+        for script, template in templates.items():
+            target_path = os.path.join(self.component_dir, script)
+            if not os.path.exists(target_path):
+                with open(target_path, 'wb') as _:
+                    _.write(read_template(template, self.resource_package))
+        self.define_runtime()
+
+
+    def define_runtime(self):
+        """Copy the toadie runtime package into the component as `toadie_runtime`."""
+        runtime_dir = os.path.join(self.component_dir, 'toadie_runtime')
+        os.makedirs(runtime_dir, exist_ok=True)
+        for filename, source in runtime_sources().items():
+            with open(os.path.join(runtime_dir, filename), 'wb') as _:
+                _.write(source)
+
 
+    def define_dockerfile(self, default_baseimage=None):
+        """Generate Dockerfile that will be used by docker-compose.
 
-    def define_dockerfile(self,
-                          default_baseimage="python:alpine",):
-        """Generate Dockerfile that will be used by docker-compose."""
-        resource_path = os.path.join('templates', 'app.py')
-        template = pkg_resources.resource_string(
-            self.resource_package, resource_path)
-        dockerfile = template.decode('utf-8').replace(r'{{python:alpine}}', 'python:alpine')
+        The `slim` base builds a multi-stage image on glibc python whose wheels
+        come from a wheelhouse cache shared by all of the project's components.
+        Components inherit the project base image when one was generated.
+        """
+        template_name, placeholder, baseimage = BASE_IMAGES[self.base]
+        project_base = ProjectBaseImage(self.project_dir, self.resource_package)
+        if project_base.exists(self.base):
+            baseimage = project_base.image(self.base)
+        template = read_template(template_name, self.resource_package)
+        dockerfile = template.decode('utf-8').replace(
+            placeholder, default_baseimage or baseimage)
+        dockerfile = dockerfile.replace(
+            '{{wheelhouse}}', '{}-wheelhouse'.format(project_slug(self.project_dir)))
         with open(os.path.join(self.component_dir, 'Dockerfile'), 'w') as _:
             _.write(dockerfile)
 
 
     def add_lines_to_env(self, env_vars):
-        # Check contents of dotenv.example.
-        env_var_names = set()
-        with open(self.dotenv, 'r') as _:
-            lines = _.read().splitlines()
-            for line in lines:
-                k, v = line.split("=")
-                env_var_names.add(k)
-
-        if set(env_vars) not in env_var_names:
-            for var in env_vars:
-                env_var = "{}=__blank__".format(var)
-                with open(self.dotenv, 'a') as _:
-                    _.write(env_var+"\n")
-                    click.secho("""
-                                Added to .env:
-                                {}
-                                Please update.""".format(env_var),
-                                fg='yellow')
+        """Add ENV_VARS missing from .env with a blank value."""
+        for var in env_vars:
+            if self.env.add(var, '__blank__'):
+                click.secho("""
+                            Added to .env:
+                            {}=__blank__
+                            Please update.""".format(var),
+                            fg='yellow')
+        if self.owns_env:
+            self.env.flush()
 
 
     def update_docker_compose(self,
                               default_rabbit_link="rabbitmq",
                               toggle=False):
         """Generate docker-compose.yml"""
-        dc_filepath = os.path.join(self.project_dir, 'docker-compose.yml')
-        with open(dc_filepath, 'r') as _:
-            docker_compose = yaml.load(_)
-            # Ready docker-compose for munging.
-            docker_compose.pop('version')
-
-        # this refers to docker-compose.yml version 2 services entry
-        if 'services' not in docker_compose:
-            docker_compose['services'] = dict()
+        docker_compose = self.compose
 
         # Check if queue dependencies are already declared. Add if missing.
-        if 'rabbitmq' not in docker_compose['services']:
-            queue_stack = defaultdict(dict)
-            queue_stack['rabbitmq']['image'] = 'rabbitmq:management'
-            queue_stack['rabbitmq']['ports'] = ["5672:5672", "15672:15672"]
-            queue_stack['rabbitmq']['env_file'] = [".env"]
-            docker_compose['services'].update(queue_stack)
+        if not docker_compose.has_service('rabbitmq'):
+            docker_compose.set_service('rabbitmq', {
+                'image': 'rabbitmq:management',
+                'ports': ["5672:5672", "15672:15672"],
+                'env_file': [".env"],
+            })
             env_vars = [
                 "RABBITMQ_DEFAULT_USER",
                 "RABBITMQ_DEFAULT_PASS"
@@ -117,15 +176,15 @@ class StackComponent(object):
 
             self.add_lines_to_env(env_vars)
 
-        if toggle and self.component_name in docker_compose['services']:
+        if toggle and docker_compose.has_service(self.component_name):
             # Remove entry
-            docker_compose['services'].pop(self.component_name)
+            docker_compose.remove_service(self.component_name)
             status = 'disabled'
         else:
             # Add new service components to stack.
-            new_service = defaultdict(dict)
+            new_service = dict()
             _, parent_rel_dir = os.path.split(self.parent_dir)
-            new_service[self.component_name]['build'] = './{}/{}'.format(
+            new_service['build'] = './{}/{}'.format(
                 parent_rel_dir, self.component_name)
 
             if re.match(r"^mock_for.*", self.component_name):
@@ -134,13 +193,15 @@ class StackComponent(object):
             else:
                 links = [default_rabbit_link,]
 
-            new_service[self.component_name]['links'] = links
-            docker_compose['services'].update(new_service)
+            new_service['links'] = links
+            new_service['env_file'] = [".env"]
+            if self.component_name in LOG_SINKS:
+                new_service['volumes'] = ['./logs:/app/logs']
+            docker_compose.set_service(self.component_name, new_service)
             status = 'enabled'
 
-        with open(os.path.join(self.project_dir, 'docker-compose.yml'), 'w') as _:
-            _.write("version: '2.0'\n")
-            _.write(yaml.dump(docker_compose, default_flow_style=False))
+        if self.owns_compose:
+            docker_compose.flush()
 
         return status
 
@@ -148,6 +209,7 @@ class StackComponent(object):
         promise['logqueue']['bindings'] = dict(topic=[
             "{}.log.INFO".format(self.component_name),
             "{}.log.DEBUG".format(self.component_name),
+            "{}.log.WARNING".format(self.component_name),
             "{}.log.ERROR".format(self.component_name),
         ])
         promise['logqueue']['exchange'] = log_exchange
@@ -160,18 +222,33 @@ class StackComponent(object):
         return promise
 
 
-    def define_promise_yml(self, mock=False):
-        '''Create promise.yml file.'''
-        # Create boilerplate services.
-        component_promise = dict()
-        component_promise['{}'.format(self.component_name)] = defaultdict(dict)
-        promise = component_promise['{}'.format(self.component_name)]
-
-        if self.component_name not in ['logger', 'errlogger']:
-            log_exchange = {'name':'logExchange', 'type':'direct'}
-            promise.update(self.add_logqueue(promise, log_exchange))
-            promise.update(self.add_errqueue(promise, log_exchange))
-
+    def sink_inqueues(self):
+        """Inqueues of the logger and errlogger on the log exchange."""
+        log_exchange = {'name': 'logExchange', 'type': 'topic'}
+        if self.component_name == 'errlogger':
+            return [{
+                'bindings': {'topics': ['*.ERROR']},
+                'exchange': log_exchange,
+                'name': 'errloggerInQueue0',
+                'body': {'format': 'text', 'message': 'Hello, from errloggerInQueue0'},
+            }]
+        return [{
+            'bindings': {'topics': ['*.log.*']},
+            'exchange': log_exchange,
+            'name': 'loggerInQueue0',
+            'body': {'format': 'text', 'message': 'Hello, from loggerInQueue0'},
+        }, {
+            'bindings': {'topics': [METRICS_KEY.format('*')]},
+            'exchange': log_exchange,
+            'name': 'loggerMetricsQueue',
+            'body': {'format': 'json',
+                     'message': {'component': 'sample', 'time': 0, 'interval': 10,
+                                 'counters': {}, 'histograms': {}}},
+        }]
+
+
+    def add_component_queues(self, promise, mock=False):
+        """Add the boilerplate inqueue, unless MOCK, and outqueue to PROMISE."""
         # Boilerplate component topic exchange.
         component_exchange = {
             'name':'{}Exchange'.format(self.component_name),
@@ -183,7 +260,7 @@ class StackComponent(object):
             inqueue['exchange'] = component_exchange
             inqueue['name'] = '{}InQueue0'.format(self.component_name)
             inqueue['body']['message'] = 'Hello, from {}'.format(inqueue['name'])
-            inqueue['body']['format'] = 'text'
+            inqueue['body']['format'] = self.body_format
             promise['inqueues'] = list()
             promise['inqueues'].append(inqueue)
         # Create boilerplate outqueue and add to promise.
@@ -192,20 +269,57 @@ class StackComponent(object):
         outqueue['exchange'] = component_exchange
         outqueue['name'] = '{}OutQueue0'.format(self.component_name)
         outqueue['body']['message'] = 'Hello, from {}'.format(outqueue['name'])
-        outqueue['body']['format'] = 'text'
+        outqueue['body']['format'] = self.body_format
         promise['outqueues'] = list()
         promise['outqueues'].append(outqueue)
+        return promise
+
+
+    def define_promise_yml(self, mock=False):
+        '''Create promise.yml file.'''
+        # Create boilerplate services.
+        component_promise = dict()
+        component_promise['{}'.format(self.component_name)] = defaultdict(dict)
+        promise = component_promise['{}'.format(self.component_name)]
+
+        if self.component_name in LOG_SINKS:
+            # Sinks of every component's logs: no outqueues, large batches.
+            promise['inqueues'] = self.sink_inqueues()
+            promise['runtime'] = dict(SINK_RUNTIME)
+        else:
+            log_exchange = {'name':'logExchange', 'type':'topic'}
+            promise.update(self.add_logqueue(promise, log_exchange))
+            promise.update(self.add_errqueue(promise, log_exchange))
+            promise['logpolicy'] = copy.deepcopy(DEFAULT_POLICY)
+            if self.component_type == 'task':
+                promise['autoscale'] = dict(AUTOSCALE_DEFAULTS)
+            if not mock:
+                promise['retry'] = copy.deepcopy(RETRY_DEFAULTS)
+            self.add_component_queues(promise, mock)
         target_path = os.path.join(self.component_dir, 'promise.yml')
         with open(target_path, 'w') as _:
             _.write(yaml.dump(component_promise, default_flow_style=False))
 
 
-    def define_requirments(self):
-        """Generate requirements.txt file."""
+    def define_requirments(self, extra_requirements=None):
+        """Generate requirements.txt file.
+
+        Requirements already listed are kept; missing ones are appended,
+        except those installed in the project base image it inherits.
+        """
         target_path = os.path.join(self.component_dir, 'requirements.txt')
-        requirements = ['pika',]
+        requirements = ['aio-pika', 'PyYAML'] + list(extra_requirements or [])
+        requirements += CODEC_REQUIREMENTS.get(self.body_format, [])
+        project_base = ProjectBaseImage(self.project_dir, self.resource_package)
+        inherited = project_base.requirements(self.base)
+        requirements = [req for req in requirements if req not in inherited]
+        existing = list()
+        if os.path.isfile(target_path):
+            with open(target_path, 'r') as _:
+                existing = [line.strip() for line in _.read().splitlines()]
+        missing = [req for req in requirements if req not in existing]
         with open(target_path, 'a') as _:
-            for req in requirements:
+            for req in sorted(set(missing), key=missing.index):
                 _.write(req+"\n")
 
 
@@ -217,15 +331,22 @@ class StackComponent(object):
                 - promise.yml
                 - run.sh
                 - Dockerfile
-                - comsume.py
+                - consume.py
                 - produce.py
+                - toadie_runtime/
         """
 
+        self.define_queue_files()
+        self.update_docker_compose()
+
+
+    def define_queue_files(self, extra_requirements=None):
+        """Write the files of a queue component; docker-compose is untouched."""
         self.define_run()
         self.define_dockerfile()
-        self.update_docker_compose()
         self.define_promise_yml()
-        self.define_requirments()
+        self.define_consumer()
+        self.define_requirments(extra_requirements)
 
 
     def create_mock_component(self):
@@ -233,6 +354,7 @@ class StackComponent(object):
         self.define_run()
         self.define_dockerfile()
         self.define_promise_yml(mock=True)
+        self.define_consumer()
         self.define_requirments()
 
 
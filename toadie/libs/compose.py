@@ -0,0 +1,283 @@
+import os
+import threading
+import yaml
+from .cache import atomic_write, dump_json, load_json, project_cache_dir
+from .timings import phase
+
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
+
+
+COMPOSE_FILE = 'docker-compose.yml'
+COMPOSE_VERSION = '2.0'
+
+# Fragmented layout: docker-compose.yml keeps the shared services, each
+# component's service lives in a fragment in its own directory and the
+# index lists the fragments, in `-f` order after docker-compose.yml.
+COMPOSE_INDEX = 'docker-compose.files'
+FRAGMENT_FILE = 'docker-compose.fragment.yml'
+INDEX_HEADER = "# Compose fragments, passed to docker-compose with `-f` after docker-compose.yml.\n"
+# All files merged into one, rendered on demand for tools reading a single file.
+MERGED_FILE = 'docker-compose.merged.yml'
+MERGED_CACHE = 'compose-merged.json'
+
+
+def load_yaml(stream):
+    """Parse yaml with libyaml when available."""
+    return yaml.load(stream, Loader=SafeLoader)
+
+
+def dump_yaml(data):
+    """Serialize DATA in block style with libyaml when available."""
+    return yaml.dump(data, Dumper=SafeDumper, default_flow_style=False)
+
+
+class ComposeDocument(object):
+    """A docker-compose.yml loaded once and mutated in memory.
+
+    Any number of StackComponent operations can share one document; nothing
+    touches disk until `flush`, which writes through a temp file and rename.
+    Used as a context manager it flushes on a clean exit.
+    """
+    def __init__(self, project_path, filename=COMPOSE_FILE, missing_ok=False):
+        self.path = os.path.join(project_path, filename)
+        self.lock = threading.RLock()
+        self.version = COMPOSE_VERSION
+        self.missing_ok = missing_ok
+        self.dirty = False
+        self._data = None
+
+    @property
+    def data(self):
+        with self.lock:
+            if self._data is None:
+                if self.missing_ok and not os.path.exists(self.path):
+                    self._data = dict(services=dict())
+                    return self._data
+                with phase('parse {}'.format(os.path.basename(self.path))):
+                    with open(self.path, 'r') as _:
+                        data = load_yaml(_) or dict()
+                self.version = str(data.pop('version', COMPOSE_VERSION))
+                # this refers to docker-compose.yml version 2 services entry
+                if not data.get('services'):
+                    data['services'] = dict()
+                self._data = data
+            return self._data
+
+    @property
+    def services(self):
+        return self.data['services']
+
+    def has_service(self, name):
+        return name in self.services
+
+    def set_service(self, name, definition):
+        with self.lock:
+            self.services[name] = definition
+            self.dirty = True
+
+    def remove_service(self, name):
+        with self.lock:
+            definition = self.services.pop(name, None)
+            self.dirty = True
+            return definition
+
+    def render(self):
+        with self.lock:
+            return "version: '{}'\n".format(self.version) + dump_yaml(self.data)
+
+    def flush(self):
+        """Write the document if it changed. Returns True if written."""
+        with self.lock:
+            if not self.dirty:
+                return False
+            with phase('write {}'.format(os.path.basename(self.path))):
+                atomic_write(self.path, self.render())
+            self.dirty = False
+            return True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+
+def uses_fragments(project_path):
+    """True if the project's compose services are split into fragments."""
+    return os.path.isfile(os.path.join(project_path, COMPOSE_INDEX))
+
+
+def read_index(project_path):
+    """Fragment paths listed in the index, relative to the project."""
+    try:
+        with open(os.path.join(project_path, COMPOSE_INDEX), 'r') as _:
+            lines = [line.strip() for line in _]
+    except (IOError, OSError):
+        return list()
+    return [line for line in lines if line and not line.startswith('#')]
+
+
+def compose_files(project_path):
+    """Every compose file of the project, relative to it, in `-f` order."""
+    if not uses_fragments(project_path):
+        return [COMPOSE_FILE]
+    return [COMPOSE_FILE] + read_index(project_path)
+
+
+def compose_command(project_path):
+    """docker-compose invoked with every compose file of the project."""
+    command = ['docker-compose']
+    if uses_fragments(project_path):
+        for path in compose_files(project_path):
+            command += ['-f', path]
+    return command
+
+
+def fragment_path(definition):
+    """Fragment of a service built from a component directory, or None."""
+    build = definition.get('build')
+    if isinstance(build, dict):
+        build = build.get('context')
+    if not build:
+        return None
+    return os.path.normpath(os.path.join(build, FRAGMENT_FILE))
+
+
+class ComposeFragments(object):
+    """Compose services split into one fragment per component.
+
+    Services built from a component directory live in a fragment next to
+    its Dockerfile; others, such as rabbitmq, stay in docker-compose.yml.
+    Fragments are only parsed when one of their services is edited, so an
+    edit reads and writes one small file plus, when services are added or
+    removed, the index. Build paths stay relative to the project, which
+    docker-compose resolves from the first `-f` file. Offers the
+    ComposeDocument interface.
+    """
+    def __init__(self, project_path):
+        self.project_path = project_path
+        self.lock = threading.RLock()
+        self.base = ComposeDocument(project_path)
+        self.documents = dict()
+        self.index_dirty = False
+        self._index = None
+
+    @property
+    def index(self):
+        """{service: fragment path}, a service being named after its directory."""
+        with self.lock:
+            if self._index is None:
+                self._index = dict((os.path.basename(os.path.dirname(path)), path)
+                                   for path in read_index(self.project_path))
+            return self._index
+
+    def document(self, path):
+        with self.lock:
+            if path not in self.documents:
+                self.documents[path] = ComposeDocument(
+                    self.project_path, path, missing_ok=True)
+            return self.documents[path]
+
+    @property
+    def services(self):
+        """Services of every file merged; parses them all."""
+        with self.lock:
+            services = dict(self.base.services)
+            for name, path in self.index.items():
+                services.update(self.document(path).services)
+            return services
+
+    def has_service(self, name):
+        return name in self.index or self.base.has_service(name)
+
+    def set_service(self, name, definition):
+        path = fragment_path(definition)
+        with self.lock:
+            if path is None:
+                self.base.set_service(name, definition)
+                return
+            self.document(path).set_service(name, definition)
+            if self.index.get(name) != path:
+                self.index[name] = path
+                self.index_dirty = True
+
+    def remove_service(self, name):
+        with self.lock:
+            path = self.index.pop(name, None)
+            if path is None:
+                return self.base.remove_service(name)
+            self.index_dirty = True
+            return self.document(path).remove_service(name)
+
+    def render(self):
+        """The merged compose file."""
+        with self.lock:
+            return "version: '{}'\n".format(self.base.version) + \
+                dump_yaml(dict(self.base.data, services=self.services))
+
+    def flush(self):
+        """Write changed fragments, docker-compose.yml and the index.
+        Fragments left without services are deleted. Returns True if
+        anything was written."""
+        with self.lock:
+            written = self.base.flush()
+            for document in self.documents.values():
+                if document.dirty and not document.services:
+                    if os.path.exists(document.path):
+                        os.unlink(document.path)
+                    document.dirty = False
+                    written = True
+                else:
+                    written = document.flush() or written
+            if self.index_dirty:
+                with phase('write {}'.format(COMPOSE_INDEX)):
+                    atomic_write(os.path.join(self.project_path, COMPOSE_INDEX),
+                                 INDEX_HEADER + "".join(
+                                     path + "\n" for path in sorted(self.index.values())))
+                self.index_dirty = False
+                written = True
+            return written
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+
+def open_compose(project_path):
+    """The project's compose services in whichever layout it uses."""
+    if uses_fragments(project_path):
+        return ComposeFragments(project_path)
+    return ComposeDocument(project_path)
+
+
+def merged_compose(project_path):
+    """Path of one compose file with all of the project's services.
+
+    That is docker-compose.yml itself, unless the project uses fragments:
+    then they are merged into docker-compose.merged.yml, rendered again
+    only when a compose file or the index changed since the last time.
+    """
+    if not uses_fragments(project_path):
+        return os.path.join(project_path, COMPOSE_FILE)
+    stamps = dict()
+    for path in [COMPOSE_INDEX] + compose_files(project_path):
+        try:
+            stat = os.stat(os.path.join(project_path, path))
+        except OSError:
+            continue
+        stamps[path] = [stat.st_mtime_ns, stat.st_size]
+    merged_path = os.path.join(project_path, MERGED_FILE)
+    cache_path = os.path.join(project_cache_dir(project_path), MERGED_CACHE)
+    if load_json(cache_path) == stamps and os.path.isfile(merged_path):
+        return merged_path
+    with phase('render {}'.format(MERGED_FILE)):
+        atomic_write(merged_path, ComposeFragments(project_path).render())
+    dump_json(cache_path, stamps)
+    return merged_path
@@ -0,0 +1,123 @@
+from collections import Counter, namedtuple
+from .project import Project
+from ..runtime.promise import amqp_url
+from ..runtime.retry import (ATTEMPTS_HEADER, DEAD_LETTER_QUEUE, ERROR_HEADER,
+                             QUEUE_HEADER, replay_route, retry_policy)
+
+
+# Dead letters fetched, then republished and acknowledged, at once.
+REPLAY_BATCH = 100
+
+DeadLetter = namedtuple('DeadLetter', ['queue', 'attempts', 'error', 'size', 'body'])
+
+
+class DeadLetterError(Exception):
+    pass
+
+
+def dead_letter(message):
+    headers = message.headers or dict()
+    return DeadLetter(headers.get(QUEUE_HEADER), headers.get(ATTEMPTS_HEADER),
+                      headers.get(ERROR_HEADER), len(message.body), bytes(message.body))
+
+
+def summarize(letters):
+    """[(count, inqueue, error)] of LETTERS, most frequent first."""
+    counts = Counter((letter.queue, letter.error) for letter in letters)
+    return sorted(((count, queue, error) for (queue, error), count in counts.items()),
+                  key=lambda row: (-row[0], str(row[1]), str(row[2])))
+
+
+class DeadLetters(object):
+    """The dead letter queue of a component with a `retry` policy.
+
+    Dead letters are read over AMQP without being consumed, or replayed:
+    sent back to the inqueue they failed in with every attempt available
+    again, in batches acknowledged once their republish is confirmed.
+    """
+    def __init__(self, project_path, component, url=None):
+        promise = (Project(project_path).components.get(component) or {}).get('promise')
+        if promise is None:
+            raise DeadLetterError("No promise.yml found for `{}`.".format(component))
+        if retry_policy(promise) is None:
+            raise DeadLetterError("`{}` has no retry policy in its promise.yml.".format(component))
+        self.component = component
+        self.promise = promise
+        self.queue_name = DEAD_LETTER_QUEUE.format(component)
+        self.url = url or amqp_url()
+        self.connection = None
+
+    async def connect(self):
+        import aio_pika
+        from ..runtime.declare import declare_promise
+
+        self.connection = await aio_pika.connect_robust(self.url)
+        channel = await self.connection.channel()
+        exchanges, queues = await declare_promise(channel, self.promise, self.component)
+        return channel, queues[self.queue_name]
+
+    async def close(self):
+        if self.connection is not None:
+            await self.connection.close()
+            self.connection = None
+
+    async def fetch(self, queue, limit):
+        messages = list()
+        while len(messages) < limit:
+            message = await queue.get(no_ack=False, fail=False)
+            if message is None:
+                break
+            messages.append(message)
+        return messages
+
+    async def inspect(self, limit=100):
+        """Return (queued dead letters, up to LIMIT of them as DeadLetters)."""
+        try:
+            channel, queue = await self.connect()
+            messages = await self.fetch(queue, limit)
+            for message in messages:
+                await message.nack(requeue=True)
+            total = queue.declaration_result.message_count
+        finally:
+            await self.close()
+        return total, [dead_letter(message) for message in messages]
+
+    async def replay(self, limit=None, on_batch=None):
+        """Send up to LIMIT dead letters back to their inqueues; all those
+        queued when it starts by default. Messages not dead-lettered by
+        the runtime, without an inqueue header, are left in the queue.
+        Returns (replayed, left) counts."""
+        from ..runtime.producer import Producer
+
+        replayed = 0
+        foreign = list()
+        try:
+            channel, queue = await self.connect()
+            limit = queue.declaration_result.message_count if limit is None else limit
+            producer = await Producer(self.component, self.promise,
+                                      connection=self.connection).start()
+            while replayed + len(foreign) < limit:
+                messages = await self.fetch(
+                    queue, min(REPLAY_BATCH, limit - replayed - len(foreign)))
+                if not messages:
+                    break
+                batch = list()
+                for message in messages:
+                    if QUEUE_HEADER not in (message.headers or {}):
+                        foreign.append(message)
+                        continue
+                    exchange, key, headers = replay_route(self.component, message.headers)
+                    await producer.publish(exchange, key, message.body, headers)
+                    batch.append(message)
+                # Unacknowledged dead letters return to the queue if this fails.
+                await producer.flush()
+                for message in batch:
+                    await message.ack()
+                replayed += len(batch)
+                if on_batch is not None:
+                    on_batch(replayed)
+            for message in foreign:
+                await message.nack(requeue=True)
+        finally:
+            await self.close()
+        return replayed, len(foreign)
@@ -1,8 +1,13 @@
+import os
+import shutil
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from distutils.version import LooseVersion
 import re
 from collections import defaultdict
 from sys import platform
+from .timings import phase
+from .cache import user_cache_dir, load_json, dump_json
 
 
 DOCKER_ENGINE_URL = "https://docs.docker.com/engine/installation/linux/"
@@ -17,6 +22,12 @@ CONDA_V = "3.18.6"
 VBOX_V = "5.0.14r105127"
 VBOX_URL = "https://www.virtualbox.org/wiki/Downloads"
 
+# Seconds a single `<tool> -v` probe may take before it is abandoned.
+PROBE_TIMEOUT = 10
+PROBE_CACHE = os.path.join(user_cache_dir(), 'probes.json')
+# Returned by `Tools.probe` when the tool did not answer within its timeout.
+PROBE_TIMED_OUT = object()
+
 
 class Tools:
     def __init__(self, verbose=False):
@@ -39,7 +50,36 @@ class Tools:
                      'vboxmanage':DOCKER_TOOLBOX_URL}
         return tools[tool]
 
-    def check_tools(self):
+    def probe(self, tool, flag, timeout=PROBE_TIMEOUT):
+        """Run `TOOL FLAG` and return its output.
+
+        Returns None when TOOL cannot be run and PROBE_TIMED_OUT when it did
+        not answer within TIMEOUT seconds.
+        """
+        try:
+            completed = subprocess.run(
+                [tool, flag],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                universal_newlines=True,
+                timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return PROBE_TIMED_OUT
+        except OSError:
+            return None
+        return completed.stdout.strip()
+
+    def check_tools(self, refresh=False, timeout=PROBE_TIMEOUT):
+        """Return install status of every required tool.
+
+        Probes run concurrently. Versions are cached in PROBE_CACHE keyed on
+        the resolved binary path and mtime, so a tool is only re-probed when
+        it is installed, upgraded or moved; `refresh` ignores the cache.
+
+        Each tool gets a `status` of `ok`, `outdated`, `missing`, `timeout`
+        (the probe did not answer in time; never cached) or `unknown` (its
+        version could not be parsed).
+        """
         tool_statuses = defaultdict(dict)
         parse_tools = [
             ('docker','-v', DOCKER_ENGINE_V,
@@ -57,18 +97,76 @@ class Tools:
             ('vboxmanage','-v', VBOX_V,
              re.compile(r'(.*)$'),
              VBOX_URL)]
+
+        cache = dict() if refresh else load_json(PROBE_CACHE, dict())
+        binaries = dict()
+        for tool in parse_tools:
+            path = shutil.which(tool[0])
+            if path is not None:
+                path = os.path.realpath(path)
+                binaries[tool[0]] = (path, os.stat(path).st_mtime)
+
+        # Probe, concurrently, installed tools whose cache entry is stale.
+        stale = [tool for tool in parse_tools
+                 if tool[0] in binaries
+                 and cache.get(tool[0], {}).get('key') != list(binaries[tool[0]])]
+        if stale:
+            with ThreadPoolExecutor(max_workers=len(stale)) as pool:
+                with phase('probe {} tools'.format(len(stale))):
+                    outputs = list(pool.map(
+                        lambda tool: self.probe(binaries[tool[0]][0], tool[1], timeout),
+                        stale))
+                for tool, output in zip(stale, outputs):
+                    tool_statuses[tool[0]]['cached'] = False
+                    if output is PROBE_TIMED_OUT:
+                        cache.pop(tool[0], None)
+                        tool_statuses[tool[0]]['timed_out'] = True
+                        tool_statuses[tool[0]]['version'] = None
+                        continue
+                    try:
+                        version = tool[3].match(output).group(1)
+                    except (TypeError, AttributeError):
+                        version = None
+                    entry = dict(key=list(binaries[tool[0]]), version=version)
+                    # A failed probe says nothing about the tool; retry next run.
+                    if output is not None:
+                        cache[tool[0]] = entry
+                    else:
+                        cache.pop(tool[0], None)
+                    tool_statuses[tool[0]]['version'] = version
+            dump_json(PROBE_CACHE, cache)
+
         for tool in parse_tools:
             install_url = self.get_platform_tools(tool[0])
             tool_statuses[tool[0]]['install_url'] = install_url
-            try:
-                parse_version = tool[3]
-                version = parse_version.match(
-                    subprocess.getoutput(tool[0]+" "+tool[1])).group(1)
-            except:
+            if tool[0] not in binaries:
+                tool_statuses[tool[0]]['path'] = None
+                tool_statuses[tool[0]]['cached'] = False
                 tool_statuses[tool[0]]['version'] = None
+            else:
+                tool_statuses[tool[0]]['path'] = binaries[tool[0]][0]
+                if 'version' not in tool_statuses[tool[0]]:
+                    tool_statuses[tool[0]]['cached'] = True
+                    tool_statuses[tool[0]]['version'] = cache[tool[0]]['version']
+            timed_out = tool_statuses[tool[0]].pop('timed_out', False)
+            version = tool_statuses[tool[0]]['version']
+            if version is None:
                 tool_statuses[tool[0]]['version_passes'] = False
             else:
-                version_passes = LooseVersion(version) >= LooseVersion(tool[2])
-                tool_statuses[tool[0]]['version'] = version
+                try:
+                    version_passes = LooseVersion(version) >= LooseVersion(tool[2])
+                except TypeError:
+                    version_passes = False
                 tool_statuses[tool[0]]['version_passes'] = version_passes
+            if tool[0] not in binaries:
+                status = 'missing'
+            elif timed_out:
+                status = 'timeout'
+            elif version is None:
+                status = 'unknown'
+            elif not tool_statuses[tool[0]]['version_passes']:
+                status = 'outdated'
+            else:
+                status = 'ok'
+            tool_statuses[tool[0]]['status'] = status
         return tool_statuses
@@ -0,0 +1,281 @@
+import glob
+import hashlib
+import json
+import os
+import re
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .cache import project_cache_dir, dump_json, load_json
+from .compose import load_yaml, merged_compose
+from .components import LOG_SINKS
+from .timings import phase
+
+
+DEPLOY_STATE = 'deployed.json'
+# Compose files written by build-tag-push.py, named after their image tag.
+STACK_FILES = 'docker-compose-[0-9]*.yml'
+# Deployed before anything else, tier by tier; every component needs them.
+FOUNDATION = [['rabbitmq'], LOG_SINKS]
+FINGERPRINT_FIELDS = ['image', 'env', 'links', 'config']
+
+
+class DeployError(Exception):
+    pass
+
+
+def digest(data):
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def latest_stack_file(project_path):
+    """The newest compose file of build-tag-push.py, or the project's own."""
+    paths = sorted(glob.glob(os.path.join(project_path, STACK_FILES)),
+                   key=lambda path: int(re.sub(r'\D', '', os.path.basename(path))))
+    return paths[-1] if paths else merged_compose(project_path)
+
+
+def load_stack(path):
+    """{service: definition} of the compose file in PATH."""
+    try:
+        with open(path, 'r') as _:
+            data = load_yaml(_) or dict()
+    except (IOError, OSError) as err:
+        raise DeployError("Cannot read {}: {}".format(path, err))
+    return data.get('services') or dict()
+
+
+def env_lines(path):
+    """Variable lines of a dotenv file, sorted; comments are left out."""
+    try:
+        with open(path, 'r') as _:
+            lines = _.read().splitlines()
+    except (IOError, OSError):
+        return list()
+    return sorted(line.strip() for line in lines
+                  if '=' in line and not line.lstrip().startswith('#')
+                  and not line.startswith('COMMENT='))
+
+
+def as_list(value):
+    if value is None:
+        return list()
+    return [value] if isinstance(value, str) else list(value)
+
+
+def service_links(definition):
+    """Services DEFINITION links to or depends on, without aliases."""
+    names = [link.split(':')[0] for link in as_list(definition.get('links'))]
+    depends_on = definition.get('depends_on') or list()
+    names.extend(depends_on if isinstance(depends_on, list) else sorted(depends_on))
+    return sorted(set(names))
+
+
+def fingerprint(definition, base_dir):
+    """What a deployed service is compared on.
+
+    `image` is the registry reference, which build-tag-push.py only
+    changes when a build context's digest changed. `env` hashes the
+    variables of its env_files and `environment`, so secrets are not
+    recorded; `config` hashes the rest of the definition.
+    """
+    env = [env_lines(os.path.join(base_dir, path)) for path in as_list(definition.get('env_file'))]
+    rest = dict((k, v) for k, v in definition.items()
+                if k not in ('image', 'env_file', 'environment', 'links', 'depends_on'))
+    return dict(image=definition.get('image') or definition.get('build'),
+                env=digest([env, definition.get('environment')]),
+                links=service_links(definition),
+                config=digest(rest))
+
+
+def diff(deployed, stack, base_dir):
+    """Changes from DEPLOYED fingerprints to the services of STACK.
+
+    Returns ({service: [changed fields], or ['new']}, [removed services],
+    {service: fingerprint} of STACK).
+    """
+    fingerprints = dict((name, fingerprint(definition, base_dir))
+                        for name, definition in stack.items())
+    changed = dict()
+    for name, current in fingerprints.items():
+        previous = deployed.get(name)
+        if previous is None:
+            changed[name] = ['new']
+            continue
+        fields = [f for f in FINGERPRINT_FIELDS if previous.get(f) != current[f]]
+        if fields:
+            changed[name] = fields
+    removed = sorted(set(deployed) - set(stack))
+    return changed, removed, fingerprints
+
+
+def rollout_waves(stack, services):
+    """SERVICES of STACK grouped in waves, each after what it links to.
+
+    rabbitmq and the log sinks come first; every service of a wave only
+    depends on services of earlier waves or not being rolled out.
+    """
+    tiers = dict((name, number) for number, tier in enumerate(FOUNDATION) for name in tier)
+    depends = dict()
+    for name in services:
+        tier = tiers.get(name, len(FOUNDATION))
+        needs = set(service_links(stack[name])) & set(services)
+        needs |= set(other for other in services if tiers.get(other, len(FOUNDATION)) < tier)
+        depends[name] = needs - set([name])
+    waves = list()
+    done = set()
+    while len(done) < len(depends):
+        wave = sorted(name for name, needs in depends.items()
+                      if name not in done and needs <= done)
+        if not wave:
+            raise DeployError("Services link to each other in a cycle: {}".format(
+                ", ".join(sorted(set(depends) - done))))
+        waves.append(wave)
+        done.update(wave)
+    return waves
+
+
+class ComposeBackend(object):
+    """Roll services out with `docker-compose up -d --no-deps`, one at a time
+    per service, so containers of other services are left running."""
+    def __init__(self, project_path):
+        self.project_path = project_path
+
+    def compose(self, stack_file, *args):
+        command = ['docker-compose', '-f', stack_file] + list(args)
+        try:
+            subprocess.check_output(command, cwd=self.project_path, stderr=subprocess.STDOUT)
+        except OSError as err:
+            raise DeployError("{}: {}".format(' '.join(command), err))
+        except subprocess.CalledProcessError as err:
+            raise DeployError("{}: {}".format(' '.join(command),
+                                              err.output.decode('utf-8', 'replace').strip()))
+
+    def deploy(self, service, stack_file):
+        self.compose(stack_file, 'up', '-d', '--no-deps', service)
+
+    def remove(self, service, stack_file):
+        """Remove SERVICE, defined in STACK_FILE, the last deployed file."""
+        if not stack_file or not os.path.isfile(os.path.join(self.project_path, stack_file)):
+            raise DeployError("Cannot remove {}: the file it was deployed from is gone".format(
+                service))
+        self.compose(stack_file, 'rm', '--stop', '--force', service)
+
+
+class DryRunBackend(object):
+    """Record rollout steps without applying them."""
+    def __init__(self, project_path=None, delay=0):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.applied = list()
+
+    def deploy(self, service, stack_file):
+        time.sleep(self.delay)
+        with self.lock:
+            self.applied.append(('deploy', service))
+
+    def remove(self, service, stack_file):
+        with self.lock:
+            self.applied.append(('remove', service))
+
+
+BACKENDS = dict()
+
+
+def register_backend(name, backend):
+    """Make BACKEND, a factory taking the project path of objects with
+    `deploy(service, stack_file)` and `remove(service, stack_file)`,
+    selectable by NAME."""
+    BACKENDS[name] = backend
+
+
+register_backend('compose', ComposeBackend)
+register_backend('dry-run', DryRunBackend)
+
+
+class Deployer(object):
+    """Roll out only the services that changed since the last deploy.
+
+    Fingerprints of the deployed services are kept in
+    `.toadie/deployed.json`. Changed services are deployed in waves of
+    dependency order, up to PARALLEL at once; a wave starts once the
+    previous one succeeded. Services gone from the stack are removed last.
+    The state records each service as soon as it is rolled out, so a
+    failed deploy resumes where it stopped.
+    """
+    def __init__(self, project_path, backend, stack_file=None, parallel=4, record=True):
+        self.project_path = project_path
+        self.backend = backend
+        self.stack_path = stack_file or latest_stack_file(project_path)
+        self.stack_file = os.path.relpath(self.stack_path, project_path)
+        self.parallel = parallel
+        self.record = record
+        self.state_path = os.path.join(project_cache_dir(project_path), DEPLOY_STATE)
+        self.state = load_json(self.state_path, dict())
+        self.lock = threading.Lock()
+        self._plan = None
+
+    @property
+    def deployed(self):
+        return self.state.get('services') or dict()
+
+    def plan(self):
+        """{waves: [[service]], changes: {service: [fields]}, removed: [service]}."""
+        if self._plan is None:
+            with phase('plan deploy'):
+                stack = load_stack(self.stack_path)
+                changes, removed, self.fingerprints = diff(
+                    self.deployed, stack, os.path.dirname(os.path.abspath(self.stack_path)))
+                self._plan = dict(waves=rollout_waves(stack, changes), changes=changes,
+                                  removed=removed)
+        return self._plan
+
+    def deployed_service(self, service, fingerprint):
+        with self.lock:
+            services = self.state.setdefault('services', dict())
+            if fingerprint is None:
+                services.pop(service, None)
+            else:
+                services[service] = fingerprint
+            if self.record:
+                dump_json(self.state_path, self.state)
+
+    def deploy(self, service):
+        self.backend.deploy(service, self.stack_file)
+        self.deployed_service(service, self.fingerprints[service])
+        return service
+
+    def remove(self, service):
+        self.backend.remove(service, self.state.get('file'))
+        self.deployed_service(service, None)
+        return service
+
+    def apply(self, on_done=None):
+        """Roll the plan out. Returns the services deployed or removed;
+        raises DeployError naming those that failed once a wave is over."""
+        plan = self.plan()
+        done = list()
+        steps = [(self.deploy, wave) for wave in plan['waves']]
+        if plan['removed']:
+            steps.append((self.remove, plan['removed']))
+        with ThreadPoolExecutor(max_workers=self.parallel) as pool:
+            for action, services in steps:
+                futures = [(service, pool.submit(action, service)) for service in services]
+                failed = list()
+                for service, future in futures:
+                    try:
+                        future.result()
+                    except DeployError as err:
+                        failed.append("{} ({})".format(service, err))
+                        continue
+                    done.append(service)
+                    if on_done is not None:
+                        on_done(action.__name__, service)
+                if failed:
+                    raise DeployError("Failed: {}".format("; ".join(failed)))
+        with self.lock:
+            self.state.update(file=self.stack_file, time=time.time())
+            if self.record:
+                dump_json(self.state_path, self.state)
+        return done
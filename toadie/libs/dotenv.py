@@ -0,0 +1,48 @@
+import os
+
+
+class Dotenv(object):
+    """Variables declared in a dotenv file, with batched additions.
+
+    Keys are read once; `add` queues new lines in memory and `flush` appends
+    all of them with a single write.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._keys = None
+        self.pending = list()
+
+    @property
+    def keys(self):
+        if self._keys is None:
+            self._keys = set()
+            if os.path.isfile(self.path):
+                with open(self.path, 'r') as _:
+                    for line in _.read().splitlines():
+                        if '=' in line and not line.lstrip().startswith('#'):
+                            self._keys.add(line.split('=', 1)[0].strip())
+        return self._keys
+
+    def add(self, key, value=''):
+        """Queue KEY=VALUE unless KEY is already declared. Returns True if queued."""
+        if key in self.keys:
+            return False
+        self.keys.add(key)
+        self.pending.append((key, value))
+        return True
+
+    def flush(self):
+        """Append queued variables to the file and return the added keys."""
+        if not self.pending:
+            return list()
+        lines = "".join("{}={}\n".format(k, v) for k, v in self.pending)
+        if os.path.isfile(self.path) and os.path.getsize(self.path):
+            with open(self.path, 'rb') as _:
+                _.seek(-1, os.SEEK_END)
+                if _.read(1) != b'\n':
+                    lines = "\n" + lines
+        with open(self.path, 'a') as _:
+            _.write(lines)
+        added = [k for k, v in self.pending]
+        self.pending = list()
+        return added
@@ -0,0 +1,133 @@
+import fnmatch
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from .timings import phase
+from .cache import project_cache_dir, load_json, dump_json
+
+
+ENV_VAR = re.compile(r'os.environ.get\([\'\"](.*?)[\'\"]')
+INDEX_VERSION = 1
+# Directories never worth scanning regardless of ignore files.
+ALWAYS_IGNORED = ['.git', '.hg', '.svn', '.toadie', '__pycache__', 'node_modules',
+                  'toadie_runtime']
+# Optional settings of toadie's own scripts that ENV_VAR still finds; never
+# added to `.env`. Current templates read theirs through `env()` helpers,
+# which it does not match, but bin/build-tag-push.py copied into projects
+# by toadie 0.1 reads DOCKER_COMPOSE_YML with os.environ.get.
+TOADIE_SETTINGS = ['DOCKER_COMPOSE_YML']
+IGNORE_FILES = ['.gitignore', '.dockerignore']
+# Below this many changed files a process pool costs more than it saves.
+PARALLEL_THRESHOLD = 64
+
+
+def scan_file(path):
+    """Return sorted environment variable names read in python file PATH."""
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as _:
+            return sorted(set(ENV_VAR.findall(_.read())))
+    except (IOError, OSError):
+        return list()
+
+
+class EnvVarIndex(object):
+    """Persistent index of environment variables used by project files.
+
+    Maps each `.py` file's path, mtime and size to the variable names found
+    in it, stored in `.toadie/envindex.json`. Only files that changed since
+    the last update are rescanned.
+    """
+    def __init__(self, project_path, workers=None):
+        self.project_path = project_path
+        self.workers = workers
+        self.index_path = os.path.join(project_cache_dir(project_path), 'envindex.json')
+        self.patterns = self.ignore_patterns()
+
+    def ignore_patterns(self):
+        """Read patterns from the project's .gitignore and .dockerignore."""
+        patterns = list()
+        for ignore_file in IGNORE_FILES:
+            path = os.path.join(self.project_path, ignore_file)
+            if not os.path.isfile(path):
+                continue
+            with open(path, 'r') as _:
+                for line in _.read().splitlines():
+                    line = line.strip()
+                    # Negations are not supported; skipping them errs on scanning.
+                    if line and not line.startswith(('#', '!')):
+                        patterns.append(line)
+        return patterns
+
+    def is_ignored(self, rel_path, is_dir=False):
+        name = os.path.basename(rel_path)
+        if is_dir and name in ALWAYS_IGNORED:
+            return True
+        for pattern in self.patterns:
+            if pattern.endswith('/'):
+                if not is_dir:
+                    continue
+                pattern = pattern.rstrip('/')
+            if pattern.startswith('/') or '/' in pattern:
+                if fnmatch.fnmatch(rel_path, pattern.lstrip('/')):
+                    return True
+            elif fnmatch.fnmatch(name, pattern):
+                return True
+        return False
+
+    def walk(self):
+        """Yield project relative paths of python files not ignored."""
+        for root, dirs, files in os.walk(self.project_path):
+            rel_root = os.path.relpath(root, self.project_path)
+            rel_root = '' if rel_root == '.' else rel_root
+            dirs[:] = [d for d in dirs
+                       if not self.is_ignored(os.path.join(rel_root, d), is_dir=True)]
+            for filename in files:
+                rel_path = os.path.join(rel_root, filename)
+                if filename.endswith('.py') and not self.is_ignored(rel_path):
+                    yield rel_path
+
+    def scan(self, rel_paths):
+        paths = [os.path.join(self.project_path, p) for p in rel_paths]
+        if len(paths) < PARALLEL_THRESHOLD:
+            return [scan_file(p) for p in paths]
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            return list(pool.map(scan_file, paths, chunksize=32))
+
+    def update(self):
+        """Refresh the index and return the set of variables in use,
+        without TOADIE_SETTINGS."""
+        index = load_json(self.index_path, dict())
+        if index.get('version') != INDEX_VERSION:
+            index = dict(version=INDEX_VERSION, files=dict())
+        cached = index['files']
+
+        files = dict()
+        changed = list()
+        with phase('walk project'):
+            rel_paths = list(self.walk())
+        for rel_path in rel_paths:
+            try:
+                stat = os.stat(os.path.join(self.project_path, rel_path))
+            except OSError:
+                continue
+            key = [stat.st_mtime_ns, stat.st_size]
+            entry = cached.get(rel_path)
+            if entry is not None and entry[:2] == key:
+                files[rel_path] = entry
+            else:
+                files[rel_path] = key
+                changed.append(rel_path)
+
+        with phase('scan {} changed files'.format(len(changed))):
+            scanned = self.scan(changed)
+        for rel_path, env_vars in zip(changed, scanned):
+            files[rel_path] = files[rel_path] + [env_vars]
+
+        if changed or set(files) != set(cached):
+            index['files'] = files
+            dump_json(self.index_path, index)
+
+        env_vars = set()
+        for entry in files.values():
+            env_vars.update(entry[2])
+        return env_vars - set(TOADIE_SETTINGS)
@@ -0,0 +1,167 @@
+import click
+import functools
+import hashlib
+import json
+import os
+import re
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .cache import user_cache_dir
+from .timings import phase
+
+
+# Project conda environments are cloned from a template environment of
+# this spec, whose packages are pinned by a lockfile after the first solve.
+CONDA_SPEC = ['python=3.5']
+MACHINE_DRIVER = 'virtualbox'
+
+echo_lock = threading.Lock()
+
+
+def env_name(project_name):
+    return re.sub(r'[\s_]', '-', project_name)
+
+
+def echo(prefix, message, **styles):
+    """Echo MESSAGE prefixed with the environment it is about, one line at a time."""
+    with echo_lock:
+        for line in message.splitlines() or ['']:
+            click.secho("[{}] {}".format(prefix, line), **styles)
+
+
+def run_streamed(prefix, args):
+    """Run ARGS, echoing its output as it comes. Returns (returncode, last lines)."""
+    try:
+        process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                   stdin=subprocess.DEVNULL, universal_newlines=True)
+    except OSError as err:
+        return 127, str(err)
+    tail = list()
+    for line in process.stdout:
+        line = line.rstrip()
+        if line:
+            echo(prefix, line)
+            tail = (tail + [line])[-20:]
+    return process.wait(), '\n'.join(tail)
+
+
+@functools.lru_cache(maxsize=None)
+def conda_envs():
+    """Names of existing conda environments, looked up once per invocation."""
+    try:
+        output = subprocess.check_output(['conda', 'env', 'list', '--json'],
+                                         stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return frozenset(os.path.basename(path) for path in json.loads(output.decode('utf-8'))['envs'])
+
+
+@functools.lru_cache(maxsize=None)
+def machines():
+    """Names of existing docker machines, looked up once per invocation."""
+    try:
+        output = subprocess.check_output(['docker-machine', 'ls', '-q'],
+                                         stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return frozenset(output.decode('utf-8').split())
+
+
+def conda_template(spec=CONDA_SPEC):
+    """Return the name of the template environment of SPEC, creating it if missing.
+
+    The first solve is pinned in `~/.toadie/conda/<name>.lock`; later
+    templates are created from the lockfile without solving.
+    """
+    digest = hashlib.sha1(' '.join(sorted(spec)).encode('utf-8')).hexdigest()[:8]
+    name = 'toadie-template-{}'.format(digest)
+    if name in (conda_envs() or ()):
+        return name
+    lockfile = os.path.join(user_cache_dir(), 'conda', '{}.lock'.format(name))
+    if os.path.isfile(lockfile):
+        echo('conda', "Creating template env {} from {}".format(name, lockfile))
+        status, output = run_streamed('conda', ['conda', 'create', '-y', '-n', name,
+                                                '--file', lockfile])
+    else:
+        echo('conda', "Creating template env {}: {}".format(name, ' '.join(spec)))
+        status, output = run_streamed('conda', ['conda', 'create', '-y', '-n', name] + list(spec))
+        if status == 0:
+            explicit = subprocess.check_output(['conda', 'list', '--explicit', '-n', name])
+            os.makedirs(os.path.dirname(lockfile), exist_ok=True)
+            with open(lockfile, 'wb') as _:
+                _.write(explicit)
+    conda_envs.cache_clear()
+    if status != 0:
+        raise RuntimeError(output)
+    return name
+
+
+def create_conda(project_name):
+    """Create conda environment if neccessary, cloning the template environment."""
+    tool_name = env_name(project_name)
+    envs = conda_envs()
+    if envs is None:
+        echo('conda', "conda not found; skipping the conda environment.", fg='red')
+        return False
+
+    if tool_name not in envs:
+        try:
+            template = conda_template()
+        except (OSError, RuntimeError, subprocess.CalledProcessError) as err:
+            echo('conda', str(err), fg='red')
+            return False
+        echo('conda', "Creating: conda env {} cloned from {}".format(tool_name, template))
+        status, output = run_streamed('conda', ['conda', 'create', '-y', '-n', tool_name,
+                                                '--clone', template, '--offline'])
+        conda_envs.cache_clear()
+        if status != 0:
+            echo('conda', output, fg='red')
+            return False
+        echo('conda', "Conda env `{}` created.".format(tool_name), fg='green')
+    else:
+        echo('conda', "Conda environment ready.", fg='green')
+    echo('conda', "Activate with: $ source activate {}".format(tool_name), fg='yellow')
+    return True
+
+
+def create_machine(project_name):
+    """Create docker-machine environment and create if neccessary."""
+    tool_name = env_name(project_name)
+    existing = machines()
+    if existing is None:
+        echo('machine', "docker-machine not found; skipping the docker machine.", fg='red')
+        return False
+    msg = ("Activate with either:\n"
+           "    $ eval $(docker-machine env {envname})\n"
+           "or if you have docker-machine bash completion:\n"
+           "    $ docker-machine use {envname}").format(envname=tool_name)
+
+    if tool_name not in existing:
+        echo('machine', "Creating: docker-machine env {}".format(tool_name))
+        status, output = run_streamed('machine', ['docker-machine', 'create', '--driver',
+                                                  MACHINE_DRIVER, tool_name])
+        machines.cache_clear()
+        if status != 0:
+            echo('machine', output, fg='red')
+            return False
+        echo('machine', "Docker-machine env `{}` created.".format(tool_name), fg='green')
+    else:
+        echo('machine', "Docker-machine environment ready.", fg='green')
+    echo('machine', msg, fg='yellow')
+    return True
+
+
+def create_environments(project_name):
+    """Create the conda environment and docker machine of a project concurrently.
+
+    Returns (conda created or ready, machine created or ready).
+    """
+    def timed(name, create):
+        with phase(name):
+            return create(project_name)
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        conda = pool.submit(timed, 'conda env', create_conda)
+        machine = pool.submit(timed, 'docker machine', create_machine)
+        return conda.result(), machine.result()
@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from .cache import project_cache_dir, load_json, dump_json
+from .compose import load_yaml, open_compose
+from .components import BASE_IMAGES, BODY_FORMATS, StackComponent
+from .dotenv import Dotenv
+from .project import Project
+from .templates import RESOURCE_PACKAGE
+
+
+COMPONENT_TYPES = ['service', 'task']
+INTERFACES = ['queue', 'rest', 'hybrid']
+# Services every stack needs; added when missing like generate-stack-component does.
+STACK_SERVICES = ['errlogger', 'logger']
+
+
+class ManifestError(Exception):
+    pass
+
+
+class StackManifest(object):
+    """Components declared in a stack manifest, e.g.:
+
+        \b
+        components:
+          ingest:
+            type: service
+            interface: queue
+            base: slim
+            format: msgpack
+            requirements:
+              - requests
+    """
+    def __init__(self, components):
+        self.components = components
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as _:
+            manifest = load_yaml(_) or dict()
+        declared = manifest.get('components') or dict()
+        if not isinstance(declared, dict):
+            raise ManifestError("`components` must map component names to specs.")
+
+        components = dict()
+        for name, spec in declared.items():
+            spec = dict(spec or {})
+            spec.setdefault('type', 'service')
+            spec.setdefault('interface', 'queue')
+            spec['requirements'] = sorted(spec.get('requirements') or [])
+            if spec['type'] not in COMPONENT_TYPES:
+                raise ManifestError("{}: type must be one of {}".format(
+                    name, ", ".join(COMPONENT_TYPES)))
+            if spec['interface'] not in INTERFACES:
+                raise ManifestError("{}: interface must be one of {}".format(
+                    name, ", ".join(INTERFACES)))
+            if spec.get('base', 'alpine') not in BASE_IMAGES:
+                raise ManifestError("{}: base must be one of {}".format(
+                    name, ", ".join(sorted(BASE_IMAGES))))
+            if spec.get('format', 'text') not in BODY_FORMATS:
+                raise ManifestError("{}: format must be one of {}".format(
+                    name, ", ".join(BODY_FORMATS)))
+            if spec['interface'] != 'queue':
+                raise ManifestError("{}: `{}` components are not supported yet.".format(
+                    name, spec['interface']))
+            components[str(name)] = spec
+        return cls(components)
+
+    @staticmethod
+    def digest(spec):
+        return hashlib.sha1(json.dumps(spec, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ManifestApplier(object):
+    """Scaffold the components of a StackManifest into a project.
+
+    Component files are generated concurrently; docker-compose.yml and .env
+    edits are merged in memory and written once. Applied specs are recorded
+    in `.toadie/apply.json` so unchanged components are skipped.
+    """
+    def __init__(self, project_path, workers=None, force=False):
+        self.project_path = project_path
+        self.workers = workers
+        self.force = force
+        self.state_path = os.path.join(project_cache_dir(project_path), 'apply.json')
+
+    def plan(self, manifest, services):
+        """Return {name: spec} of components needing (re)generation, given
+        the compose SERVICES of the project."""
+        state = dict() if self.force else load_json(self.state_path, dict())
+        specs = dict(manifest.components)
+        for name in STACK_SERVICES:
+            if name not in specs and name not in services:
+                specs[name] = dict(type='service', interface='queue', requirements=[])
+
+        pending = dict()
+        for name, spec in specs.items():
+            component_dir = os.path.join(self.project_path, spec['type']+"s", name)
+            if (state.get(name) != StackManifest.digest(spec)
+                    or name not in services
+                    or not os.path.isdir(component_dir)):
+                pending[name] = spec
+        return pending
+
+    def generate(self, component, spec, scaffold):
+        if scaffold:
+            component.define_queue_files(spec['requirements'])
+        else:
+            # Keep hand edited files of existing components, except the
+            # Dockerfile when the manifest pins its base.
+            component.define_requirments(spec['requirements'])
+            component.define_runtime()
+            if 'base' in spec:
+                component.define_dockerfile()
+        return component
+
+    def apply(self, manifest):
+        """Apply MANIFEST and return the names of generated components."""
+        pending = self.plan(manifest, Project(self.project_path).services)
+        if not pending:
+            return list()
+
+        compose = open_compose(self.project_path)
+        dotenv = Dotenv(os.path.join(self.project_path, '.env'))
+
+        jobs = list()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for name, spec in sorted(pending.items()):
+                component_dir = os.path.join(self.project_path, spec['type']+"s", name)
+                scaffold = self.force or not os.path.isdir(component_dir)
+                component = StackComponent(
+                    name, spec['type'], self.project_path,
+                    resource_package=RESOURCE_PACKAGE,
+                    compose=compose, dotenv=dotenv,
+                    base=spec.get('base', 'alpine'),
+                    body_format=spec.get('format', 'text'))
+                jobs.append(pool.submit(self.generate, component, spec, scaffold))
+            components = [job.result() for job in jobs]
+
+        for component in components:
+            component.update_docker_compose()
+        compose.flush()
+        dotenv.flush()
+
+        state = load_json(self.state_path, dict())
+        for name, spec in pending.items():
+            state[name] = StackManifest.digest(spec)
+        dump_json(self.state_path, state)
+        return sorted(pending)
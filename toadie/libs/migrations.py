@@ -0,0 +1,73 @@
+import os
+import re
+import yaml
+from .project import Project
+from ..runtime.promise import PROMISE_FILE
+
+
+# Every component declares the durable log exchange in its promise.yml.
+# toadie 0.1 declared it `direct`; loggers now bind it with wildcards, so
+# it must be a `topic` exchange everywhere, or whichever container
+# declares it second fails with PRECONDITION_FAILED.
+LOG_EXCHANGE = 'logExchange'
+LOG_EXCHANGE_TYPE = 'topic'
+LOG_EXCHANGE_SECTIONS = ['logqueue', 'errqueue', 'inqueues', 'outqueues']
+
+# `name: logExchange` and its `type:` line as yaml.dump writes them, in either order.
+NAME_THEN_TYPE = re.compile(
+    r'^([ \t]*)(name: {}[ \t]*\n\1type: )\w+'.format(LOG_EXCHANGE), re.M)
+TYPE_THEN_NAME = re.compile(
+    r'^([ \t]*)(type: )\w+([ \t]*\n\1name: {}[ \t]*)$'.format(LOG_EXCHANGE), re.M)
+
+
+def log_exchange_types(promise):
+    """Types the promise declares LOG_EXCHANGE with."""
+    types = set()
+    for section in LOG_EXCHANGE_SECTIONS:
+        queues = promise.get(section) or []
+        for queue in queues if isinstance(queues, list) else [queues]:
+            exchange = queue.get('exchange') or dict()
+            if exchange.get('name') == LOG_EXCHANGE:
+                types.add(exchange.get('type', LOG_EXCHANGE_TYPE))
+    return types
+
+
+def outdated_log_exchanges(project_path):
+    """Names of components declaring LOG_EXCHANGE with another type than topic."""
+    return sorted(name for name, component in Project(project_path).components.items()
+                  if log_exchange_types(component['promise']) - set([LOG_EXCHANGE_TYPE]))
+
+
+def upgrade_log_exchange(contents):
+    """CONTENTS of a promise.yml with LOG_EXCHANGE declared as a topic
+    exchange. Only the type lines change, so comments are kept."""
+    contents = NAME_THEN_TYPE.sub(r'\g<1>\g<2>' + LOG_EXCHANGE_TYPE, contents)
+    return TYPE_THEN_NAME.sub(r'\g<1>\g<2>' + LOG_EXCHANGE_TYPE + r'\g<3>', contents)
+
+
+def migrate_log_exchange(project_path):
+    """Declare LOG_EXCHANGE as topic in every promise.yml. Returns the
+    paths, relative to the project, of the files rewritten."""
+    project = Project(project_path)
+    migrated = list()
+    for name, component in sorted(project.components.items()):
+        if not log_exchange_types(component['promise']) - set([LOG_EXCHANGE_TYPE]):
+            continue
+        path = os.path.join(project.component_dir(name), PROMISE_FILE)
+        with open(path, 'r') as _:
+            contents = _.read()
+        upgraded = upgrade_log_exchange(contents)
+        declared = yaml.safe_load(upgraded) or dict()
+        promise = next(iter(declared.values()), None) or dict()
+        if log_exchange_types(promise) - set([LOG_EXCHANGE_TYPE]):
+            # Not laid out as generated: rewrite the whole document.
+            for section in LOG_EXCHANGE_SECTIONS:
+                queues = promise.get(section) or []
+                for queue in queues if isinstance(queues, list) else [queues]:
+                    if (queue.get('exchange') or {}).get('name') == LOG_EXCHANGE:
+                        queue['exchange']['type'] = LOG_EXCHANGE_TYPE
+            upgraded = yaml.dump(declared, default_flow_style=False)
+        with open(path, 'w') as _:
+            _.write(upgraded)
+        migrated.append(os.path.relpath(path, project_path))
+    return migrated
@@ -0,0 +1,141 @@
+import os
+from .baseimage import COMPONENT_DIRS
+from .cache import project_cache_dir, dump_json, load_json
+from .compose import compose_files, load_yaml
+from .dotenv import Dotenv
+from .timings import phase
+from ..runtime.promise import PROMISE_FILE, load_promise
+
+
+PROJECT_CACHE = 'project.json'
+PROJECT_VERSION = 1
+DOTENV_FILE = '.env'
+EXAMPLE_FILE = 'dotenv.example'
+
+
+def promise_paths(project_path):
+    """Yield the path of every component's promise.yml."""
+    for parent in COMPONENT_DIRS:
+        parent_dir = os.path.join(project_path, parent)
+        if not os.path.isdir(parent_dir):
+            continue
+        for dirname in sorted(os.listdir(parent_dir)):
+            promise_path = os.path.join(parent_dir, dirname, PROMISE_FILE)
+            if os.path.isfile(promise_path):
+                yield promise_path
+
+
+def parse_promise(path):
+    return list(load_promise(path))
+
+
+def parse_services(path):
+    with open(path, 'r') as _:
+        data = load_yaml(_) or dict()
+    return data.get('services') or dict()
+
+
+def parse_env_keys(path):
+    return sorted(Dotenv(path).keys)
+
+
+class Project(object):
+    """Components, their promises, compose services and `.env` keys of a project.
+
+    Each is loaded on first access. Parsed files are kept in
+    `.toadie/project.json` keyed by their mtime and size, so only files
+    changed since the last command are parsed again.
+    """
+    def __init__(self, project_path):
+        self.path = project_path
+        self.cache_path = os.path.join(project_cache_dir(project_path), PROJECT_CACHE)
+        self._files = None
+        self._components = None
+        self.dirty = False
+
+    @property
+    def files(self):
+        if self._files is None:
+            cache = load_json(self.cache_path, dict())
+            self._files = cache.get('files', dict()) \
+                if cache.get('version') == PROJECT_VERSION else dict()
+        return self._files
+
+    def parsed(self, rel_path, parser, default=None):
+        """Parse REL_PATH with PARSER unless the cached result is current."""
+        try:
+            stat = os.stat(os.path.join(self.path, rel_path))
+        except OSError:
+            if self.files.pop(rel_path, None) is not None:
+                self.dirty = True
+            return default
+        key = [stat.st_mtime_ns, stat.st_size]
+        entry = self.files.get(rel_path)
+        if entry is None or entry[:2] != key:
+            entry = key + [parser(os.path.join(self.path, rel_path))]
+            self.files[rel_path] = entry
+            self.dirty = True
+        return entry[2]
+
+    def save(self):
+        """Write the cache if anything was parsed. Returns True if written."""
+        if not self.dirty:
+            return False
+        dump_json(self.cache_path, dict(version=PROJECT_VERSION, files=self.files))
+        self.dirty = False
+        return True
+
+    @property
+    def components(self):
+        """{name: {dir, kind, promise}}, kind being services, tasks or mocks."""
+        if self._components is None:
+            with phase('load components'):
+                self._components = self.load_components()
+            self.save()
+        return self._components
+
+    def load_components(self):
+        components = dict()
+        current = set()
+        for path in promise_paths(self.path):
+            rel_path = os.path.relpath(path, self.path)
+            current.add(rel_path)
+            name, promise = self.parsed(rel_path, parse_promise)
+            rel_dir = os.path.dirname(rel_path)
+            components[name] = dict(dir=rel_dir, kind=os.path.dirname(rel_dir),
+                                    promise=promise)
+        for rel_path in list(self.files):
+            if rel_path.endswith(PROMISE_FILE) and rel_path not in current:
+                del self.files[rel_path]
+                self.dirty = True
+        return components
+
+    @property
+    def services(self):
+        """Services of docker-compose.yml and its fragments, or {} without any."""
+        services = dict()
+        for rel_path in compose_files(self.path):
+            services.update(self.parsed(rel_path, parse_services, dict()))
+        self.save()
+        return services
+
+    @property
+    def env_keys(self):
+        """Keys set in `.env`."""
+        return self.dotenv_keys(DOTENV_FILE)
+
+    def dotenv_keys(self, rel_path):
+        """Keys set in the dotenv file at REL_PATH, or an empty set without one."""
+        keys = set(self.parsed(rel_path, parse_env_keys, list()))
+        self.save()
+        return keys
+
+    def component_dir(self, name):
+        return os.path.join(self.path, self.components[name]['dir'])
+
+
+def find_components(project_path):
+    """Yield (name, component_dir, promise) of every component with a promise.yml."""
+    project = Project(project_path)
+    for name, component in sorted(project.components.items(), key=lambda c: c[1]['dir']):
+        yield name, project.component_dir(name), component['promise']
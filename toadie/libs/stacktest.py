@@ -0,0 +1,163 @@
+import contextlib
+import importlib.util
+import os
+import sys
+import tempfile
+from collections import defaultdict
+from .broker import InMemoryBroker
+from .project import find_components
+from .. import runtime
+from ..runtime.codecs import encode_body
+from ..runtime.consumer import call_handler, message_bodies
+from ..runtime.context import Context
+from ..runtime.promise import routing_key
+
+
+def load_handler(name, component_dir):
+    """Import `handle` from a component's consume.py, or None if it has none.
+
+    The component's vendored `toadie_runtime` resolves to toadie's own
+    runtime package.
+    """
+    path = os.path.join(component_dir, 'consume.py')
+    if not os.path.isfile(path):
+        return None
+    for module_name, module in list(sys.modules.items()):
+        if module_name == runtime.__name__ or module_name.startswith(runtime.__name__ + '.'):
+            sys.modules.setdefault(module_name.replace(runtime.__name__, 'toadie_runtime', 1), module)
+    spec = importlib.util.spec_from_file_location('toadie_stack.{}'.format(name), path)
+    module = importlib.util.module_from_spec(spec)
+    sys.path.insert(0, component_dir)
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(component_dir)
+    return getattr(module, 'handle', None)
+
+
+@contextlib.contextmanager
+def scratch_log_dir():
+    """Point LOG_DIR at a temporary directory while handlers run in-process,
+    so the logger and errlogger sinks do not write into the project."""
+    previous = os.environ.get('LOG_DIR')
+    with tempfile.TemporaryDirectory(prefix='toadie-logs-') as directory:
+        os.environ['LOG_DIR'] = directory
+        try:
+            yield directory
+        finally:
+            if previous is None:
+                os.environ.pop('LOG_DIR', None)
+            else:
+                os.environ['LOG_DIR'] = previous
+
+
+class ComponentPublisher(object):
+    """Publishes to BROKER for one component, counting what reaches each
+    queue per (component, queue) in DELIVERED."""
+    def __init__(self, component, broker, delivered):
+        self.component = component
+        self.broker = broker
+        self.delivered = delivered
+
+    async def publish(self, exchange, routing_key, body, headers=None):
+        for queue in self.broker.route(exchange, routing_key):
+            self.delivered[(self.component, queue)] += 1
+        return await self.broker.publish(exchange, routing_key, body, headers)
+
+
+class StackTest(object):
+    """Contract test of a stack against an InMemoryBroker.
+
+    Every promise is declared on the broker. Each tested component's
+    inqueues are fed their declared sample bodies, and every component's
+    handler drains its inqueues in-process until the stack is idle.
+    Each tested component must then have published to all of its
+    outqueues itself; deliveries from other publishers to the same
+    queue do not count.
+    """
+    def __init__(self, project_path, only=None, max_rounds=100):
+        self.project_path = project_path
+        self.only = only
+        self.max_rounds = max_rounds
+        self.broker = InMemoryBroker()
+        self.delivered = defaultdict(int)
+        self.results = list()
+
+    def record(self, component, check, ok, detail=''):
+        self.results.append((component, check, ok, detail))
+
+    async def drain(self, name, promise, handler):
+        """Handle every queued inqueue message of one component. Returns the count."""
+        handled = 0
+        publisher = ComponentPublisher(name, self.broker, self.delivered)
+        for inqueue in promise.get('inqueues') or []:
+            while True:
+                message = self.broker.get(inqueue['name'])
+                if message is None:
+                    break
+                handled += 1
+                ctx = Context(name, promise, publisher, headers=message.headers,
+                              routing_key=message.routing_key, exchange=message.exchange)
+                try:
+                    for body in message_bodies(message.body, message.headers):
+                        await call_handler(handler, body, ctx)
+                except Exception as err:
+                    self.record(name, 'handle {}'.format(inqueue['name']), False,
+                                '{}: {}'.format(type(err).__name__, err))
+        return handled
+
+    async def run(self):
+        with scratch_log_dir():
+            return await self.check()
+
+    async def check(self):
+        components = list(find_components(self.project_path))
+        if self.only is not None and self.only not in [c[0] for c in components]:
+            self.record(self.only, 'exists', False, 'no promise.yml found')
+            return self.results
+        tested = [c for c in components if self.only in (None, c[0])]
+
+        handlers = dict()
+        for name, component_dir, promise in components:
+            self.broker.declare_promise(promise)
+            try:
+                handlers[name] = load_handler(name, component_dir)
+            except Exception as err:
+                handlers[name] = None
+                self.record(name, 'import consume.py', False,
+                            '{}: {}'.format(type(err).__name__, err))
+
+        for name, component_dir, promise in tested:
+            for inqueue in promise.get('inqueues') or []:
+                sample = (inqueue.get('body') or {})
+                if 'message' not in sample:
+                    continue
+                try:
+                    body, headers = encode_body(sample['message'], sample.get('format', 'text'))
+                except Exception as err:
+                    self.record(name, 'encode sample of {}'.format(inqueue['name']), False,
+                                '{}: {}'.format(type(err).__name__, err))
+                    continue
+                await self.broker.publish(inqueue['exchange']['name'], routing_key(inqueue),
+                                          body, headers)
+
+        for _ in range(self.max_rounds):
+            handled = 0
+            for name, component_dir, promise in components:
+                if handlers.get(name) is not None:
+                    handled += await self.drain(name, promise, handlers[name])
+            if not handled:
+                break
+
+        for name, component_dir, promise in tested:
+            if not promise.get('inqueues'):
+                # Sources such as mocks publish on their own, not per message.
+                continue
+            if handlers.get(name) is None:
+                self.record(name, 'handler', False, 'consume.py defines no `handle`')
+                continue
+            for outqueue in promise.get('outqueues') or []:
+                count = self.delivered[(name, outqueue['name'])]
+                self.record(name, 'publishes to {}'.format(outqueue['name']), count > 0,
+                            '{} messages'.format(count))
+        return self.results
@@ -0,0 +1,19 @@
+from importlib import resources
+
+
+# Package holding the `templates` directory.
+RESOURCE_PACKAGE = 'toadie'
+# Package vendored into components as `toadie_runtime`.
+RUNTIME_PACKAGE = 'toadie.runtime'
+
+
+def read_template(name, resource_package=RESOURCE_PACKAGE):
+    """Return the bytes of template NAME shipped in RESOURCE_PACKAGE."""
+    return resources.files(resource_package).joinpath('templates').joinpath(name).read_bytes()
+
+
+def runtime_sources(runtime_package=RUNTIME_PACKAGE):
+    """Return {filename: bytes} of the component runtime's modules."""
+    return dict((resource.name, resource.read_bytes())
+                for resource in resources.files(runtime_package).iterdir()
+                if resource.name.endswith('.py'))
@@ -0,0 +1,113 @@
+import contextlib
+import json
+import subprocess
+import threading
+import time
+
+
+class Timings(object):
+    """Named phases and external subprocesses of one toadie invocation.
+
+    Disabled, `phase` costs next to nothing. Enabled, every subprocess
+    started through the subprocess module is recorded with its command,
+    duration and exit code.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.started = None
+        self.phases = list()
+        self.subprocesses = list()
+        self.lock = threading.Lock()
+        self.popen = None
+
+    def enable(self):
+        if self.enabled:
+            return
+        self.enabled = True
+        self.started = time.perf_counter()
+        self.popen = subprocess.Popen
+        subprocess.Popen = TimedPopen
+
+    def disable(self):
+        if self.enabled:
+            subprocess.Popen = self.popen
+            self.enabled = False
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - started, started)
+
+    def add_phase(self, name, seconds, started=None):
+        with self.lock:
+            self.phases.append(dict(
+                name=name, seconds=seconds,
+                offset=(started or time.perf_counter()) - (self.started or 0)))
+
+    def add_subprocess(self, args, seconds, returncode):
+        if not isinstance(args, str):
+            args = subprocess.list2cmdline([str(a) for a in args])
+        with self.lock:
+            self.subprocesses.append(dict(command=args, seconds=seconds, returncode=returncode))
+
+    def total(self):
+        return time.perf_counter() - self.started if self.started else 0.0
+
+    def rows(self):
+        rows = [('phase', p['name'], p['seconds'], '') for p in self.phases]
+        rows += [('exec', s['command'], s['seconds'],
+                  'not found' if s['returncode'] is None else s['returncode'])
+                 for s in self.subprocesses]
+        return sorted(rows, key=lambda r: -r[2])
+
+    def report(self, width=60):
+        lines = ["{:<6} {:<{}} {:>9} {:>6}".format('kind', 'name', width, 'seconds', 'exit')]
+        for kind, name, seconds, returncode in self.rows():
+            if len(name) > width:
+                name = name[:width - 3] + '...'
+            lines.append("{:<6} {:<{}} {:>9.3f} {:>6}".format(kind, name, width, seconds, returncode))
+        lines.append("{:<6} {:<{}} {:>9.3f}".format('total', '', width, self.total()))
+        return '\n'.join(lines)
+
+    def to_json(self, command, argv):
+        return json.dumps(dict(
+            time=time.strftime('%Y-%m-%dT%H:%M:%S'), command=command, argv=list(argv),
+            total=round(self.total(), 6),
+            phases=[dict(p, seconds=round(p['seconds'], 6), offset=round(p['offset'], 6))
+                    for p in self.phases],
+            subprocesses=[dict(s, seconds=round(s['seconds'], 6)) for s in self.subprocesses],
+        ), sort_keys=True)
+
+
+timings = Timings()
+
+
+def phase(name):
+    """Time the block as phase NAME when `--timings` is on."""
+    return timings.phase(name)
+
+
+class TimedPopen(subprocess.Popen):
+    """Popen recording each process in `timings` once it is waited for."""
+    def __init__(self, *args, **kwargs):
+        self._timed_started = time.perf_counter()
+        self._timed = False
+        try:
+            super(TimedPopen, self).__init__(*args, **kwargs)
+        except OSError:
+            timings.add_subprocess(kwargs.get('args', args[0] if args else ''),
+                                   time.perf_counter() - self._timed_started, None)
+            raise
+
+    def wait(self, timeout=None):
+        returncode = super(TimedPopen, self).wait(timeout)
+        if not self._timed:
+            self._timed = True
+            timings.add_subprocess(self.args, time.perf_counter() - self._timed_started, returncode)
+        return returncode
@@ -0,0 +1,247 @@
+import os
+from collections import defaultdict
+from .broker import InMemoryBroker
+from .cache import project_cache_dir, dump_json, load_json
+from .timings import phase
+from .project import find_components, promise_paths
+from ..runtime.declare import promise_exchanges, promise_queues
+from ..runtime.logpolicy import DEFAULT_POLICY, LOG_KEY
+from ..runtime.metrics import METRICS_KEY
+from ..runtime.promise import queue_bindings, routing_key
+
+
+TOPOLOGY_CACHE = 'topology.json'
+TOPOLOGY_VERSION = 2
+# Queues one publish may reach before it is flagged as fan-out.
+FANOUT_LIMIT = 4
+
+
+def publish_paths(name, promise):
+    """(exchange, routing key) pairs a component publishes with."""
+    paths = list()
+    for queue in promise.get('outqueues') or []:
+        paths.append((queue['exchange']['name'], routing_key(queue)))
+    logqueue = promise.get('logqueue') or dict()
+    if logqueue.get('exchange'):
+        exchange = logqueue['exchange']['name']
+        paths.extend((exchange, key) for key in queue_bindings(logqueue))
+        # Promises from before WARNING was bound still publish it.
+        paths.extend((exchange, LOG_KEY.format(name, level)) for level in DEFAULT_POLICY['levels'])
+        paths.append((exchange, METRICS_KEY.format(name)))
+    errqueue = promise.get('errqueue') or dict()
+    if errqueue.get('exchange'):
+        paths.extend((errqueue['exchange']['name'], key) for key in queue_bindings(errqueue))
+    return sorted(set(paths))
+
+
+def compile_topology(components):
+    """Compile (name, component_dir, promise) triples into one graph.
+
+    \b
+    {components: {name: {publishes: [[exchange, key]], consumes: [queue]}},
+     exchanges: {name: {type, declared_by: {component: type}}},
+     queues: {name: {declared_by: {component: [[exchange, key]]},
+                     arguments, consumers: [component], role}},
+     routes: {exchange: {key: [queue]}}}
+    """
+    graph = dict(components=dict(), exchanges=dict(), queues=dict(), routes=dict())
+    broker = InMemoryBroker()
+    for name, component_dir, promise in components:
+        graph['components'][name] = {
+            'publishes': [list(p) for p in publish_paths(name, promise)],
+            'consumes': [q['name'] for q in promise.get('inqueues') or []],
+        }
+        for exchange, kind in promise_exchanges(promise, name).items():
+            node = graph['exchanges'].setdefault(exchange, {'type': kind, 'declared_by': dict()})
+            node['declared_by'][name] = kind
+            broker.declare_exchange(exchange, kind)
+        for queue in promise_queues(promise, name):
+            node = graph['queues'].setdefault(queue['name'], {
+                'declared_by': dict(), 'arguments': queue.get('arguments'), 'consumers': list(),
+                'role': queue.get('role')})
+            bindings = [[queue['exchange']['name'], key] for key in queue_bindings(queue)]
+            # Inqueues with a retry policy are declared twice, once per exchange.
+            node['declared_by'].setdefault(name, list()).extend(bindings)
+            broker.declare_queue(queue['name'])
+            for exchange, key in bindings:
+                broker.bind(queue['name'], exchange, key)
+        for queue in promise.get('inqueues') or []:
+            graph['queues'][queue['name']]['consumers'].append(name)
+
+    for component in graph['components'].values():
+        for exchange, key in component['publishes']:
+            graph['routes'].setdefault(exchange, dict())[key] = broker.route(exchange, key)
+    return graph
+
+
+def merged_bindings(queue):
+    """Sorted (exchange, key) bindings of a queue node over all its declarations."""
+    bindings = set()
+    for declared in queue['declared_by'].values():
+        bindings.update(map(tuple, declared))
+    return sorted(bindings)
+
+
+class StackTopology(object):
+    """Exchanges, queues and bindings of every promise.yml in a project.
+
+    The compiled graph is cached in `.toadie/topology.json` until a
+    promise.yml is added, removed or modified.
+    """
+    def __init__(self, project_path):
+        self.project_path = project_path
+        self.cache_path = os.path.join(project_cache_dir(project_path), TOPOLOGY_CACHE)
+        self.cached = False
+        self._graph = None
+
+    def sources(self):
+        sources = dict()
+        for path in promise_paths(self.project_path):
+            sources[os.path.relpath(path, self.project_path)] = os.stat(path).st_mtime_ns
+        return sources
+
+    @property
+    def graph(self):
+        if self._graph is None:
+            sources = self.sources()
+            cache = load_json(self.cache_path, dict())
+            if cache.get('version') == TOPOLOGY_VERSION and cache.get('sources') == sources:
+                self._graph, self.cached = cache['graph'], True
+            else:
+                with phase('compile topology'):
+                    self._graph = compile_topology(find_components(self.project_path))
+                dump_json(self.cache_path, dict(
+                    version=TOPOLOGY_VERSION, sources=sources, graph=self._graph))
+        return self._graph
+
+    def route(self, exchange, key):
+        """Queues a publish reaches, from the precomputed routing table."""
+        return self.graph['routes'].get(exchange, {}).get(key)
+
+    def check(self, fanout_limit=FANOUT_LIMIT):
+        """Return [(severity, message)] of problems, severity `error` or `warning`."""
+        graph = self.graph
+        problems = list()
+        for name, exchange in sorted(graph['exchanges'].items()):
+            if len(set(exchange['declared_by'].values())) > 1:
+                problems.append(('error', "exchange {} is declared with conflicting types: {}".format(
+                    name, ", ".join("{} by {}".format(kind, component)
+                                    for component, kind in sorted(exchange['declared_by'].items())))))
+
+        for name, queue in sorted(graph['queues'].items()):
+            declarations = [sorted(map(tuple, b)) for b in queue['declared_by'].values()]
+            if any(d != declarations[0] for d in declarations):
+                problems.append(('warning', "queue {} is declared with different bindings by {}".format(
+                    name, ", ".join(sorted(queue['declared_by'])))))
+            if len(queue['consumers']) > 1:
+                problems.append(('warning', "queue {} is consumed by {}, which compete for its messages".format(
+                    name, ", ".join(queue['consumers']))))
+
+        consumed = set(q for q, node in graph['queues'].items() if node['consumers'])
+        reached = set()
+        for component, node in sorted(graph['components'].items()):
+            for exchange, key in node['publishes']:
+                queues = self.route(exchange, key) or []
+                reached.update(queues)
+                if not queues:
+                    problems.append(('warning', "{} publishes {} to {}, which routes nowhere".format(
+                        component, key, exchange)))
+                elif not consumed.intersection(queues):
+                    problems.append(('warning', "{} publishes {} to {}, reaching only {}, which nothing consumes".format(
+                        component, key, exchange, ", ".join(queues))))
+                elif len(queues) > fanout_limit:
+                    problems.append(('warning', "{} publishes {} to {}, fanning out to {} queues".format(
+                        component, key, exchange, len(queues))))
+
+        for name in sorted(consumed - reached):
+            problems.append(('warning', "inqueue {} is not reached by any component".format(name)))
+        for cycle in self.cycles():
+            problems.append(('warning', "messages can loop through {}".format(" -> ".join(cycle))))
+        return problems
+
+    def flows(self):
+        """{component: set of components consuming what it publishes}."""
+        consumers = dict((q, node['consumers']) for q, node in self.graph['queues'].items())
+        edges = defaultdict(set)
+        for component, node in self.graph['components'].items():
+            for exchange, key in node['publishes']:
+                for queue in self.route(exchange, key) or []:
+                    edges[component].update(consumers.get(queue, []))
+        return edges
+
+    def cycles(self):
+        """Yield component cycles, each once, e.g. [a, b, a]."""
+        edges = self.flows()
+        seen = set()
+        for start in sorted(edges):
+            stack = [(start, [start])]
+            while stack:
+                node, path = stack.pop()
+                for successor in sorted(edges.get(node, ())):
+                    if successor == start:
+                        key = frozenset(path)
+                        if key not in seen:
+                            seen.add(key)
+                            yield path + [start]
+                    elif successor not in path and successor > start:
+                        stack.append((successor, path + [successor]))
+
+    def to_dot(self):
+        graph = self.graph
+        lines = ['digraph stack {', '  rankdir=LR;']
+        for name in sorted(graph['components']):
+            lines.append('  "c:{0}" [label="{0}", shape=box, style=filled, fillcolor="#dde8f5"];'.format(name))
+        for name, exchange in sorted(graph['exchanges'].items()):
+            lines.append('  "x:{0}" [label="{0}\\n{1}", shape=diamond];'.format(name, exchange['type']))
+        for name, queue in sorted(graph['queues'].items()):
+            lines.append('  "q:{0}" [label="{0}", shape={1}];'.format(
+                name, 'ellipse' if queue.get('role') is None else 'box, style=rounded'))
+        for component, node in sorted(graph['components'].items()):
+            for exchange, key in node['publishes']:
+                lines.append('  "c:{}" -> "x:{}" [label="{}"];'.format(component, exchange, key))
+        for name, queue in sorted(graph['queues'].items()):
+            for exchange, key in merged_bindings(queue):
+                lines.append('  "x:{}" -> "q:{}" [label="{}", style=dashed];'.format(exchange, name, key))
+            for component in queue['consumers']:
+                lines.append('  "q:{}" -> "c:{}";'.format(name, component))
+        lines.append('}')
+        return '\n'.join(lines) + '\n'
+
+    def definitions(self, vhost='/'):
+        """rabbitmq definitions declaring the whole topology, for `load_definitions`."""
+        graph = self.graph
+        definitions = dict(exchanges=list(), queues=list(), bindings=list())
+        for name, exchange in sorted(graph['exchanges'].items()):
+            definitions['exchanges'].append(dict(
+                name=name, vhost=vhost, type=exchange['type'], durable=True,
+                auto_delete=False, internal=False, arguments=dict()))
+        for name, queue in sorted(graph['queues'].items()):
+            definitions['queues'].append(dict(
+                name=name, vhost=vhost, durable=True, auto_delete=False,
+                arguments=queue['arguments'] or dict()))
+            for exchange, key in merged_bindings(queue):
+                definitions['bindings'].append(dict(
+                    source=exchange, vhost=vhost, destination=name, destination_type='queue',
+                    routing_key=key, arguments=dict()))
+        return definitions
+
+    async def declare(self, url):
+        """Declare every exchange, queue and binding on the broker at URL."""
+        import aio_pika
+
+        graph = self.graph
+        connection = await aio_pika.connect_robust(url)
+        try:
+            channel = await connection.channel()
+            exchanges = dict()
+            for name, exchange in sorted(graph['exchanges'].items()):
+                exchanges[name] = await channel.declare_exchange(
+                    name, aio_pika.ExchangeType(exchange['type']), durable=True)
+            for name, queue in sorted(graph['queues'].items()):
+                declared = await channel.declare_queue(
+                    name, durable=True, arguments=queue['arguments'])
+                for exchange, key in merged_bindings(queue):
+                    await declared.bind(exchanges[exchange], routing_key=key)
+        finally:
+            await connection.close()
+        return len(graph['exchanges']), len(graph['queues'])
@@ -0,0 +1,15 @@
+"""Runtime for toadie queue components.
+
+This package is copied into every generated component as `toadie_runtime`,
+so it may only use relative imports, the standard library, PyYAML and
+aio-pika (imported lazily, only when a broker connection is made).
+"""
+from .codecs import Codec, register_codec, get_codec, encode_body, decode_body
+from .promise import load_promise, queue_bindings, routing_key, resolve_target, amqp_url, env, env_int
+from .context import Context
+from .consumer import Consumer, run
+from .logpolicy import LogPolicy
+from .metrics import Metrics, MetricsSeries
+from .sink import FileSink, log_line
+from .producer import Producer, PublishError
+from .retry import retry_policy, retry_queues
@@ -0,0 +1,169 @@
+import json
+import struct
+import zlib
+
+
+# Headers negotiating how a body is encoded. Messages without them are
+# plain `text` bodies and reach handlers as the raw bytes.
+CODEC_HEADER = 'x-toadie-codec'
+COMPRESSION_HEADER = 'x-toadie-compression'
+
+UINT32 = struct.Struct('>I')
+
+
+class Codec(object):
+    """Encodes handler objects to message bodies and back."""
+    name = None
+
+    def encode(self, obj):
+        raise NotImplementedError
+
+    def decode(self, data):
+        raise NotImplementedError
+
+
+class TextCodec(Codec):
+    """Bytes as is, strings as utf-8; decoding returns the raw bytes."""
+    name = 'text'
+
+    def encode(self, obj):
+        return obj.encode('utf-8') if isinstance(obj, str) else bytes(obj)
+
+    def decode(self, data):
+        return bytes(data)
+
+
+class JsonCodec(Codec):
+    name = 'json'
+
+    def encode(self, obj):
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+    def decode(self, data):
+        return json.loads(bytes(data).decode('utf-8'))
+
+
+class MsgpackCodec(Codec):
+    """Compact binary maps and arrays; needs `msgpack` in requirements.txt."""
+    name = 'msgpack'
+
+    def encode(self, obj):
+        import msgpack
+        return msgpack.packb(obj, use_bin_type=True)
+
+    def decode(self, data):
+        import msgpack
+        return msgpack.unpackb(data, raw=False)
+
+
+class RawCodec(Codec):
+    """A list of byte buffers, each prefixed with its length.
+
+    A single buffer may be passed on its own, and strings are encoded as
+    utf-8. Decoding returns memoryview slices of the body, so nothing is
+    copied.
+    """
+    name = 'raw'
+
+    def encode(self, buffers):
+        if isinstance(buffers, (str, bytes, bytearray, memoryview)):
+            buffers = [buffers]
+        parts = [UINT32.pack(len(buffers))]
+        for buffer in buffers:
+            if isinstance(buffer, str):
+                buffer = buffer.encode('utf-8')
+            try:
+                buffer = memoryview(buffer).cast('B')
+            except TypeError:
+                raise TypeError("raw bodies are contiguous buffers or strings, not {}".format(
+                    type(buffer).__name__))
+            parts.append(UINT32.pack(len(buffer)))
+            parts.append(buffer)
+        return b''.join(parts)
+
+    def decode(self, data):
+        view = memoryview(data)
+        count, = UINT32.unpack_from(view, 0)
+        offset = 4
+        buffers = list()
+        for _ in range(count):
+            size, = UINT32.unpack_from(view, offset)
+            offset += 4
+            buffers.append(view[offset:offset + size])
+            offset += size
+        return buffers
+
+
+class NdarrayCodec(Codec):
+    """One NumPy array: a json header of dtype and shape, then its data.
+
+    The data starts on a 16 byte boundary and decodes with numpy.frombuffer
+    as a read-only array over the message body, without copying.
+    """
+    name = 'ndarray'
+    MAGIC = b'TNA1'
+    ALIGN = 16
+
+    def encode(self, array):
+        import numpy
+        array = numpy.ascontiguousarray(array)
+        header = json.dumps({'dtype': array.dtype.str, 'shape': list(array.shape)}).encode('utf-8')
+        offset = len(self.MAGIC) + UINT32.size + len(header)
+        padding = b' ' * (-offset % self.ALIGN)
+        return b''.join([self.MAGIC, UINT32.pack(len(header) + len(padding)),
+                         header, padding, array.tobytes()])
+
+    def decode(self, data):
+        import numpy
+        view = memoryview(data)
+        if bytes(view[:4]) != self.MAGIC:
+            raise ValueError("Not an ndarray frame.")
+        header_size, = UINT32.unpack_from(view, 4)
+        header = json.loads(bytes(view[8:8 + header_size]).decode('utf-8'))
+        array = numpy.frombuffer(view, dtype=numpy.dtype(header['dtype']),
+                                 offset=8 + header_size)
+        return array.reshape(header['shape'])
+
+
+CODECS = dict()
+
+
+def register_codec(codec):
+    """Make CODEC selectable as a queue body `format` in promise.yml."""
+    CODECS[codec.name] = codec
+
+
+for codec in [TextCodec(), JsonCodec(), MsgpackCodec(), RawCodec(), NdarrayCodec()]:
+    register_codec(codec)
+
+
+def get_codec(name):
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError("Unknown body format `{}`; known: {}".format(
+            name, ", ".join(sorted(CODECS))))
+
+
+def encode_body(obj, format='text', threshold=None):
+    """Return (body, headers) encoding OBJ with the codec named FORMAT.
+
+    Bodies of at least THRESHOLD bytes are zlib compressed; compression is
+    off unless a THRESHOLD is given, as it copies the body.
+    """
+    body = get_codec(format).encode(obj)
+    headers = dict()
+    if format != 'text':
+        headers[CODEC_HEADER] = format
+    if threshold is not None and len(body) >= threshold:
+        body = zlib.compress(body, 1)
+        headers[COMPRESSION_HEADER] = 'zlib'
+    return body, headers
+
+
+def decode_body(body, headers=None):
+    """Decode BODY according to its codec headers; raw bytes if it has none."""
+    headers = headers or dict()
+    if headers.get(COMPRESSION_HEADER) == 'zlib':
+        body = zlib.decompress(body)
+    return get_codec(headers.get(CODEC_HEADER, 'text')).decode(body)
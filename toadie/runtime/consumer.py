@@ -0,0 +1,406 @@
+import asyncio
+import functools
+import logging
+import math
+import sys
+from .codecs import decode_body, encode_body
+from .context import Context
+from .declare import declare_promise
+from .envelope import ENVELOPE_HEADER, is_envelope, pack, unpack
+from .logpolicy import BrokerLogHandler, LogPolicy
+from .metrics import METRICS_KEY, Metrics
+from .promise import PROMISE_FILE, amqp_url, env, load_promise
+from .producer import Producer, PublishError
+from .retry import ATTEMPTS_HEADER, DEAD_TIER, failure_headers, failure_route, retry_policy
+
+
+log = logging.getLogger(__name__)
+
+# Defaults, overridable in the `runtime` section of promise.yml.
+RUNTIME_DEFAULTS = {
+    'concurrency': 64,      # handlers running at once
+    'min_prefetch': 1,
+    'max_prefetch': 2000,
+    'ack_batch': 100,       # completed messages acknowledged with one multi-ack
+    'ack_interval': 0.05,   # seconds between ack flushes and prefetch tuning
+    'broker_rtt': 0.005,    # seconds, estimated network round trip to the broker
+    'producer_channels': 4, # channels publishing to outqueues
+    'publish_window': 1000, # unconfirmed publishes in flight
+    'envelope': False,      # pack small outqueue messages into envelopes
+    'metrics_interval': 10, # seconds between metrics sent to the log exchange, 0 disables
+    'log_interval': 0.5,    # seconds between log records sent to the log exchange, 0 disables
+}
+
+
+def message_bodies(body, headers):
+    """Decoded bodies carried by a message: one, or each of an envelope's."""
+    if is_envelope(headers):
+        return [decode_body(part, headers) for part in unpack(body)]
+    return [decode_body(body, headers)]
+
+
+class EnvelopeError(Exception):
+    """Handlers failed on some messages of an envelope.
+
+    ERROR is the first failure and BODY an envelope of the FAILED
+    messages, out of TOTAL.
+    """
+    def __init__(self, error, body, failed, total):
+        super(EnvelopeError, self).__init__(
+            "{} of {} messages failed: {!r}".format(failed, total, error))
+        self.error = error
+        self.body = body
+        self.failed = failed
+
+
+async def call_handler(handler, body, ctx):
+    """Await HANDLER, or run it in a thread if it is a plain function."""
+    if asyncio.iscoroutinefunction(handler):
+        return await handler(body, ctx)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(handler, body, ctx))
+
+
+class AckBatcher(object):
+    """Acknowledge completed deliveries with batched `multiple` acks.
+
+    Delivery tags increase per channel, and a multi-ack covers every tag up
+    to it. So only tags below the oldest delivery still in flight can be
+    acknowledged. Nacked deliveries leave the broker's unacked set
+    immediately, so a later multi-ack skips them.
+
+    Tags restart with every channel, so deliveries carry the generation of
+    the channel they arrived on; completions from a closed channel are
+    ignored, as the broker redelivers those messages.
+    """
+    def __init__(self, batch_size, metrics=None):
+        self.batch_size = batch_size
+        self.metrics = metrics
+        self.generation = 0
+        self.outstanding = dict()
+        self.completed = dict()
+
+    def count(self, counter, amount=1):
+        if self.metrics is not None:
+            self.metrics.count(counter, amount)
+
+    def delivered(self, message):
+        """Track MESSAGE; returns the generation to pass to `done` and `nack`."""
+        self.outstanding[message.delivery_tag] = message
+        return self.generation
+
+    def done(self, message, generation):
+        """Mark MESSAGE handled. Returns True when a batch is ready to flush."""
+        if generation != self.generation:
+            return False
+        self.outstanding.pop(message.delivery_tag, None)
+        self.completed[message.delivery_tag] = message
+        return len(self.completed) >= self.batch_size
+
+    async def nack(self, message, requeue=False, generation=None):
+        if generation is not None and generation != self.generation:
+            return
+        self.outstanding.pop(message.delivery_tag, None)
+        try:
+            await message.nack(requeue=requeue)
+        except Exception:
+            # The channel closed; the broker redelivers the message anyway.
+            log.warning("Could not nack delivery %s", message.delivery_tag)
+        else:
+            self.count('requeued' if requeue else 'nacked')
+
+    def ackable(self):
+        floor = min(self.outstanding) if self.outstanding else float('inf')
+        tags = [tag for tag in self.completed if tag < floor]
+        return max(tags) if tags else None
+
+    async def flush(self):
+        """Send one multi-ack for every ackable delivery. Returns the count."""
+        tag = self.ackable()
+        if tag is None:
+            return 0
+        acked = [t for t in self.completed if t <= tag]
+        message = self.completed[tag]
+        for t in acked:
+            del self.completed[t]
+        try:
+            await message.ack(multiple=True)
+        except Exception:
+            # The channel closed; the broker redelivers these messages.
+            log.warning("Could not ack deliveries up to %s", tag)
+            return 0
+        self.count('acked', len(acked))
+        return len(acked)
+
+    async def requeue_completed(self):
+        """Return completed but unacknowledged deliveries to their queues."""
+        completed, self.completed = self.completed, dict()
+        for message in completed.values():
+            await self.nack(message, requeue=True)
+
+    def reset(self):
+        """Forget deliveries of a channel that was closed."""
+        self.generation += 1
+        self.outstanding.clear()
+        self.completed.clear()
+
+
+class AdaptivePrefetch(object):
+    """Prefetch sized to keep every handler busy at the observed latency.
+
+    With C handlers of latency L, messages arrive at C/L per second and each
+    stays unacknowledged for L plus the ack delay and a broker round trip,
+    so by Little's law C * (1 + overhead / L) deliveries keep the pipeline
+    full. Latency is an exponentially weighted moving average.
+    """
+    def __init__(self, concurrency, minimum, maximum, overhead, alpha=0.2):
+        self.concurrency = concurrency
+        self.minimum = minimum
+        self.maximum = maximum
+        self.overhead = overhead
+        self.alpha = alpha
+        self.latency = None
+        self.value = self.clamp(concurrency * 2)
+
+    def clamp(self, value):
+        return int(max(self.minimum, min(self.maximum, value)))
+
+    def observe(self, seconds):
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += self.alpha * (seconds - self.latency)
+
+    def target(self):
+        if self.latency is None:
+            return self.value
+        return self.clamp(math.ceil(
+            self.concurrency * (1 + self.overhead / max(self.latency, 1e-6))))
+
+    def update(self):
+        """Adopt the target when it moved by over 20%. Returns True if changed."""
+        target = self.target()
+        if abs(target - self.value) > 0.2 * self.value:
+            self.value = target
+            return True
+        return False
+
+
+class Consumer(object):
+    """Consume a component's inqueues with bounded concurrency.
+
+    Exchanges, queues and bindings of promise.yml are declared once at
+    start. Deliveries are handed to `concurrency` workers running HANDLER,
+    acknowledged with batched multi-acks and prefetched adaptively.
+    Handlers publish through a pooled Producer with publisher confirms, and
+    a delivery is only acknowledged once its output is confirmed.
+    Bodies are decoded according to their codec headers; bodies without
+    them reach the handler as bytes. Envelopes are unpacked and
+    acknowledged as a whole once every message in them was handled or,
+    for those that failed, sent on to the retry tiers.
+    HANDLER(body, ctx) may be a coroutine function or a plain function,
+    which runs in a thread. Handler time, queue wait, sizes and ack
+    counts are aggregated and sent to the log exchange periodically, as
+    are log records admitted by the promise's `logpolicy`.
+    Deliveries whose handler failed are dropped, or with a `retry` policy
+    sent through its delay tiers and finally to the dead letters.
+    Delivery is at least once: a delivery whose retry publish fails is
+    requeued whole, so the messages of an envelope that were handled run
+    again, as they do after a lost connection.
+    """
+    def __init__(self, handler, component, promise, url=None, **options):
+        self.handler = handler
+        self.component = component
+        self.promise = promise
+        self.url = url or amqp_url()
+        self.options = dict(RUNTIME_DEFAULTS)
+        self.options.update(promise.get('runtime') or {})
+        self.options.update(options)
+        self.metrics = Metrics(component)
+        self.retry = retry_policy(promise)
+        self.acks = AckBatcher(self.options['ack_batch'], self.metrics)
+        self.prefetch = AdaptivePrefetch(
+            self.options['concurrency'],
+            self.options['min_prefetch'],
+            self.options['max_prefetch'],
+            self.options['ack_interval'] + self.options['broker_rtt'])
+        self.inbox = None
+        self.channel = None
+        self.publisher = None
+
+    async def connect(self):
+        import aio_pika
+
+        self.connection = await aio_pika.connect_robust(self.url)
+        self.channel = await self.connection.channel(publisher_confirms=False)
+        self.channel.close_callbacks.add(lambda *args: self.acks.reset())
+        await self.channel.set_qos(prefetch_count=self.prefetch.value, global_=True)
+        exchanges, queues = await declare_promise(self.channel, self.promise, self.component)
+        self.publisher = await Producer(
+            self.component, self.promise, connection=self.connection,
+            channels=self.options['producer_channels'],
+            window=self.options['publish_window'],
+            envelope=self.options['envelope']).start()
+        return queues
+
+    def context(self, message):
+        return Context(self.component, self.promise, self.publisher,
+                       headers=message.headers, routing_key=message.routing_key,
+                       exchange=message.exchange, message=message)
+
+    async def process(self, message):
+        """Run the handler on a delivery, or on each message of an envelope.
+
+        Every message of an envelope is handled even if one fails; those
+        that failed are raised together as an EnvelopeError.
+        """
+        ctx = self.context(message)
+        if not is_envelope(message.headers):
+            await call_handler(self.handler, decode_body(message.body, message.headers), ctx)
+            return
+        parts = unpack(message.body)
+        failed, error = list(), None
+        for index, part in enumerate(parts):
+            try:
+                await call_handler(self.handler, decode_body(part, message.headers), ctx)
+            except Exception as err:
+                log.exception("Handler failed on message %d of %d in %s",
+                              index + 1, len(parts), message.routing_key)
+                failed.append(bytes(part))
+                error = error if error is not None else err
+        if failed:
+            raise EnvelopeError(error, pack(failed), len(failed), len(parts))
+
+    async def on_message(self, message, queue=None):
+        generation = self.acks.delivered(message)
+        self.metrics.received(message.body, message.headers)
+        await self.inbox.put((message, queue, generation))
+
+    async def worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            message, queue, generation = await self.inbox.get()
+            started = loop.time()
+            try:
+                await self.process(message)
+            except Exception as err:
+                if not isinstance(err, EnvelopeError):
+                    log.exception("Handler failed on %s", message.routing_key)
+                self.metrics.handled(loop.time() - started, ok=False)
+                await self.failed(message, queue, err, generation)
+            else:
+                self.metrics.handled(loop.time() - started)
+                if self.acks.done(message, generation):
+                    await self.flush()
+            self.prefetch.observe(loop.time() - started)
+
+    async def failed(self, message, queue, err, generation):
+        """Send a failed delivery to its next retry tier, or to the dead
+        letters once out of attempts; drop it without a retry policy.
+        Of an envelope, only the messages that failed are sent on.
+        The delivery is acknowledged once that publish is confirmed, and
+        requeued if the publish fails."""
+        if self.retry is None or queue is None:
+            await self.acks.nack(message, requeue=False, generation=generation)
+            return
+        attempts = int((message.headers or {}).get(ATTEMPTS_HEADER, 0)) + 1
+        exchange, key = failure_route(self.component, self.retry, queue, attempts)
+        if isinstance(err, EnvelopeError):
+            headers = failure_headers(message.headers, queue, attempts, repr(err.error))
+            headers[ENVELOPE_HEADER] = err.failed
+            body = err.body
+        else:
+            headers = failure_headers(message.headers, queue, attempts, repr(err))
+            body = message.body
+        try:
+            await self.publisher.publish(exchange, key, body, headers)
+        except Exception:
+            log.exception("Could not send %s to %s; requeueing it", message.routing_key, key)
+            await self.acks.nack(message, requeue=True, generation=generation)
+            return
+        self.metrics.count('dead_lettered' if key.split('.')[-1] == DEAD_TIER else 'retried')
+        if self.acks.done(message, generation):
+            await self.flush()
+
+    async def flush(self):
+        """Acknowledge completed deliveries once what they published is confirmed."""
+        try:
+            await self.publisher.flush()
+        except PublishError:
+            log.exception("Requeueing deliveries whose output was not confirmed")
+            await self.acks.requeue_completed()
+        else:
+            await self.acks.flush()
+
+    async def tick(self):
+        """Flush acks and retune prefetch every `ack_interval` seconds."""
+        while True:
+            await asyncio.sleep(self.options['ack_interval'])
+            await self.flush()
+            if self.prefetch.update():
+                log.debug("Prefetch set to %s", self.prefetch.value)
+                await self.channel.set_qos(prefetch_count=self.prefetch.value, global_=True)
+
+    async def report(self):
+        """Send a metrics snapshot to the log exchange every `metrics_interval`."""
+        exchange = self.promise['logqueue']['exchange']['name']
+        while True:
+            await asyncio.sleep(self.options['metrics_interval'])
+            snapshot = self.metrics.snapshot()
+            if snapshot is None:
+                continue
+            body, headers = encode_body(snapshot, 'json')
+            try:
+                await self.publisher.publish(exchange, METRICS_KEY.format(self.component),
+                                             body, headers)
+            except Exception:
+                log.warning("Could not send metrics")
+
+    async def ship_logs(self):
+        """Publish admitted log records to the log exchange every `log_interval`."""
+        exchange = self.promise['logqueue']['exchange']['name']
+        handler = BrokerLogHandler(self.component, LogPolicy(self.promise.get('logpolicy')))
+        logging.getLogger().addHandler(handler)
+        try:
+            while True:
+                await asyncio.sleep(self.options['log_interval'])
+                for key, line in handler.drain():
+                    try:
+                        await self.publisher.publish(exchange, key, line.encode('utf-8'))
+                    except Exception:
+                        # Not logged: it would be shipped again.
+                        break
+        finally:
+            logging.getLogger().removeHandler(handler)
+
+    async def run(self):
+        self.inbox = asyncio.Queue()
+        queues = await self.connect()
+        workers = [asyncio.ensure_future(self.worker())
+                   for _ in range(self.options['concurrency'])]
+        workers.append(asyncio.ensure_future(self.tick()))
+        if (self.promise.get('logqueue') or {}).get('exchange'):
+            if self.options['metrics_interval']:
+                workers.append(asyncio.ensure_future(self.report()))
+            if self.options['log_interval']:
+                workers.append(asyncio.ensure_future(self.ship_logs()))
+        for inqueue in self.promise.get('inqueues') or []:
+            await queues[inqueue['name']].consume(
+                functools.partial(self.on_message, queue=inqueue['name']))
+        log.info("%s consuming %s", self.component,
+                 ", ".join(q['name'] for q in self.promise.get('inqueues') or []))
+        await asyncio.gather(*workers)
+
+
+def run(handler, promise_path=PROMISE_FILE, **options):
+    """Consume the inqueues of promise.yml with HANDLER until interrupted."""
+    logging.basicConfig(
+        stream=sys.stdout,
+        level=env('LOG_LEVEL', 'INFO'),
+        format='%(asctime)s %(name)s %(levelname)s %(message)s')
+    component, promise = load_promise(promise_path)
+    consumer = Consumer(handler, component, promise, **options)
+    try:
+        asyncio.run(consumer.run())
+    except KeyboardInterrupt:
+        pass
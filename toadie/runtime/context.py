@@ -0,0 +1,32 @@
+from .promise import prepare_publish
+
+
+# Carried from a delivery to everything published while handling it, so
+# `toadie bench` can match outputs to the inputs that caused them.
+TRACE_HEADER = 'x-toadie-trace'
+
+
+class Context(object):
+    """What a handler gets alongside the message body.
+
+    `publish` sends to one of the component's outqueues by name, encoded
+    with the outqueue's declared body format, or to any exchange by name
+    with an explicit routing key.
+    """
+    def __init__(self, component, promise, publisher,
+                 headers=None, routing_key=None, exchange=None, message=None):
+        self.component = component
+        self.promise = promise
+        self.publisher = publisher
+        self.headers = headers or dict()
+        self.routing_key = routing_key
+        self.exchange = exchange
+        self.message = message
+
+    async def publish(self, target, body, routing_key=None, headers=None):
+        if TRACE_HEADER in self.headers:
+            headers = dict(headers or {})
+            headers.setdefault(TRACE_HEADER, self.headers[TRACE_HEADER])
+        exchange, routing_key, body, headers = prepare_publish(
+            self.promise, target, body, routing_key, headers)
+        await self.publisher.publish(exchange, routing_key, body, headers)
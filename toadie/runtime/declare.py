@@ -0,0 +1,46 @@
+from .promise import queue_bindings
+from .retry import retry_queues
+
+
+def promise_queues(promise, component=None):
+    """Yield every queue a promise declares with an exchange, and those of
+    its retry policy given the COMPONENT it belongs to."""
+    for section in ('inqueues', 'outqueues'):
+        for queue in promise.get(section) or []:
+            yield queue
+    if component is not None:
+        for queue in retry_queues(component, promise):
+            yield queue
+
+
+def promise_exchanges(promise, component=None):
+    """Return {name: type} of every exchange a promise refers to."""
+    exchanges = dict()
+    for queue in promise_queues(promise, component):
+        exchanges[queue['exchange']['name']] = queue['exchange'].get('type', 'topic')
+    for section in ('logqueue', 'errqueue'):
+        if promise.get(section, {}).get('exchange'):
+            exchange = promise[section]['exchange']
+            exchanges[exchange['name']] = exchange.get('type', 'topic')
+    return exchanges
+
+
+async def declare_promise(channel, promise, component=None):
+    """Declare the exchanges, queues and bindings of PROMISE once.
+
+    Returns ({exchange name: exchange}, {queue name: queue}).
+    """
+    import aio_pika
+
+    exchanges = dict()
+    for name, kind in promise_exchanges(promise, component).items():
+        exchanges[name] = await channel.declare_exchange(
+            name, aio_pika.ExchangeType(kind), durable=True)
+    queues = dict()
+    for queue in promise_queues(promise, component):
+        declared = await channel.declare_queue(
+            queue['name'], durable=True, arguments=queue.get('arguments'))
+        for key in queue_bindings(queue):
+            await declared.bind(exchanges[queue['exchange']['name']], routing_key=key)
+        queues[queue['name']] = declared
+    return exchanges, queues
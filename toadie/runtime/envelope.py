@@ -0,0 +1,36 @@
+import struct
+
+
+# Header marking a message whose body packs several messages.
+ENVELOPE_HEADER = 'x-toadie-envelope'
+MAGIC = b'TDE1'
+COUNT = struct.Struct('>I')
+
+
+def pack(bodies):
+    """Pack BODIES into one length-prefixed envelope body."""
+    parts = [MAGIC, COUNT.pack(len(bodies))]
+    for body in bodies:
+        parts.append(COUNT.pack(len(body)))
+        parts.append(body)
+    return b''.join(parts)
+
+
+def unpack(envelope):
+    """Return the bodies packed in ENVELOPE as memoryview slices (no copies)."""
+    view = memoryview(envelope)
+    if bytes(view[:4]) != MAGIC:
+        raise ValueError("Not a toadie envelope.")
+    count, = COUNT.unpack_from(view, 4)
+    offset = 8
+    bodies = list()
+    for _ in range(count):
+        size, = COUNT.unpack_from(view, offset)
+        offset += 4
+        bodies.append(view[offset:offset + size])
+        offset += size
+    return bodies
+
+
+def is_envelope(headers):
+    return bool(headers) and ENVELOPE_HEADER in headers
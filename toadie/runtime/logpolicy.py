@@ -0,0 +1,148 @@
+import collections
+import logging
+import random
+import time
+
+
+LOG_KEY = '{}.log.{}'
+ERROR_KEY = '{}.ERROR'
+
+# Overridden per level by the `logpolicy` section of promise.yml:
+#   logpolicy:
+#     dedupe_window: 10     # seconds identical records are only counted
+#     levels:
+#       DEBUG: {sample: 0.1, rate: 50, burst: 100}
+# `sample` is the share of records kept, `rate` the records per second
+# published at most, with bursts of up to `burst`.
+DEFAULT_POLICY = {
+    'dedupe_window': 10,
+    'levels': {
+        'DEBUG': {'sample': 0.1, 'rate': 50, 'burst': 100},
+        'INFO': {'sample': 1.0, 'rate': 200, 'burst': 400},
+        'WARNING': {'sample': 1.0, 'rate': 200, 'burst': 400},
+        'ERROR': {'sample': 1.0, 'rate': 100, 'burst': 200},
+    },
+}
+# Loggers never published, so publishing cannot feed on itself.
+QUIET_LOGGERS = ('aio_pika', 'aiormq', 'pamqp', 'asyncio')
+
+
+class TokenBucket(object):
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class LogPolicy(object):
+    """Decide which log records of a component are published.
+
+    Identical records within `dedupe_window` seconds are published once
+    and then counted; each level is then sampled and rate limited. At most
+    `max_tracked` distinct records are deduplicated at once.
+    """
+    def __init__(self, config=None, max_tracked=10000):
+        config = config or dict()
+        self.dedupe_window = config.get('dedupe_window', DEFAULT_POLICY['dedupe_window'])
+        levels = dict((level, dict(policy)) for level, policy in DEFAULT_POLICY['levels'].items())
+        for level, policy in (config.get('levels') or {}).items():
+            levels.setdefault(level.upper(), dict()).update(policy or {})
+        self.levels = levels
+        self.buckets = dict((level, TokenBucket(policy['rate'], policy.get('burst')))
+                            for level, policy in levels.items() if policy.get('rate'))
+        self.max_tracked = max_tracked
+        self.seen = collections.OrderedDict()
+        self.suppressed = collections.Counter()
+
+    def level_of(self, levelname):
+        return levelname if levelname in self.levels else \
+            ('ERROR' if levelname == 'CRITICAL' else levelname)
+
+    def admit(self, levelname, message):
+        """Return True if a record should be published now."""
+        level = self.level_of(levelname)
+        if self.dedupe_window:
+            key = (level, message)
+            if key in self.seen:
+                self.seen[key][1] += 1
+                return False
+            if len(self.seen) < self.max_tracked:
+                self.seen[key] = [time.monotonic(), 0]
+        policy = self.levels.get(level, dict())
+        if policy.get('sample', 1.0) < 1.0 and random.random() >= policy['sample']:
+            self.suppressed[level] += 1
+            return False
+        if level in self.buckets and not self.buckets[level].take():
+            self.suppressed[level] += 1
+            return False
+        return True
+
+    def expired(self, now=None):
+        """Yield (level, message, count) of duplicates whose window ended."""
+        now = time.monotonic() if now is None else now
+        while self.seen:
+            (level, message), (first, count) = next(iter(self.seen.items()))
+            if now - first < self.dedupe_window:
+                break
+            del self.seen[(level, message)]
+            if count:
+                yield level, message, count
+
+    def drain_suppressed(self):
+        suppressed, self.suppressed = self.suppressed, collections.Counter()
+        return suppressed
+
+
+class BrokerLogHandler(logging.Handler):
+    """Queue admitted log records for publishing to the log exchange.
+
+    Records are formatted and kept in a bounded buffer, never blocking the
+    caller; `drain` returns the (routing key, line) pairs to publish,
+    including dedupe and suppression summaries.
+    """
+    def __init__(self, component, policy, capacity=10000):
+        super(BrokerLogHandler, self).__init__()
+        self.component = component
+        self.policy = policy
+        self.buffer = collections.deque(maxlen=capacity)
+        self.setFormatter(logging.Formatter('%(asctime)s %(name)s %(levelname)s %(message)s'))
+
+    def emit(self, record):
+        if record.name.split('.')[0] in QUIET_LOGGERS:
+            return
+        try:
+            if self.policy.admit(record.levelname, record.getMessage()):
+                self.buffer.append((record.levelname, self.format(record)))
+        except Exception:
+            self.handleError(record)
+
+    def keys(self, levelname):
+        level = self.policy.level_of(levelname)
+        keys = [LOG_KEY.format(self.component, level)]
+        if level == 'ERROR':
+            keys.append(ERROR_KEY.format(self.component))
+        return keys
+
+    def drain(self):
+        self.acquire()
+        try:
+            lines = list()
+            while self.buffer:
+                lines.append(self.buffer.popleft())
+            for level, message, count in self.policy.expired():
+                lines.append((level, '{} [repeated {} more times]'.format(message, count)))
+            for level, count in self.policy.drain_suppressed().items():
+                lines.append((level, 'suppressed {} {} records by log policy'.format(count, level)))
+        finally:
+            self.release()
+        return [(key, line) for level, line in lines for key in self.keys(level)]
@@ -0,0 +1,161 @@
+import bisect
+import time
+
+
+# Set by the Producer on every publish, in seconds since the epoch, so
+# consumers can measure how long messages waited in their queue.
+PUBLISHED_HEADER = 'x-toadie-published'
+METRICS_KEY = '{}.metrics'
+
+# Upper bounds of the histogram buckets; a last bucket counts the rest.
+# Every component uses the same bounds, so snapshots only carry counts.
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+HISTOGRAMS = {
+    'handler_seconds': SECONDS_BUCKETS,
+    'wait_seconds': SECONDS_BUCKETS,
+    'size_bytes': BYTES_BUCKETS,
+}
+COUNTERS = ['handled', 'failed', 'acked', 'nacked', 'requeued', 'retried', 'dead_lettered']
+
+
+class Histogram(object):
+    """Counts of observations per fixed bucket, and their sum."""
+    def __init__(self, bounds, counts=None, total=0.0):
+        self.bounds = bounds
+        self.counts = list(counts) if counts else [0] * (len(bounds) + 1)
+        self.total = total
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+
+    def merge(self, counts, total):
+        for index, count in enumerate(counts[:len(self.counts)]):
+            self.counts[index] += count
+        self.total += total
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def quantile(self, fraction):
+        """Estimate a quantile, interpolating within its bucket."""
+        count = self.count
+        if not count:
+            return None
+        rank = fraction * count
+        seen = 0
+        for index, bucket in enumerate(self.counts):
+            if bucket and seen + bucket >= rank:
+                lower = self.bounds[index - 1] if index else 0.0
+                if index == len(self.bounds):
+                    return lower
+                return lower + (self.bounds[index] - lower) * (rank - seen) / bucket
+            seen += bucket
+        return self.bounds[-1]
+
+
+class Metrics(object):
+    """Per-message measurements of a component, aggregated in process.
+
+    `snapshot` returns what was recorded since the previous snapshot as a
+    compact dict, published to the log exchange every `metrics_interval`.
+    """
+    def __init__(self, component):
+        self.component = component
+        self.reset()
+
+    def reset(self):
+        self.started = time.time()
+        self.histograms = dict((name, Histogram(bounds)) for name, bounds in HISTOGRAMS.items())
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+    def count(self, counter, amount=1):
+        self.counters[counter] += amount
+
+    def received(self, body, headers):
+        """Record the size of a delivery and how long it was queued."""
+        self.histograms['size_bytes'].observe(len(body))
+        published = (headers or {}).get(PUBLISHED_HEADER)
+        if published is not None:
+            self.histograms['wait_seconds'].observe(max(0.0, time.time() - float(published)))
+
+    def handled(self, seconds, ok=True):
+        self.histograms['handler_seconds'].observe(seconds)
+        self.count('handled' if ok else 'failed')
+
+    def snapshot(self):
+        """Return and reset what was recorded, or None if nothing was."""
+        if not any(self.counters.values()) and not any(
+                h.count for h in self.histograms.values()):
+            self.reset()
+            return None
+        now = time.time()
+        snapshot = {
+            'component': self.component,
+            'time': round(now, 3),
+            'interval': round(now - self.started, 3),
+            'counters': dict((k, v) for k, v in self.counters.items() if v),
+            'histograms': dict((name, [h.counts, round(h.total, 6)])
+                               for name, h in self.histograms.items() if h.count),
+        }
+        self.reset()
+        return snapshot
+
+
+class MetricsSeries(object):
+    """Merge metric snapshots into per-component series of fixed windows.
+
+    `add` returns the points of windows that closed: per component, the
+    message rate, counters and handler and queue wait percentiles.
+    """
+    def __init__(self, window=60):
+        self.window = window
+        self.open = dict()
+
+    def add(self, snapshot):
+        component = snapshot.get('component')
+        if not component:
+            return list()
+        start = int(snapshot.get('time', 0) // self.window * self.window)
+        points = self.close(before=start)
+        key = (component, start)
+        if key not in self.open:
+            self.open[key] = (dict.fromkeys(COUNTERS, 0),
+                              dict((name, Histogram(bounds)) for name, bounds in HISTOGRAMS.items()))
+        counters, histograms = self.open[key]
+        for counter, value in (snapshot.get('counters') or {}).items():
+            counters[counter] = counters.get(counter, 0) + value
+        for name, (counts, total) in (snapshot.get('histograms') or {}).items():
+            if name in histograms:
+                histograms[name].merge(counts, total)
+        return points
+
+    def close(self, before=None):
+        """Points of the windows starting before BEFORE, or all of them."""
+        points = list()
+        for key in sorted(self.open, key=lambda k: (k[1], k[0])):
+            if before is not None and key[1] >= before:
+                continue
+            counters, histograms = self.open.pop(key)
+            points.append(self.point(key[0], key[1], counters, histograms))
+        return points
+
+    def point(self, component, start, counters, histograms):
+        point = {
+            'component': component,
+            'start': start,
+            'window': self.window,
+            'rate': round(histograms['handler_seconds'].count / float(self.window), 3),
+        }
+        point.update(counters)
+        for name in ('handler_seconds', 'wait_seconds'):
+            for label, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+                value = histograms[name].quantile(fraction)
+                point['{}_{}'.format(name.split('_')[0], label)] = \
+                    None if value is None else round(value, 6)
+        histogram = histograms['size_bytes']
+        point['mean_bytes'] = round(histogram.total / histogram.count) if histogram.count else None
+        return point
@@ -0,0 +1,174 @@
+import asyncio
+import itertools
+import logging
+import time
+from .declare import declare_promise
+from .codecs import CODEC_HEADER, COMPRESSION_HEADER
+from .envelope import ENVELOPE_HEADER, pack
+from .metrics import PUBLISHED_HEADER
+from .promise import PROMISE_FILE, amqp_url, load_promise, prepare_publish
+
+
+log = logging.getLogger(__name__)
+
+
+class PublishError(Exception):
+    pass
+
+
+class Producer(object):
+    """Publish to a component's outqueues over one pooled connection.
+
+    Publishes are spread round robin over `channels` channels with
+    publisher confirms. Up to `window` unconfirmed publishes are in flight
+    at once; `flush` waits for all of them and raises PublishError if the
+    broker rejected any. Outqueue exchanges and queues are declared once.
+
+    With `envelope`, small messages to the same exchange and routing key,
+    with no headers besides their codec, are packed into one AMQP message. A batch is sent once it
+    reaches `envelope_count` messages or `envelope_bytes`, or after
+    `linger` seconds. Consumers built on this runtime unpack envelopes
+    transparently.
+    """
+    def __init__(self, component, promise, url=None, connection=None,
+                 channels=4, window=1000, envelope=False,
+                 envelope_count=500, envelope_bytes=128 * 1024, linger=0.005):
+        self.component = component
+        self.promise = promise
+        self.url = url or amqp_url()
+        self.connection = connection
+        self.owns_connection = connection is None
+        self.channel_count = channels
+        self.window = asyncio.Semaphore(window)
+        self.envelope = envelope
+        self.envelope_count = envelope_count
+        self.envelope_bytes = envelope_bytes
+        self.linger = linger
+        self.channels = list()
+        self.exchanges = list()
+        self.next_channel = None
+        self.in_flight = set()
+        self.failures = list()
+        self.batches = dict()
+        self.timers = dict()
+
+    @classmethod
+    def from_promise(cls, promise_path=PROMISE_FILE, **options):
+        component, promise = load_promise(promise_path)
+        return cls(component, promise, **options)
+
+    async def start(self):
+        import aio_pika
+
+        if self.connection is None:
+            self.connection = await aio_pika.connect_robust(self.url)
+        for index in range(self.channel_count):
+            channel = await self.connection.channel(publisher_confirms=True)
+            if index == 0:
+                await declare_promise(channel, self.promise, self.component)
+            self.channels.append(channel)
+            self.exchanges.append(dict())
+        self.next_channel = itertools.cycle(range(self.channel_count))
+        return self
+
+    async def exchange(self, index, name):
+        if name not in self.exchanges[index]:
+            self.exchanges[index][name] = await self.channels[index].get_exchange(
+                name, ensure=False)
+        return self.exchanges[index][name]
+
+    async def send(self, target, obj, routing_key=None, headers=None):
+        """Publish OBJ to the outqueue named TARGET, or to exchange TARGET.
+
+        OBJ is encoded with the body format the outqueue declares.
+        """
+        exchange, routing_key, body, headers = prepare_publish(
+            self.promise, target, obj, routing_key, headers)
+        await self.publish(exchange, routing_key, body, headers)
+
+    async def publish(self, exchange, routing_key, body, headers=None):
+        headers = headers or dict()
+        if self.envelope and set(headers) <= set([CODEC_HEADER, COMPRESSION_HEADER]):
+            await self.add_to_batch(exchange, routing_key, body, headers)
+        else:
+            await self.transmit(exchange, routing_key, body, headers)
+
+    async def transmit(self, exchange, routing_key, body, headers=None):
+        """Start a confirmed publish once the confirm window has room."""
+        import aio_pika
+
+        await self.window.acquire()
+        try:
+            index = next(self.next_channel)
+            headers = dict(headers or {})
+            headers[PUBLISHED_HEADER] = time.time()
+            message = aio_pika.Message(bytes(body), headers=headers,
+                                       delivery_mode=aio_pika.DeliveryMode.PERSISTENT)
+            target = await self.exchange(index, exchange)
+            confirmation = asyncio.ensure_future(target.publish(message, routing_key=routing_key))
+        except BaseException:
+            # Until `confirmed` is attached nothing else frees the slot,
+            # and a window of leaked slots blocks every later publish.
+            self.window.release()
+            raise
+        self.in_flight.add(confirmation)
+        confirmation.add_done_callback(self.confirmed)
+
+    def confirmed(self, confirmation):
+        self.in_flight.discard(confirmation)
+        self.window.release()
+        if not confirmation.cancelled() and confirmation.exception() is not None:
+            self.failures.append(confirmation.exception())
+
+    async def add_to_batch(self, exchange, routing_key, body, headers):
+        key = (exchange, routing_key, tuple(sorted(headers.items())))
+        batch = self.batches.setdefault(key, [0, list()])
+        batch[0] += len(body)
+        batch[1].append(bytes(body))
+        if len(batch[1]) >= self.envelope_count or batch[0] >= self.envelope_bytes:
+            await self.send_batch(key)
+        elif key not in self.timers:
+            loop = asyncio.get_running_loop()
+            self.timers[key] = loop.call_later(
+                self.linger, lambda: asyncio.ensure_future(self.send_batch(key)))
+
+    async def send_batch(self, key):
+        timer = self.timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self.batches.pop(key, None)
+        if not batch:
+            return
+        bodies = batch[1]
+        headers = dict(key[2])
+        if len(bodies) == 1:
+            await self.transmit(key[0], key[1], bodies[0], headers)
+        else:
+            headers[ENVELOPE_HEADER] = len(bodies)
+            await self.transmit(key[0], key[1], pack(bodies), headers)
+
+    async def flush(self):
+        """Send pending envelopes and wait until every publish is confirmed."""
+        for key in list(self.batches):
+            await self.send_batch(key)
+        if self.in_flight:
+            await asyncio.wait(list(self.in_flight))
+        if self.failures:
+            failures, self.failures = self.failures, list()
+            raise PublishError("{} publishes were not confirmed: {}".format(
+                len(failures), failures[0]))
+
+    async def close(self):
+        try:
+            await self.flush()
+        finally:
+            for channel in self.channels:
+                await channel.close()
+            if self.owns_connection and self.connection is not None:
+                await self.connection.close()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
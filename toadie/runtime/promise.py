@@ -0,0 +1,105 @@
+import os
+import yaml
+from .codecs import encode_body
+
+
+PROMISE_FILE = 'promise.yml'
+# Value `update-dotenv` gives variables it finds in code but not in `.env`.
+BLANK = '__blank__'
+# libyaml's loader when PyYAML was built with it.
+SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def load_promise(path=PROMISE_FILE):
+    """Return (component_name, promise) declared in promise.yml at PATH."""
+    with open(path, 'r') as _:
+        declared = yaml.load(_, Loader=SafeLoader) or dict()
+    name, promise = next(iter(declared.items()))
+    return name, promise or dict()
+
+
+def queue_bindings(queue):
+    """Routing keys a promise queue is bound with."""
+    bindings = queue.get('bindings') or dict()
+    keys = list()
+    for kind in ('topics', 'topic', 'keys'):
+        keys.extend(bindings.get(kind) or [])
+    return keys
+
+
+def routing_key(queue):
+    """A concrete routing key reaching QUEUE through its first binding."""
+    keys = queue_bindings(queue)
+    if not keys:
+        return queue.get('name', '')
+    words = list()
+    for word in keys[0].split('.'):
+        if word == '#':
+            continue
+        words.append('default' if word == '*' else word)
+    return '.'.join(words)
+
+
+def resolve_target(promise, target, key=None):
+    """Return (exchange, routing key) to publish to TARGET.
+
+    TARGET names one of the promise's outqueues, or else an exchange; KEY
+    overrides the routing key.
+    """
+    for queue in promise.get('outqueues') or []:
+        if queue.get('name') == target:
+            return queue['exchange']['name'], key or routing_key(queue)
+    return target, key or ''
+
+
+def target_body(promise, target):
+    """Body declaration of outqueue TARGET, e.g. {format: msgpack,
+    compress_above: 65536}; bodies are only compressed with compress_above."""
+    for queue in promise.get('outqueues') or []:
+        if queue.get('name') == target:
+            return queue.get('body') or dict()
+    return dict()
+
+
+def prepare_publish(promise, target, obj, key=None, headers=None):
+    """Return (exchange, routing key, body, headers) publishing OBJ to TARGET.
+
+    OBJ is encoded with the codec of TARGET's declared body format.
+    """
+    exchange, key = resolve_target(promise, target, key)
+    declared = target_body(promise, target)
+    body, codec_headers = encode_body(
+        obj, declared.get('format', 'text'),
+        declared.get('compress_above'))
+    codec_headers.update(headers or {})
+    return exchange, key, body, codec_headers
+
+
+def env(key, default=None):
+    """Environment variable KEY, or DEFAULT when unset, empty or `__blank__`."""
+    value = os.environ.get(key)
+    if not value or value == BLANK:
+        return default
+    return value
+
+
+def env_int(key, default):
+    """Environment variable KEY as an int, or DEFAULT as for `env`."""
+    value = env(key)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError("{} must be a whole number, not {!r}".format(key, value))
+
+
+def amqp_url():
+    """Broker url from AMQP_URL or the rabbitmq service credentials in `.env`."""
+    if env('AMQP_URL'):
+        return env('AMQP_URL')
+    return 'amqp://{}:{}@{}:{}/'.format(
+        env('RABBITMQ_DEFAULT_USER', 'guest'),
+        env('RABBITMQ_DEFAULT_PASS', 'guest'),
+        env('RABBITMQ_HOST', 'rabbitmq'),
+        env('RABBITMQ_PORT', '5672'))
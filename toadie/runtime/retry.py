@@ -0,0 +1,110 @@
+# Delayed retries and dead letters of deliveries whose handler failed.
+#
+# A failed delivery is published to the component's `<component>Failed`
+# exchange with the routing key `<inqueue>.<tier>`. Each tier is a queue
+# without consumers whose messages expire after the tier's delay and are
+# then dead-lettered by the broker to `<component>Retry`, where every
+# inqueue is bound with `<inqueue>.*`. Once `max_attempts` runs failed, the
+# delivery goes to `<component>DeadLetters` instead, with the key
+# `<inqueue>.dead`.
+
+# Headers of a delivery sent to a retry tier or the dead letters.
+ATTEMPTS_HEADER = 'x-toadie-attempts'
+QUEUE_HEADER = 'x-toadie-queue'
+ERROR_HEADER = 'x-toadie-error'
+
+# Defaults, overridable in the `retry` section of promise.yml.
+RETRY_DEFAULTS = {
+    'max_attempts': 5,          # handler runs before a message is dead-lettered
+    'delays': [1, 10, 60, 300], # seconds before each retry; the last one repeats
+}
+
+FAILED_EXCHANGE = '{}Failed'
+RETRY_EXCHANGE = '{}Retry'
+DELAY_QUEUE = '{}Delay{}'
+DEAD_LETTER_QUEUE = '{}DeadLetters'
+DEAD_TIER = 'dead'
+# Routing key word of dead letters replayed to their inqueue.
+REPLAY_TIER = 'replay'
+# Longest error text carried in ERROR_HEADER.
+ERROR_LIMIT = 1000
+
+
+def retry_policy(promise):
+    """The promise's `retry` section over RETRY_DEFAULTS, or None without one."""
+    if not promise.get('retry'):
+        return None
+    policy = dict(RETRY_DEFAULTS)
+    policy.update(promise['retry'])
+    return policy
+
+
+def tier_name(seconds):
+    """Routing key word of a delay, e.g. `10s` or `0_5s`."""
+    return '{:g}s'.format(seconds).replace('.', '_')
+
+
+def retry_queues(component, promise):
+    """Queues implementing the promise's retry policy, declared like promise queues.
+
+    Delay tiers and the dead letters are bound to the Failed exchange and
+    carry their `role`; each inqueue is bound again to the Retry exchange.
+    """
+    policy = retry_policy(promise)
+    if policy is None:
+        return list()
+    failed = {'name': FAILED_EXCHANGE.format(component), 'type': 'topic'}
+    retry = {'name': RETRY_EXCHANGE.format(component), 'type': 'topic'}
+    queues = list()
+    for seconds in sorted(set(policy['delays'])):
+        tier = tier_name(seconds)
+        queues.append({
+            'name': DELAY_QUEUE.format(component, tier),
+            'exchange': failed,
+            'bindings': {'topics': ['*.{}'.format(tier)]},
+            'arguments': {'x-message-ttl': int(seconds * 1000),
+                          'x-dead-letter-exchange': retry['name']},
+            'role': 'delay',
+        })
+    queues.append({
+        'name': DEAD_LETTER_QUEUE.format(component),
+        'exchange': failed,
+        'bindings': {'topics': ['*.{}'.format(DEAD_TIER)]},
+        'role': 'dead-letter',
+    })
+    for inqueue in promise.get('inqueues') or []:
+        queues.append({
+            'name': inqueue['name'],
+            'exchange': retry,
+            'bindings': {'topics': ['{}.*'.format(inqueue['name'])]},
+            'arguments': inqueue.get('arguments'),
+        })
+    return queues
+
+
+def failure_route(component, policy, queue, attempts):
+    """(exchange, routing key) of a delivery from QUEUE that failed ATTEMPTS times."""
+    if attempts >= policy['max_attempts'] or not policy['delays']:
+        tier = DEAD_TIER
+    else:
+        tier = tier_name(policy['delays'][min(attempts, len(policy['delays'])) - 1])
+    return FAILED_EXCHANGE.format(component), '{}.{}'.format(queue, tier)
+
+
+def failure_headers(headers, queue, attempts, error):
+    """HEADERS of a failed delivery, plus its attempts, inqueue and error."""
+    headers = dict(headers or {})
+    headers[ATTEMPTS_HEADER] = attempts
+    headers[QUEUE_HEADER] = queue
+    headers[ERROR_HEADER] = error[:ERROR_LIMIT]
+    return headers
+
+
+def replay_route(component, headers):
+    """(exchange, routing key, headers) returning a dead letter to its inqueue
+    with every attempt available again."""
+    headers = dict(headers or {})
+    queue = headers.pop(QUEUE_HEADER)
+    headers.pop(ATTEMPTS_HEADER, None)
+    headers.pop(ERROR_HEADER, None)
+    return RETRY_EXCHANGE.format(component), '{}.{}'.format(queue, REPLAY_TIER), headers
@@ -0,0 +1,137 @@
+import asyncio
+import gzip
+import itertools
+import json
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+log = logging.getLogger(__name__)
+
+
+def log_line(routing_key, body):
+    """One line of a sink file: time, routing key and the body, as json
+    unless it is bytes."""
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    elif not isinstance(body, (bytes, bytearray, memoryview)):
+        body = json.dumps(body, separators=(',', ':'), default=str).encode('utf-8')
+    return b' '.join([time.strftime('%Y-%m-%dT%H:%M:%S').encode('utf-8'),
+                      (routing_key or '').encode('utf-8'), bytes(body)])
+
+
+def compress_file(path):
+    """Gzip PATH into PATH.gz and remove it."""
+    tmp_path = path + '.gz.tmp'
+    with open(path, 'rb') as source, gzip.open(tmp_path, 'wb', compresslevel=6) as target:
+        shutil.copyfileobj(source, target, 1024 * 1024)
+    os.replace(tmp_path, path + '.gz')
+    os.unlink(path)
+
+
+class FileSink(object):
+    """Append lines to `<directory>/<name>.log` in durable batches.
+
+    Writes are buffered and flushed in one write and fsync once
+    `flush_bytes` are pending or `flush_interval` seconds after the first
+    pending write. `write` returns only once its line is on disk, so a
+    handler awaiting it is acknowledged after the data is durable, and many
+    concurrent handlers share each fsync. The file is rotated at
+    `max_bytes`; rotated files are gzipped by a background thread.
+    """
+    def __init__(self, directory, name, max_bytes=64 * 1024 * 1024,
+                 flush_bytes=1024 * 1024, flush_interval=0.5, compress=True):
+        self.directory = directory
+        self.name = name
+        self.max_bytes = max_bytes
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.compress = compress
+        self.path = os.path.join(directory, '{}.log'.format(name))
+        self.file = None
+        self.buffer = list()
+        self.size = 0
+        self.pending = None
+        self.timer = None
+        self.lock = None
+        self.rotations = itertools.count()
+        # One writer thread keeps batches in order; compression never delays them.
+        self.writer = ThreadPoolExecutor(max_workers=1)
+        self.compressor = ThreadPoolExecutor(max_workers=1)
+
+    async def write(self, line):
+        """Buffer LINE, bytes or str, and wait until it is flushed to disk."""
+        if isinstance(line, str):
+            line = line.encode('utf-8')
+        if not line.endswith(b'\n'):
+            line += b'\n'
+        if self.pending is None:
+            self.pending = asyncio.get_running_loop().create_future()
+        pending = self.pending
+        self.buffer.append(line)
+        self.size += len(line)
+        if self.size >= self.flush_bytes > self.size - len(line):
+            asyncio.ensure_future(self.flush())
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(
+                self.flush_interval, lambda: asyncio.ensure_future(self.flush()))
+        await asyncio.shield(pending)
+
+    async def flush(self):
+        """Write and fsync the buffered lines, then release their writers."""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not self.buffer:
+            return
+        data, pending = b''.join(self.buffer), self.pending
+        self.buffer, self.size, self.pending = list(), 0, None
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(self.writer, self.write_file, data)
+            except Exception as err:
+                pending.set_exception(err)
+            else:
+                pending.set_result(None)
+
+    def write_file(self, data):
+        if self.file is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self.file = open(self.path, 'ab')
+        self.file.write(data)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        if self.file.tell() >= self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        self.file.close()
+        self.file = None
+        rotated = os.path.join(self.directory, '{}-{}-{}.log'.format(
+            self.name, time.strftime('%Y%m%dT%H%M%S'), next(self.rotations)))
+        os.replace(self.path, rotated)
+        if self.compress:
+            future = self.compressor.submit(compress_file, rotated)
+            future.add_done_callback(self.compressed)
+
+    def compressed(self, future):
+        if future.exception() is not None:
+            log.warning("Could not compress rotated log: %s", future.exception())
+
+    async def close(self):
+        await self.flush()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.writer, self.close_file)
+        self.writer.shutdown(wait=True)
+        self.compressor.shutdown(wait=True)
+
+    def close_file(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
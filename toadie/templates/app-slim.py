@@ -0,0 +1,20 @@
+# syntax=docker/dockerfile:1
+# Wheels are built once into the project wheelhouse, a BuildKit cache shared
+# by every component, then installed offline into a clean runtime stage.
+FROM {{python:slim}} AS wheels
+WORKDIR /app
+COPY requirements.txt /app/
+RUN --mount=type=cache,id={{wheelhouse}},target=/wheelhouse,sharing=locked \
+    --mount=type=cache,id={{wheelhouse}}-pip,target=/root/.cache/pip \
+    pip wheel --wheel-dir /wheels --find-links /wheelhouse -r requirements.txt \
+    && find /wheels -name '*.whl' -exec cp -n {} /wheelhouse/ \;
+
+FROM {{python:slim}}
+RUN mkdir /app
+WORKDIR /app
+ADD requirements.txt /app/
+RUN --mount=type=bind,from=wheels,source=/wheels,target=/wheels \
+    pip install --no-cache-dir --no-index --find-links /wheels -r requirements.txt
+ADD . /app/
+CMD ["/app/run.sh"]
+EXPOSE 8000
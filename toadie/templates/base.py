@@ -0,0 +1,7 @@
+# syntax=docker/dockerfile:1
+# Project base image: dependencies shared by every component, installed once.
+FROM {{python}}
+RUN mkdir /base
+ADD requirements.txt /base/
+RUN --mount=type=cache,id={{wheelhouse}}-pip,target=/root/.cache/pip \
+    pip install -r /base/requirements.txt
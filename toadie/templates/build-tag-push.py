@@ -1,9 +1,14 @@
 #!/usr/bin/env python
 
 import os
+import fnmatch
+import hashlib
+import json
+import re
 import subprocess
 import time
 import yaml
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import sys
 
@@ -14,6 +19,152 @@ out_hdlr.setLevel(logging.INFO)
 log.addHandler(out_hdlr)
 log.setLevel(logging.INFO)
 
+# Cache mounts in `--base slim` Dockerfiles need BuildKit.
+os.environ.setdefault('DOCKER_BUILDKIT', '1')
+os.environ.setdefault('COMPOSE_DOCKER_CLI_BUILD', '1')
+
+
+def env(key, default=None):
+    """Environment variable KEY, or DEFAULT when unset, empty or `__blank__`."""
+    value = os.environ.get(key)
+    if not value or value == '__blank__':
+        return default
+    return value
+
+
+def env_int(key, default):
+    value = env(key)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        log.error("{} must be a whole number, not {!r}".format(key, value))
+        exit(1)
+
+
+# Concurrent build/push pipelines and attempts per push.
+BUILD_WORKERS = env_int('BUILD_WORKERS', 4)
+PUSH_RETRIES = env_int('PUSH_RETRIES', 3)
+
+# Maps each service's build context digest to the registry image built from it.
+BUILD_MANIFEST = os.path.join('.toadie', 'builds.json')
+
+
+def dockerignore_patterns(context):
+    path = os.path.join(context, '.dockerignore')
+    if not os.path.isfile(path):
+        return []
+    with open(path) as _:
+        return [l.strip().strip('/') for l in _.read().splitlines()
+                if l.strip() and not l.strip().startswith(('#', '!'))]
+
+
+def context_digest(context, dockerfile):
+    """Hash every file docker would send for CONTEXT, plus DOCKERFILE."""
+    patterns = dockerignore_patterns(context)
+    ignored = lambda rel: any(fnmatch.fnmatch(rel, p) for p in patterns)
+    digest = hashlib.sha256()
+    paths = [dockerfile]
+    for root, dirs, files in os.walk(context):
+        rel_root = os.path.relpath(root, context)
+        rel_root = '' if rel_root == '.' else rel_root
+        dirs[:] = sorted(d for d in dirs if not ignored(os.path.join(rel_root, d)))
+        paths.extend(os.path.join(root, f) for f in sorted(files)
+                     if not ignored(os.path.join(rel_root, f)))
+    for path in paths:
+        if not os.path.isfile(path):
+            continue
+        digest.update(os.path.relpath(path, context).encode('utf-8') + b'\0')
+        with open(path, 'rb') as _:
+            for chunk in iter(lambda: _.read(1 << 20), b''):
+                digest.update(chunk)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def base_images(project_name):
+    """Return {image: context} of project base images in base/<flavour>/."""
+    slug = re.sub(r'[^a-z0-9_.-]', '-', project_name.lower())
+    images = dict()
+    if os.path.isdir('base'):
+        for flavour in sorted(os.listdir('base')):
+            context = os.path.join('base', flavour)
+            if os.path.isfile(os.path.join(context, 'Dockerfile')):
+                images['{}-base-{}'.format(slug, flavour)] = context
+    return images
+
+
+def build_context(service):
+    build = service['build']
+    if isinstance(build, dict):
+        context = build.get('context', '.')
+        dockerfile = build.get('dockerfile', 'Dockerfile')
+    else:
+        context, dockerfile = build, 'Dockerfile'
+    return context, os.path.join(context, dockerfile)
+
+
+def push(registry_image):
+    """Push REGISTRY_IMAGE, retrying failures with exponential backoff."""
+    for attempt in range(1, PUSH_RETRIES + 1):
+        if subprocess.call(["docker", "push", registry_image]) == 0:
+            return
+        if attempt < PUSH_RETRIES:
+            log.warning("Push of {} failed, retry {}/{}".format(
+                registry_image, attempt, PUSH_RETRIES - 1))
+            time.sleep(2 ** attempt)
+    raise subprocess.CalledProcessError(1, ["docker", "push", registry_image])
+
+
+def image_size(image):
+    try:
+        return int(subprocess.check_output(
+            ["docker", "image", "inspect", "--format", "{{.Size}}", image]).strip())
+    except (subprocess.CalledProcessError, ValueError):
+        return None
+
+
+def build_and_push(input_file, service_name, compose_image, registry_image):
+    """Build, tag and push one service. Returns its timings."""
+    timing = dict(service=service_name)
+    started = time.time()
+    subprocess.check_call(['docker-compose', '-f', input_file, 'build', service_name])
+    # Re-tag the image so that it can be uploaded to the Registry.
+    subprocess.check_call(["docker", "tag", compose_image, registry_image])
+    timing['build'] = time.time() - started
+    started = time.time()
+    push(registry_image)
+    timing['push'] = time.time() - started
+    timing['bytes'] = image_size(registry_image)
+    return timing
+
+
+def timing_table(timings):
+    lines = ["{:<30} {:>9} {:>9} {:>14}".format('service', 'build s', 'push s', 'bytes')]
+    for timing in sorted(timings, key=lambda t: -(t['build'] + t['push'])):
+        lines.append("{:<30} {:>9.1f} {:>9.1f} {:>14}".format(
+            timing['service'], timing['build'], timing['push'],
+            timing['bytes'] if timing['bytes'] is not None else '-'))
+    return "\n".join(lines)
+
+
+def load_build_manifest():
+    try:
+        with open(BUILD_MANIFEST) as _:
+            return json.load(_)
+    except (IOError, ValueError):
+        return dict()
+
+
+def save_build_manifest(manifest):
+    if not os.path.isdir(os.path.dirname(BUILD_MANIFEST)):
+        os.makedirs(os.path.dirname(BUILD_MANIFEST))
+    tmp_path = BUILD_MANIFEST + '.tmp'
+    with open(tmp_path, 'w') as _:
+        json.dump(manifest, _, indent=2, sort_keys=True)
+    os.rename(tmp_path, BUILD_MANIFEST)
+
 # Get docker login credentials.
 docker = dict()
 docker['DOCKER_USER'] = os.environ.get('DOCKER_USER')
@@ -39,8 +190,9 @@ subprocess.check_call(["docker", "login", "-u", docker['DOCKER_USER'], "-p", doc
 # Generate Docker image tag using timestamp.
 version = str(int(time.time()))
 
-input_file = os.environ.get("DOCKER_COMPOSE_YML", "docker-compose.yml")
-output_file = os.environ.get("DOCKER_COMPOSE_YML", "docker-compose-{}.yml".format(version))
+# Projects with compose fragments pass their merged file as DOCKER_COMPOSE_INPUT.
+input_file = env("DOCKER_COMPOSE_INPUT") or env("DOCKER_COMPOSE_YML", "docker-compose.yml")
+output_file = env("DOCKER_COMPOSE_YML", "docker-compose-{}.yml".format(version))
 
 if input_file == output_file == "docker-compose.yml":
     log.error("""
@@ -55,35 +207,83 @@ log.info("Output file: {}".format(output_file))
 # Get the name of the current directory.
 project_name = os.path.basename(os.path.realpath("."))
 
-# Execute "docker-compose build" and abort if it fails.
-subprocess.check_call(['docker-compose', '-f', input_file, 'build'])
-
 # Load the services from the input docker-compose.yml file.
-stack = yaml.load(open(input_file))
+with open(input_file) as _:
+    stack = yaml.safe_load(_)
+services = stack['services'] if 'services' in stack else stack
 
-# Iterate over all services that have a "build" definition.
-# Tag them and initiate a push in the background.
-push_operations = dict()
-for service_name, service in stack.items():
+# Build project base images first, once; components inherit FROM them.
+base_digests = dict()
+for base_image, context in base_images(project_name).items():
+    log.info("Building base image {}".format(base_image))
+    subprocess.check_call(["docker", "build", "-t", base_image, context])
+    base_digests[base_image] = context_digest(context, os.path.join(context, 'Dockerfile'))
+
+# Hash each build context. Services whose digest already has a registry image
+# reuse it; only the rest are built and pushed. Set FORCE_BUILD=1 to rebuild all.
+manifest = load_build_manifest()
+force = env('FORCE_BUILD') == '1'
+digests = dict()
+changed = list()
+for service_name, service in services.items():
     if "build" in service:
+        context, dockerfile = build_context(service)
+        digest = context_digest(context, dockerfile)
+        # A changed base image changes every component built FROM it.
+        with open(dockerfile) as _:
+            from_lines = [l.split() for l in _.read().splitlines() if l.upper().startswith('FROM')]
+        for base_image in sorted(base_digests):
+            if any(len(l) > 1 and l[1] == base_image for l in from_lines):
+                digest = hashlib.sha256((digest + base_digests[base_image]).encode('utf-8')).hexdigest()
+        digests[service_name] = digest
+        image = manifest.get(service_name, {}).get(digests[service_name])
+        if force or image is None or not image.startswith(docker['DOCKER_REGISTRY'] + '/'):
+            changed.append(service_name)
+        else:
+            log.info("{} unchanged, reusing {}".format(service_name, image))
+            del service["build"]
+            service["image"] = image
+
+# Build and push changed services, BUILD_WORKERS at a time. Each push starts
+# as soon as its own build is done.
+pipelines = dict()
+with ThreadPoolExecutor(max_workers=BUILD_WORKERS) as pool:
+    for service_name in changed:
         compose_image = "{}_{}:{}".format(project_name, service_name, "latest")
-        log.info(compose_image)
         registry_image = "{}/{}:{}".format(docker['DOCKER_REGISTRY'], service_name, version)
-        log.info(registry_image)
-        # Re-tag the image so that it can be uploaded to the Registry.
-        subprocess.check_call(["docker", "tag", compose_image, registry_image])
-        # Spawn "docker push" to upload the image.
-        push_operations[service_name] = subprocess.Popen(["docker", "push", registry_image])
-        # Replace the "build" definition by and "image" definition,
-        # using the name of the image on the Registry.
-        del service["build"]
-        service["image"] = registry_image
-
-# Wait for push operations to complete.
-for service_name, popen_object in push_operations.items():
-    log.info("Waiting for {} push to complete...".format(service_name))
-    popen_object.wait()
-    log.info("Push to registry complete.")
+        log.info("{} -> {}".format(compose_image, registry_image))
+        pipelines[service_name] = (registry_image, pool.submit(
+            build_and_push, input_file, service_name, compose_image, registry_image))
+
+timings = list()
+failed = list()
+for service_name, (registry_image, future) in sorted(pipelines.items()):
+    # Any failure only fails its own service, so the digests of those that
+    # did push are still saved below.
+    try:
+        timings.append(future.result())
+    except subprocess.CalledProcessError as err:
+        log.error("{} failed: {}".format(service_name, err))
+        failed.append(service_name)
+        continue
+    except Exception:
+        log.exception("{} failed".format(service_name))
+        failed.append(service_name)
+        continue
+    # Replace the "build" definition by and "image" definition,
+    # using the name of the image on the Registry.
+    service = services[service_name]
+    del service["build"]
+    service["image"] = registry_image
+    manifest.setdefault(service_name, dict())[digests[service_name]] = registry_image
+save_build_manifest(manifest)
+
+if timings:
+    log.info("Build and push timings:\n" + timing_table(timings))
+
+if failed:
+    log.error("Not writing {}; failed services: {}".format(output_file, ", ".join(failed)))
+    exit(1)
 
 # Write the new docker-compose.yml file.
 with open(output_file, "w") as f:
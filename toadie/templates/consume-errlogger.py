@@ -0,0 +1,18 @@
+"""Consumer of the stack's errors, as declared in promise.yml.
+
+Every component's `<component>.ERROR` messages are appended to
+`$LOG_DIR/errlogger.log`, rotated and gzipped as it grows. A message is
+acknowledged once it is on disk.
+"""
+import toadie_runtime
+
+
+errors = toadie_runtime.FileSink(toadie_runtime.env('LOG_DIR', 'logs'), 'errlogger')
+
+
+async def handle(body, ctx):
+    await errors.write(toadie_runtime.log_line(ctx.routing_key, body))
+
+
+if __name__ == '__main__':
+    toadie_runtime.run(handle)
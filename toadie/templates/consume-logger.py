@@ -0,0 +1,34 @@
+"""Consumer of the stack's logs and metrics, as declared in promise.yml.
+
+Every component's `<component>.log.<LEVEL>` messages are appended to
+`$LOG_DIR/logger.log`, rotated and gzipped as it grows. A message is
+acknowledged once it is on disk.
+
+Components also send metric snapshots, histograms of handler time, queue
+wait and message sizes plus ack counts, as `<component>.metrics`. They are
+merged into per-component rate and latency series, written as one json
+line per component every METRICS_WINDOW seconds to `$LOG_DIR/metrics.log`.
+"""
+import json
+import toadie_runtime
+
+
+LOG_DIR = toadie_runtime.env('LOG_DIR', 'logs')
+logs = toadie_runtime.FileSink(LOG_DIR, 'logger')
+metrics = toadie_runtime.FileSink(LOG_DIR, 'metrics')
+series = toadie_runtime.MetricsSeries(window=toadie_runtime.env_int('METRICS_WINDOW', 60))
+
+
+async def handle(body, ctx):
+    if ctx.routing_key and ctx.routing_key.endswith('.metrics'):
+        points = series.add(body)
+        if points:
+            await metrics.write(b''.join(json.dumps(
+                point, separators=(',', ':'), sort_keys=True).encode('utf-8') + b'\n'
+                for point in points))
+        return
+    await logs.write(toadie_runtime.log_line(ctx.routing_key, body))
+
+
+if __name__ == '__main__':
+    toadie_runtime.run(handle)
@@ -0,0 +1,17 @@
+"""Consumer of this component's inqueues, as declared in promise.yml.
+
+`handle` is called for every message with its body (bytes) and a context.
+Publish results with `await ctx.publish(<outqueue name>, body)`. Plain
+functions work too and run in a thread, but only coroutines can publish.
+"""
+import toadie_runtime
+
+
+async def handle(body, ctx):
+    """Forward every message to each outqueue. Replace with real work."""
+    for outqueue in ctx.promise.get('outqueues') or []:
+        await ctx.publish(outqueue['name'], body)
+
+
+if __name__ == '__main__':
+    toadie_runtime.run(handle)
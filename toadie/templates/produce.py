@@ -0,0 +1,19 @@
+"""Publish to this component's outqueues from outside a consumer.
+
+Useful for batch jobs and entry points feeding the stack. The producer
+keeps one connection with pooled channels, and `flush` (called on exit)
+waits for every publisher confirm. Pass `envelope=True` to pack many small
+messages into each AMQP message.
+"""
+import asyncio
+import toadie_runtime
+
+
+async def main():
+    async with toadie_runtime.Producer.from_promise() as producer:
+        for outqueue in producer.promise.get('outqueues') or []:
+            await producer.send(outqueue['name'], outqueue['body']['message'])
+
+
+if __name__ == '__main__':
+    asyncio.run(main())